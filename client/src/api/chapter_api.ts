@@ -22,6 +22,21 @@ interface ChapterResponse {
   chapter: string
 }
 
+interface SegmentMediaInfo {
+  id: string
+  duration: number | null
+  width: number | null
+  height: number | null
+  error: string | null
+}
+
+interface ChapterMediaInfo {
+  segments: SegmentMediaInfo[]
+  segment_count: number
+  total_duration: number
+  invalid_count: number
+}
+
 export const chapterApi = {
   // 获取章节列表
   getChapterList(projectName: string) {
@@ -81,6 +96,14 @@ export const chapterApi = {
     })
   },
 
+  // 获取章节媒体统计（片段时长、图片尺寸、总时长）
+  getChapterMediaInfo(projectName: string, chapterName: string) {
+    return request.get<ChapterMediaInfo>('/chapter/media_info', {
+      project_name: projectName,
+      chapter_name: chapterName
+    })
+  },
+
   // 保存场景修改
   saveScenes(projectName: string, chapterName: string, scenes: any[]) {
     return request.post('/chapter/save_scenes', {
@@ -39,6 +39,20 @@ interface GenerationProgressResponse {
   errors: string[]
 }
 
+interface ComfyUIBackendStats {
+  url: string
+  healthy: boolean
+  connected: boolean
+  last_error: string | null
+  last_checked: number | null
+  pending: number
+  inflight: number
+  completed: number
+  failed: number
+  average_seconds: number | null
+  images_per_hour: number | null
+}
+
 export const mediaApi = {
   generateImages(params: GenerateImageParams) {
     return request.post('/media/generate_images', params)
@@ -56,6 +70,10 @@ export const mediaApi = {
     return request.post('/media/cancel', { task_id: taskId })
   },
 
+  getComfyUIBackends() {
+    return request.get<{ backends: ComfyUIBackendStats[] }>('/media/comfyui_backends')
+  },
+
   uploadReferenceImage(project_name: string, chapter_name: string, span_id: string, file: File) {
     const form = new FormData()
     form.append('project_name', project_name)
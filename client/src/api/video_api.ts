@@ -1,18 +1,36 @@
 import request from './request'
-import type { VideoSettings, VideoProgress } from '@/types/video'
+import config from '@/config'
+import type { VideoSettings, VideoProgress, VideoJobSubmitted, ChapterPreviews } from '@/types/video'
 
 class VideoApi {
   generateVideo(settings: VideoSettings) {
-    return request.post<null>('/video/generate_video', settings)
+    return request.post<VideoJobSubmitted>('/video/generate_video', settings)
   }
 
-  getGenerationProgress() {
-    return request.get<VideoProgress>('/video/generation_progress')
+  getGenerationProgress(jobId?: string) {
+    return request.get<VideoProgress>('/video/generation_progress', jobId ? { job_id: jobId } : null)
   }
 
-  cancelGeneration() {
-    return request.post<null>('/video/cancel_generation')
+  cancelGeneration(jobId?: string) {
+    return request.post<{ cancelled: boolean }>('/video/cancel_generation', null, jobId ? { params: { job_id: jobId } } : {})
+  }
+
+  getJobs() {
+    return request.get<{ jobs: VideoProgress[], slots: number }>('/video/jobs')
+  }
+
+  generatePreviews(settings: VideoSettings) {
+    return request.post<ChapterPreviews>('/video/generate_previews', settings)
+  }
+
+  getPreviews(projectName: string, chapterName: string) {
+    return request.get<ChapterPreviews>('/video/previews', { project_name: projectName, chapter_name: chapterName })
+  }
+
+  // 预览文件名带内容键，内容变化后地址随之变化，无需额外的时间戳
+  getPreviewFileUrl(projectName: string, chapterName: string, name: string) {
+    return `${config.baseApi}/video/preview_file?project_name=${encodeURIComponent(projectName)}&chapter_name=${encodeURIComponent(chapterName)}&name=${encodeURIComponent(name)}`
   }
 }
 
-export const videoApi = new VideoApi()
\ No newline at end of file
+export const videoApi = new VideoApi()
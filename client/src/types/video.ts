@@ -6,11 +6,106 @@ export interface VideoSettings {
   use_pan?: boolean
   pan_range?: [number, number]
   resolution?: [number, number]
+  smooth_motion?: boolean
+  frame_format?: 'rgb24' | 'yuv420p'
+  render_mode?: 'stream' | 'memory' | 'ffmpeg'
+  static_fast_path?: boolean
+  executor?: 'thread' | 'process'
+  workers?: number
+  frame_chunk_size?: number
+  frame_ram_budget_mb?: number | null
+  use_cache?: boolean
+  single_pass?: boolean
+  transition_duration?: number
+  encoder_profile?: string
+  target_bitrate_kbps?: number
+  draft?: boolean
+  draft_scale?: number
+  draft_fps_scale?: number
+  audio_normalize?: boolean
+  audio_target_dbfs?: number
+  segment_gap?: number
+  background_music?: string | null
+  music_volume_db?: number
+  music_duck_db?: number
+  music_duck_attack?: number
+  music_duck_release?: number
+  music_fade?: number
+  previews?: boolean
+  subtitles?: 'none' | 'soft' | 'burn'
+  subtitle_word_timing?: boolean
+  subtitle_max_chars?: number
+  subtitle_font?: string
+}
+
+export type VideoJobStatus = 'queued' | 'running' | 'completed' | 'failed' | 'cancelled'
+
+export interface VideoJobSubmitted {
+  job_id: string
+  queue_position: number
+  status: string
+  // 同一章节已有设置相同的未结束任务，返回的是该任务
+  deduplicated: boolean
+}
+
+export interface StageMetric {
+  wall: number
+  cpu: number
+  peak_rss_mb: number | null
+  count: number
+}
+
+export interface SegmentMetric {
+  cached: boolean
+  wall: number
+  cpu: number
+  stages: Record<string, StageMetric>
 }
 
 export interface VideoProgress {
+  job_id?: string
+  status?: VideoJobStatus
+  queue_position?: number
+  error?: string | null
+  output_path?: string | null
   progress: number
   total: number
   percentage: number
   current_task: string | null
-}
\ No newline at end of file
+  rendered_frames?: number
+  frame_timing?: {
+    frames: number
+    render_ms: number
+    write_ms: number
+    dispatch_ms: number
+  }
+  metrics?: {
+    stages: Record<string, StageMetric>
+    cached_segments: number
+    segments?: Record<string, SegmentMetric>
+  }
+}
+export interface SegmentPreview {
+  id: string
+  key: string
+  start: number
+  duration: number
+  preview: string
+  poster: string
+  cached: boolean
+}
+
+export interface ChapterPreviews {
+  width: number
+  height: number
+  fps: number
+  total_duration: number
+  segments: SegmentPreview[]
+  contact_sheet: {
+    file: string
+    columns: number
+    rows: number
+    tile_width: number
+    tile_height: number
+  }
+}
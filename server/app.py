@@ -1,6 +1,7 @@
 import signal
 import sys
 import os
+from contextlib import asynccontextmanager
 
 from fastapi.responses import JSONResponse
 
@@ -12,13 +13,22 @@ from fastapi.middleware.cors import CORSMiddleware
 from server.config.config import load_config
 from server.controllers.project_controller import router as project_router
 from server.controllers.chapter_controller import router as chapter_router
-from server.controllers.media_controller import router as media_router
+from server.controllers.media_controller import router as media_router, close_image_service
 from server.controllers.admin_controller import router as admin_router
 from server.controllers.entity_controller import router as entity_router
-from server.controllers.video_controller import router as video_router
+from server.controllers.video_controller import router as video_router, resume_interrupted_jobs
 from server.utils.response import make_response
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动：恢复上次退出时未结束的视频渲染任务
+    await resume_interrupted_jobs()
+    yield
+    # 退出：关闭 ComfyUI 的 WebSocket 长连接与 HTTP 连接池
+    await close_image_service()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
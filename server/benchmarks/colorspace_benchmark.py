@@ -0,0 +1,130 @@
+"""
+帧格式（颜色空间转换路径）基准
+
+同一组帧分别以 rgb24（由 ffmpeg swscale 转换为 yuv420p）和 yuv420p（NumPy 转换后写入）
+送入 FFmpegFrameWriter，输出 JSON：
+墙钟帧率、本进程写入 CPU（含 NumPy 转换）、ffmpeg 进程 CPU、每帧管道字节数
+
+--sink null 时 ffmpeg 只解码 rawvideo 并做颜色空间转换后丢弃，单独衡量传输与转换开销；
+--sink x264 时使用 libx264 ultrafast 编码到临时文件，衡量实际渲染场景下的差异
+
+用法:
+    python -m server.benchmarks.colorspace_benchmark [--resolution 1600x900] [--frames 120] [--sink null,x264]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from server.utils.colorspace import rgb_to_yuv420p
+from server.utils.ffmpeg_writer import FFmpegFrameWriter
+
+FRAME_FORMATS = ('rgb24', 'yuv420p')
+SINKS = {
+    'null': {'video_params': ['-c:v', 'rawvideo'], 'output_params': ['-f', 'null']},
+    'x264': {'video_params': ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '23'], 'output_params': []},
+}
+
+
+def synthesize_frames(width: int, height: int, count: int, seed: int = 0) -> list:
+    """渐变 + 噪声的帧，逐帧平移模拟镜头运动"""
+    rng = np.random.default_rng(seed)
+    base = np.empty((height, width * 2, 3), dtype=np.uint8)
+    gradient_x = np.linspace(0, 255, width * 2, dtype=np.float32)[np.newaxis, :]
+    gradient_y = np.linspace(0, 255, height, dtype=np.float32)[:, np.newaxis]
+    base[..., 0] = gradient_x
+    base[..., 1] = gradient_y
+    base[..., 2] = (gradient_x + gradient_y) % 256
+    base = np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8)
+    step = max(1, width // max(1, count))
+    return [np.ascontiguousarray(base[:, i * step % width:i * step % width + width]) for i in range(count)]
+
+
+def run_sink(frames: list, size, fps: float, frame_format: str, sink: str, threads: int) -> dict:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = '-' if sink == 'null' else os.path.join(temp_dir, 'out.mp4')
+        writer = FFmpegFrameWriter(
+            output_path, size=size, fps=fps, threads=threads, pix_fmt=frame_format,
+            video_params=SINKS[sink]['video_params'], output_params=SINKS[sink]['output_params'],
+        )
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        with writer:
+            for frame in frames:
+                writer.write(frame)
+        seconds = time.perf_counter() - start
+        write_cpu = time.thread_time() - cpu_start
+        output_bytes = os.path.getsize(output_path) if sink != 'null' else None
+
+    bytes_per_frame = frames[0].nbytes if frame_format == 'rgb24' else frames[0].nbytes // 2
+    ffmpeg_cpu = writer.usage['cpu'] if writer.usage else None
+    return {
+        'seconds': round(seconds, 3),
+        'frames_per_second': round(len(frames) / seconds, 2),
+        'python_cpu_ms_per_frame': round(write_cpu * 1000 / len(frames), 3),
+        'ffmpeg_cpu_ms_per_frame': round(ffmpeg_cpu * 1000 / len(frames), 3) if ffmpeg_cpu is not None else None,
+        'pipe_bytes_per_frame': bytes_per_frame,
+        'output_bytes': output_bytes,
+    }
+
+
+def conversion_cost(frames: list, batch: int) -> dict:
+    """单独测量 NumPy 转换耗时：逐帧与按批转换"""
+    start = time.perf_counter()
+    for frame in frames:
+        rgb_to_yuv420p(frame)
+    per_frame = (time.perf_counter() - start) * 1000 / len(frames)
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        rgb_to_yuv420p(np.stack(frames[i:i + batch]))
+    batched = (time.perf_counter() - start) * 1000 / len(frames)
+    return {'ms_per_frame': round(per_frame, 3), f'batch_{batch}_ms_per_frame': round(batched, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolution', default='1600x900')
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--fps', type=float, default=20)
+    parser.add_argument('--threads', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--sink', default=','.join(SINKS), help=f"逗号分隔，可选: {', '.join(SINKS)}")
+    parser.add_argument('--batch', type=int, default=8, help='批量转换测量的每批帧数')
+    parser.add_argument('--output', help='结果另存为 JSON 文件')
+    args = parser.parse_args()
+
+    sinks = [sink.strip() for sink in args.sink.split(',') if sink.strip()]
+    unknown = [sink for sink in sinks if sink not in SINKS]
+    if unknown:
+        parser.error(f"未知输出: {', '.join(unknown)}")
+
+    width, height = (int(v) for v in args.resolution.lower().split('x'))
+    frames = synthesize_frames(width, height, args.frames)
+    report = {
+        'config': {'resolution': [width, height], 'frames': args.frames, 'fps': args.fps, 'threads': args.threads},
+        'environment': {'platform': platform.platform(), 'python': platform.python_version(),
+                        'numpy': np.__version__, 'cpu_count': os.cpu_count()},
+        'conversion': conversion_cost(frames, args.batch),
+        'sinks': {},
+    }
+    for sink in sinks:
+        report['sinks'][sink] = {}
+        for frame_format in FRAME_FORMATS:
+            result = run_sink(frames, (width, height), args.fps, frame_format, sink, args.threads)
+            report['sinks'][sink][frame_format] = result
+            print(f"{sink}/{frame_format}: {json.dumps(result)}", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+视频渲染吞吐基准
+
+合成一个假章节（N 个数字片段目录，每个包含生成的 image.png 和正弦波 audio.mp3），
+依次在各渲染模式下执行 generate_video，输出 JSON：
+帧/秒、片段/秒、峰值内存（RSS，含 ffmpeg 等子进程）、输出文件大小
+
+每个模式在独立的子进程中运行，峰值内存互不影响；默认只使用 CPU 编码，适合在夜间任务中跟踪性能回归
+
+用法:
+    python -m server.benchmarks.render_benchmark [--segments 12] [--duration 3] [--resolution 1280x720]
+        [--fps 20] [--modes stream_threads,static_fast_path] [--repeat 1] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from server.services.video_service import VideoService
+from server.utils.media_index import ChapterMediaIndex
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 各模式相对基础设置的差异
+MODES = {
+    'memory_threads': {'render_mode': 'memory', 'executor': 'thread'},
+    'stream_threads': {'render_mode': 'stream', 'executor': 'thread', 'static_fast_path': False},
+    'stream_yuv420p': {'render_mode': 'stream', 'executor': 'thread', 'static_fast_path': False,
+                       'frame_format': 'yuv420p'},
+    'stream_processes': {'render_mode': 'stream', 'executor': 'process', 'static_fast_path': False},
+    'static_fast_path': {'render_mode': 'stream', 'use_pan': False, 'static_fast_path': True},
+    'ffmpeg_filters': {'render_mode': 'ffmpeg'},
+    'single_pass': {'single_pass': True},
+}
+
+
+def synthesize_chapter(chapter_path: str, segments: int, duration: float,
+                       image_size=(1920, 1080), seed: int = 0) -> None:
+    """生成假章节：渐变 + 噪声的图片（避免被编码器过度压缩）和不同频率的正弦波音频"""
+    rng = np.random.default_rng(seed)
+    width, height = image_size
+    gradient_x = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :]
+    gradient_y = np.linspace(0, 255, height, dtype=np.float32)[:, np.newaxis]
+    for i in range(1, segments + 1):
+        segment_path = os.path.join(chapter_path, str(i))
+        os.makedirs(segment_path, exist_ok=True)
+
+        noise = rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+        image = np.empty((height, width, 3), dtype=np.float32)
+        image[..., 0] = gradient_x
+        image[..., 1] = gradient_y
+        image[..., 2] = (gradient_x + gradient_y + i * 40) % 256
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+        Image.fromarray(image).save(os.path.join(segment_path, "image.png"))
+
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f"sine=frequency={220 + 40 * i}:duration={duration}",
+            '-ar', '24000', '-ac', '1', '-c:a', 'libmp3lame', '-b:a', '48k',
+            os.path.join(segment_path, "audio.mp3"),
+        ]
+        subprocess.run(cmd, check=True, capture_output=True)
+
+
+def peak_rss_mb() -> dict:
+    """当前进程与已回收子进程的峰值 RSS（MB），不支持的平台返回 None"""
+    if resource is None:
+        return {'self': None, 'children': None}
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+
+def total_frames(chapter_path: str, fps: float) -> int:
+    index = ChapterMediaIndex(chapter_path)
+    durations = index.segment_durations(sorted(d for d in os.listdir(chapter_path) if d.isdigit()))
+    return sum(int(d * fps) for d in durations.values())
+
+
+def _run_mode(chapter_path: str, settings: dict, result_queue) -> None:
+    """子进程入口：执行一次渲染并回传结果"""
+    try:
+        service = VideoService()
+        start = time.perf_counter()
+        output_path = asyncio.run(service.generate_video(chapter_path, settings))
+        seconds = time.perf_counter() - start
+        result_queue.put({
+            'seconds': seconds,
+            'bytes': os.path.getsize(output_path),
+            'peak_rss_mb': peak_rss_mb(),
+            'frame_timing': service.get_frame_timing(),
+        })
+    except Exception as e:
+        result_queue.put({'error': str(e)})
+
+
+def run_mode(chapter_path: str, settings: dict, repeat: int, frames: int, segments: int) -> dict:
+    """在独立子进程中重复执行某个模式，报告耗时中位数对应的吞吐"""
+    ctx = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=_run_mode, args=(chapter_path, settings, result_queue))
+        process.start()
+        result = result_queue.get()
+        process.join()
+        if 'error' in result:
+            return result
+        runs.append(result)
+
+    seconds = statistics.median(run['seconds'] for run in runs)
+    return {
+        'seconds': round(seconds, 3),
+        'frames_per_second': round(frames / seconds, 2),
+        'segments_per_second': round(segments / seconds, 3),
+        'peak_rss_mb': {
+            key: max((run['peak_rss_mb'][key] or 0) for run in runs) or None
+            for key in ('self', 'children')
+        },
+        'output_bytes': runs[-1]['bytes'],
+        'frame_timing_ms': runs[-1]['frame_timing'],
+        'runs': [round(run['seconds'], 3) for run in runs],
+    }
+
+
+def ffmpeg_version() -> str:
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+        return result.stdout.splitlines()[0] if result.stdout else ''
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=12)
+    parser.add_argument('--duration', type=float, default=3.0, help='每个片段的音频时长（秒）')
+    parser.add_argument('--resolution', default='1280x720')
+    parser.add_argument('--image-size', default='1920x1080', help='合成图片的尺寸')
+    parser.add_argument('--fps', type=float, default=20)
+    parser.add_argument('--encoder-profile', default='balanced')
+    parser.add_argument('--modes', default=','.join(MODES), help=f"逗号分隔，可选: {', '.join(MODES)}")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='结果另存为 JSON 文件')
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"未知模式: {', '.join(unknown)}")
+
+    width, height = (int(v) for v in args.resolution.lower().split('x'))
+    image_size = tuple(int(v) for v in args.image_size.lower().split('x'))
+    base_settings = {
+        'resolution': (width, height),
+        'fps': args.fps,
+        'use_cache': False,
+        'previews': False,
+        'use_cuda': False,
+        'encoder_profile': args.encoder_profile,
+    }
+
+    report = {
+        'config': {
+            'segments': args.segments,
+            'segment_duration': args.duration,
+            'resolution': [width, height],
+            'image_size': list(image_size),
+            'fps': args.fps,
+            'encoder_profile': args.encoder_profile,
+            'repeat': args.repeat,
+        },
+        'environment': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': ffmpeg_version(),
+        },
+        'modes': {},
+    }
+
+    with tempfile.TemporaryDirectory() as chapter_path:
+        synthesize_chapter(chapter_path, args.segments, args.duration, image_size)
+        frames = total_frames(chapter_path, args.fps)
+        report['config']['total_frames'] = frames
+        for mode in modes:
+            result = run_mode(chapter_path, {**base_settings, **MODES[mode]}, args.repeat, frames, args.segments)
+            report['modes'][mode] = result
+            print(f"{mode}: {json.dumps(result, ensure_ascii=False)}", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
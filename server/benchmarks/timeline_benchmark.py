@@ -0,0 +1,68 @@
+"""
+分段编码 + concat 与整章单次编码的对比基准
+
+用法:
+    python -m server.benchmarks.timeline_benchmark <chapter_path> [--resolution 1600x900] [--fps 20]
+
+章节会先复制到临时目录（只复制数字片段的 image.png / audio.mp3），不会覆盖原有的 video.mp4
+输出 JSON：每种模式的耗时（秒）与输出文件大小（字节）
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from server.services.video_service import VideoService
+
+
+def copy_chapter(chapter_path: str, target: str) -> None:
+    for name in os.listdir(chapter_path):
+        source = os.path.join(chapter_path, name)
+        if not (name.isdigit() and os.path.isdir(source)):
+            continue
+        os.makedirs(os.path.join(target, name))
+        for file_name in ('image.png', 'audio.mp3'):
+            if os.path.exists(os.path.join(source, file_name)):
+                shutil.copy2(os.path.join(source, file_name), os.path.join(target, name, file_name))
+
+
+async def run_mode(service: VideoService, chapter_path: str, settings: dict) -> dict:
+    start = time.perf_counter()
+    output_path = await service.generate_video(chapter_path, settings)
+    return {
+        'seconds': round(time.perf_counter() - start, 3),
+        'bytes': os.path.getsize(output_path),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('chapter_path')
+    parser.add_argument('--resolution', default='1600x900')
+    parser.add_argument('--fps', type=float, default=20)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.lower().split('x'))
+    base_settings = {'resolution': (width, height), 'fps': args.fps, 'use_cache': False}
+    modes = {
+        'segments_concat': {},
+        'single_pass': {'single_pass': True},
+    }
+
+    service = VideoService()
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        copy_chapter(os.path.abspath(args.chapter_path), work_dir)
+        for name, settings in modes.items():
+            results[name] = await run_mode(service, work_dir, {**base_settings, **settings})
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -8,6 +8,7 @@ from server.utils.response import make_response
 
 from server.services.llm_service import LLMService
 from server.services.chapter_file_service import ChapterFileService
+from server.utils.media_index import ChapterMediaIndex
 import logging
 from fastapi.responses import StreamingResponse
 
@@ -250,6 +251,7 @@ async def get_chapter_scene_list(project_name: str, chapter_name: str):
             return make_response(status='error', msg=f'Chapter directory not found: {chapter_dir}')
         
         scene_list = []
+        media_index = ChapterMediaIndex(chapter_dir)
         # 遍历所有数字命名的子文件夹
         for item in sorted(os.listdir(chapter_dir), key=lambda x: int(x) if x.isdigit() else float('inf')):
             if not item.isdigit():
@@ -271,20 +273,47 @@ async def get_chapter_scene_list(project_name: str, chapter_name: str):
                 
             with open(prompt_file, 'r', encoding='utf-8') as f:
                 prompt_data = json.load(f)
+
+            # 音频时长取自媒体索引，尚未生成音频时为空
+            try:
+                duration = media_index.audio_info(item)['duration']
+            except Exception:
+                duration = None
                 
             scene_list.append({
                 'id': str(item),
                 'content': content,
                 'base_scene': prompt_data.get('base_scene', ''),
                 'scene': prompt_data.get('scene', ''),
-                'prompt': prompt_data.get('prompt', '')
+                'prompt': prompt_data.get('prompt', ''),
+                'duration': duration
             })
+        media_index.save()
             
         return make_response(status='success', data=scene_list)
         
     except Exception as e:
         return make_response(status='error', msg=f'获取场景列表失败：{str(e)}')
 
+@router.get('/media_info')
+async def get_chapter_media_info(project_name: str, chapter_name: str):
+    """获取章节媒体统计：每个片段的音频时长、图片尺寸及章节总时长"""
+    if not project_name or not chapter_name:
+        return make_response(status='error', msg='Missing project_name or chapter_name')
+
+    try:
+        config = load_config()
+        projects_path = config.get('projects_path', 'projects/')
+        chapter_dir = os.path.join(projects_path, project_name, chapter_name)
+        if not os.path.exists(chapter_dir):
+            return make_response(status='error', msg=f'Chapter directory not found: {chapter_dir}')
+
+        summary = await asyncio.to_thread(ChapterMediaIndex(chapter_dir).summary)
+        return make_response(status='success', data=summary)
+
+    except Exception as e:
+        return make_response(status='error', msg=f'获取章节媒体信息失败：{str(e)}')
+
 @router.post('/translate_prompt')
 async def translate_prompt(request: Request):
     """
@@ -15,6 +15,10 @@ image_service = ImageService()
 audio_service = AudioService()
 logger = logging.getLogger(__name__)
 
+async def close_image_service():
+    """应用退出时关闭 ComfyUI 连接（WebSocket 长连接与 HTTP 连接池），由 app 的 lifespan 调用"""
+    await image_service.aclose()
+
 @router.post('/generate_images')
 async def generate_images(request: Request):
     """生成图片的接口。"""
@@ -112,7 +116,7 @@ async def generate_images(request: Request):
         
         try:
             # 调用图像服务生成图片
-            result = image_service.generate_images(
+            result = await image_service.generate_images(
                 prompts=processed_prompts,
                 output_dirs=output_dirs,
                 workflow=workflow,
@@ -221,7 +225,7 @@ async def cancel_generation(request: Request):
         if task_id.startswith('audio_'):
             success = audio_service.cancel_generation(task_id)
         else:
-            success = image_service.cancel_generation(task_id)
+            success = await image_service.cancel_generation(task_id)
             
         if success:
             return make_response(msg='任务已取消')
@@ -232,6 +236,17 @@ async def cancel_generation(request: Request):
         return make_response(status='error', msg=str(e))
 
 
+@router.get('/comfyui_backends')
+async def get_comfyui_backends():
+    """获取各 ComfyUI 后端的健康状态、队列长度与吞吐统计。"""
+    try:
+        return make_response(
+            data={'backends': image_service.get_backend_stats()},
+            msg='获取后端状态成功'
+        )
+    except Exception as e:
+        return make_response(status='error', msg=f'获取后端状态时发生错误：{str(e)}')
+
 @router.get('/workflows')
 async def list_workflows():
     """列出所有可用的工作流。"""
@@ -1,13 +1,17 @@
 import asyncio
 from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import FileResponse
-from typing import Optional, Tuple, Dict
+from fastapi.responses import FileResponse, PlainTextResponse
+from typing import Optional, Tuple, Dict, List, Literal
 import os
 from pathlib import Path
 from pydantic import BaseModel
 from concurrent.futures import ThreadPoolExecutor
 from server.config.config import load_config
 from server.services.video_service import VideoService
+from server.services.video_job_service import VideoJobQueue, JobConflictError
+from server.services.preview_service import PreviewGenerator
+from server.utils import encoder_profiles
+from server.utils.metrics import registry as metrics_registry
 from server.utils.response import make_response, APIException
 import logging
 from PIL import Image
@@ -17,6 +21,8 @@ logger = logging.getLogger(__name__)
 
 # 创建视频服务的全局单例实例
 video_service = VideoService()
+# 渲染任务队列，并发槽位数由 config.yaml 的 video.render_slots 配置
+video_jobs = VideoJobQueue(video_service)
 
 class VideoSettings(BaseModel):
     project_name:Optional[str] = None
@@ -27,9 +33,54 @@ class VideoSettings(BaseModel):
     use_pan: Optional[bool] = True#是否使用镜头平移效果
     pan_range: Optional[Tuple[float, float]] = (0.5, 0.5)# 横向移动原图可用范围的50%，纵向50%
     resolution: Optional[Tuple[int, int]] = (1600, 900)
+    smooth_motion: Optional[bool] = False# 亚像素平移
+    frame_format: Optional[Literal['rgb24', 'yuv420p']] = 'rgb24'# 流式模式写入ffmpeg的帧格式，yuv420p 在 NumPy 中完成颜色空间转换
+    render_mode: Optional[Literal['stream', 'memory', 'ffmpeg']] = 'stream'# stream: 帧直接管道写入ffmpeg，内存占用与片段时长无关; ffmpeg: 特效全部由ffmpeg滤镜实现
+    static_fast_path: Optional[bool] = True# 无平移的片段直接由ffmpeg生成
+    executor: Optional[Literal['thread', 'process']] = 'thread'# process: 每个片段在独立进程中渲染编码
+    workers: Optional[int] = None# 进程池工作进程数，默认CPU核数
+    frame_chunk_size: Optional[int] = 0# 内存模式下每次调度渲染的帧数，0表示整段
+    frame_ram_budget_mb: Optional[float] = 1024# 内存模式下单个片段的帧内存预算（MB），超出时使用内存映射文件
+    use_cache: Optional[bool] = True# 复用内容未变化的片段渲染结果
+    single_pass: Optional[bool] = False# 整章单次编码，片段间交叉淡化
+    encoder_profile: Optional[str] = 'auto'# 编码配置档：auto / fastest / fast_preview / balanced / final / archive_x265 / archive_av1 / nvenc
+    target_bitrate_kbps: Optional[float] = None# encoder_profile 为 fastest 时的目标码率上限
+    draft: Optional[bool] = False# 草稿模式：低分辨率、低帧率、最快编码，输出 video_draft.mp4
+    draft_scale: Optional[float] = 0.5# 草稿分辨率比例
+    draft_fps_scale: Optional[float] = 0.5# 草稿帧率比例
+    transition_duration: Optional[float] = 0.5# 转场时长（秒）
+    audio_normalize: Optional[bool] = True# 按片段做响度归一化
+    audio_target_dbfs: Optional[float] = -20.0# 归一化目标响度（dBFS）
+    segment_gap: Optional[float] = 0.0# 每个片段后追加的静音时长（秒）
+    background_music: Optional[str] = None# 背景音乐文件，相对路径相对于章节目录
+    music_volume_db: Optional[float] = -18.0# 背景音乐相对旁白的电平（dB）
+    music_duck_db: Optional[float] = -12.0# 旁白出现时背景音乐的压低量（dB）
+    music_duck_attack: Optional[float] = 0.2# 闪避压低过渡时长（秒）
+    music_duck_release: Optional[float] = 0.6# 人声结束后保持压低的时长（秒）
+    music_fade: Optional[float] = 2.0# 背景音乐首尾淡入淡出（秒）
+    previews: Optional[bool] = True# 渲染时并行生成片段预览与联系表
+    subtitles: Optional[Literal['none', 'soft', 'burn']] = 'soft'# 字幕：soft 为软字幕流（不重新编码），burn 烧录到画面
+    subtitle_word_timing: Optional[bool] = True# 有 TTS 逐词时间时按词对齐字幕
+    subtitle_max_chars: Optional[int] = 18# 单条字幕最大字数
+    subtitle_font: Optional[str] = 'Microsoft YaHei'# 烧录字幕的字体
+
+async def resume_interrupted_jobs():
+    """服务启动时恢复上次退出时未结束的渲染任务（config.yaml 的 video.auto_resume 控制，由 app 的 lifespan 调用）"""
+    config = load_config()
+    video_config = config.get('video') or {}
+    if not video_config.get('auto_resume', True):
+        return
+    try:
+        video_jobs.set_slots(video_config.get('render_slots', 1))
+        jobs = await video_jobs.resume_interrupted(config.get('projects_path', 'projects/'))
+        if jobs:
+            logger.info("已恢复 %d 个中断的视频任务", len(jobs))
+    except Exception as e:
+        logger.error("恢复中断的视频任务失败: %s", e)
 
 @router.post("/generate_video")
 async def generate_video(settings: Optional[VideoSettings] = None):
+    """提交视频生成任务，立即返回任务ID，通过 generation_progress 查询进度"""
     try:
         config = load_config()
         base_path = config.get('projects_path', 'projects/')
@@ -38,15 +89,29 @@ async def generate_video(settings: Optional[VideoSettings] = None):
         if not os.path.exists(chapter_path):
             return make_response(status='error', msg='chapter不存在')
 
-
-        output_path = await video_service.generate_video(
+        video_jobs.set_slots((config.get('video') or {}).get('render_slots', 1))
+        job, deduplicated = await video_jobs.submit(
             str(chapter_path),
-            video_settings=settings.model_dump(exclude_unset=True) if settings else None
+            settings.model_dump(exclude_unset=True),
+            project_name=settings.project_name,
+            chapter_name=settings.chapter_name
         )
 
         return make_response(
-            data={"video_path": output_path},
-            msg="Video generated successfully"
+            data={
+                "job_id": job.job_id,
+                "queue_position": video_jobs.queue_position(job),
+                "status": job.status,
+                "deduplicated": deduplicated,
+            },
+            msg="Video generation already in progress with the same settings" if deduplicated
+            else "Video generation queued"
+        )
+    except JobConflictError as e:
+        return make_response(
+            status='error',
+            data={"job_id": e.job.job_id, "status": e.job.status, "deduplicated": True},
+            msg=str(e)
         )
     except APIException as e:
         return make_response(status='error', msg=e.detail)
@@ -54,11 +119,12 @@ async def generate_video(settings: Optional[VideoSettings] = None):
         return make_response(status='error', msg=str(e))
 
 @router.get("/get_video")
-async def get_video(project_name: str, chapter_name: str):
-    """获取视频文件接口"""
+async def get_video(project_name: str, chapter_name: str, draft: bool = False):
+    """获取视频文件接口，draft 为 True 时返回草稿视频"""
     try:
         config = load_config()
-        video_path = Path(config['projects_path']) / project_name / chapter_name / "video.mp4"
+        filename = VideoService.output_filename({'draft': draft})
+        video_path = Path(config['projects_path']) / project_name / chapter_name / filename
         
         if not video_path.exists():
             return make_response(status='error', msg='视频不存在')
@@ -66,18 +132,67 @@ async def get_video(project_name: str, chapter_name: str):
         return FileResponse(
             video_path,
             media_type="video/mp4",
-            filename=f"{chapter_name}_video.mp4"
+            filename=f"{chapter_name}_{filename}"
         )
     except APIException as e:
         return make_response(status='error', msg=e.detail)
     except Exception as e:
         return make_response(status='error', msg=str(e))
 
+@router.post("/generate_previews")
+async def generate_previews(settings: Optional[VideoSettings] = None):
+    """单独生成章节预览（每个片段的动画 WebP 与整章联系表），不渲染成片"""
+    try:
+        config = load_config()
+        chapter_path = os.path.join(config.get('projects_path', 'projects/'), settings.project_name, settings.chapter_name)
+        if not os.path.exists(chapter_path):
+            return make_response(status='error', msg='chapter不存在')
+        index = await video_service.generate_previews(chapter_path, settings.model_dump(exclude_unset=True))
+        return make_response(data=index, msg="Previews generated")
+    except APIException as e:
+        return make_response(status='error', msg=e.detail)
+    except Exception as e:
+        return make_response(status='error', msg=str(e))
+
+@router.get("/previews")
+async def get_previews(project_name: str, chapter_name: str):
+    """获取章节预览索引：片段起始时间、时长、预览与海报文件名以及联系表布局"""
+    try:
+        config = load_config()
+        chapter_path = os.path.join(config['projects_path'], project_name, chapter_name)
+        index = PreviewGenerator(chapter_path).load_index()
+        if index is None:
+            return make_response(status='error', msg='预览不存在')
+        return make_response(data=index, msg="Previews retrieved successfully")
+    except Exception as e:
+        return make_response(status='error', msg=str(e))
+
+@router.get("/preview_file")
+async def get_preview_file(project_name: str, chapter_name: str, name: str):
+    """获取预览文件（片段 WebP、海报帧或联系表），name 取自预览索引"""
+    try:
+        config = load_config()
+        chapter_path = os.path.join(config['projects_path'], project_name, chapter_name)
+        path = PreviewGenerator(chapter_path).file_path(name)
+        if path is None:
+            return make_response(status='error', msg='预览文件不存在')
+        media_type = "image/webp" if name.endswith('.webp') else "image/jpeg"
+        return FileResponse(path, media_type=media_type)
+    except Exception as e:
+        return make_response(status='error', msg=str(e))
+
 @router.get("/generation_progress")
-async def get_generation_progress() -> Dict:
-    """获取视频生成进度接口"""
+async def get_generation_progress(job_id: Optional[str] = None, include_segments: bool = False) -> Dict:
+    """
+    获取视频生成进度接口，不传 job_id 时返回最近提交的任务
+    metrics 中包含各阶段的耗时、CPU 与峰值内存，include_segments 为 True 时附带每个片段的指标
+    """
     try:
-        progress_data = video_service.get_progress()
+        progress_data = video_jobs.get_progress(job_id, include_segments)
+        if progress_data is None:
+            if job_id:
+                return make_response(status='error', msg='任务不存在')
+            progress_data = video_service.get_progress()
         return make_response(
             data=progress_data,
             msg="Progress retrieved successfully"
@@ -86,13 +201,77 @@ async def get_generation_progress() -> Dict:
         return make_response(status='error', msg=str(e))
 
 @router.post("/cancel_generation")
-async def cancel_generation():
-    """取消视频生成接口"""
+async def cancel_generation(job_id: Optional[str] = None):
+    """取消视频生成接口，不传 job_id 时取消最近提交的任务"""
     try:
-        result = video_service.cancel_generation()
+        result = video_jobs.cancel(job_id)
         return make_response(
             data={"cancelled": result},
             msg="Video generation cancelled"
         )
     except Exception as e:
         return make_response(status='error', msg=str(e))
+
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的渲染指标（已结束任务的阶段累计值与当前任务数）"""
+    return PlainTextResponse(
+        metrics_registry.render_prometheus(video_jobs.active_counts()),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@router.get("/jobs")
+async def list_jobs():
+    """获取所有视频任务（排队、执行中及最近结束的）"""
+    try:
+        return make_response(
+            data={"jobs": video_jobs.list_jobs(), "slots": video_jobs.slots},
+            msg="Jobs retrieved successfully"
+        )
+    except Exception as e:
+        return make_response(status='error', msg=str(e))
+
+
+class EncoderBenchmarkRequest(BaseModel):
+    """编码配置档测速参数"""
+    profiles: Optional[List[str]] = None# 为空时测试所有可用配置档
+    resolution: Optional[Tuple[int, int]] = (1600, 900)
+    fps: Optional[float] = 20
+    seconds: Optional[float] = 3.0
+
+@router.get("/encoder_profiles")
+async def get_encoder_profiles():
+    """获取编码配置档列表（含可用性与实测吞吐）"""
+    try:
+        return make_response(
+            data={"profiles": encoder_profiles.list_profiles()},
+            msg="Encoder profiles retrieved successfully"
+        )
+    except Exception as e:
+        return make_response(status='error', msg=str(e))
+
+@router.post("/benchmark_encoders")
+async def benchmark_encoders(request: Optional[EncoderBenchmarkRequest] = None):
+    """测量编码配置档的编码帧率与码率"""
+    try:
+        request = request or EncoderBenchmarkRequest()
+        loop = asyncio.get_running_loop()
+        if request.profiles:
+            results = {}
+            for name in request.profiles:
+                if name not in encoder_profiles.ENCODER_PROFILES:
+                    return make_response(status='error', msg=f'未知的编码配置: {name}')
+                results[name] = await loop.run_in_executor(
+                    None, encoder_profiles.benchmark_profile, name,
+                    tuple(request.resolution), request.fps, request.seconds
+                )
+        else:
+            results = await loop.run_in_executor(
+                None, encoder_profiles.benchmark_all, tuple(request.resolution), request.fps, request.seconds
+            )
+        return make_response(
+            data={"results": results, "fastest": encoder_profiles.pick_fastest_profile()},
+            msg="Encoder benchmark completed"
+        )
+    except Exception as e:
+        return make_response(status='error', msg=str(e))
@@ -1,11 +1,13 @@
 import os
 import asyncio
+import json
 from typing import Dict, List
 from datetime import datetime
 import signal
 import edge_tts
 import traceback
 from .base_service import SingletonService
+from server.utils.subtitles import WORD_TIMINGS_FILE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -71,13 +73,21 @@ class AudioService(SingletonService):
                 return False
                 
             output_path = os.path.join(output_dir, 'audio.mp3')
+            # 逐词时间，导出视频时用于字幕对齐
+            timings_path = os.path.join(output_dir, WORD_TIMINGS_FILE)
             
             try:
                 os.makedirs(output_dir, exist_ok=True)
-                if os.path.exists(output_path):
-                    os.remove(output_path)
+                for path in (output_path, timings_path):
+                    if os.path.exists(path):
+                        os.remove(path)
                 
-                communicate = edge_tts.Communicate(text, voice, rate=rate)
+                try:
+                    communicate = edge_tts.Communicate(text, voice, rate=rate, boundary='WordBoundary')
+                except TypeError:
+                    # edge-tts 7 之前的版本默认即输出 WordBoundary 事件
+                    communicate = edge_tts.Communicate(text, voice, rate=rate)
+                words = []
                 async for chunk in communicate.stream():
                     if task['cancelled']:
                         if os.path.exists(output_path):
@@ -87,6 +97,15 @@ class AudioService(SingletonService):
                     if chunk["type"] == "audio":
                         with open(output_path, "ab") as f:
                             f.write(chunk["data"])
+                    elif chunk["type"] == "WordBoundary":
+                        # offset/duration 以 100 纳秒为单位
+                        start = chunk["offset"] / 1e7
+                        words.append({'text': chunk["text"], 'start': start,
+                                      'end': start + chunk["duration"] / 1e7})
+
+                if words:
+                    with open(timings_path, 'w', encoding='utf-8') as f:
+                        json.dump(words, f, ensure_ascii=False)
                 
                 if not task['cancelled']:
                     task['completed'] += 1
@@ -1,26 +1,63 @@
+import asyncio
 import json
 import os
 import time
 import uuid
 import random
-import requests
-import websocket
-import threading
+import httpx
 from typing import Dict, List, Optional, Tuple, Any
 from .base_service import SingletonService
 from .workflow_service import WorkflowService
-from queue import Queue
+from server.utils.comfyui_pool import BackendError, ComfyUIBackend, ComfyUIBackendPool, HEALTH_CHECK_INTERVAL
+from collections import deque
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 等待单张图片完成的超时（秒）：尚无耗时记录时使用默认值，
+# 之后取最近若干次实际生成耗时的最大值乘以系数，并限制在上下限之间
+DEFAULT_EXECUTION_TIMEOUT = 60
+MIN_EXECUTION_TIMEOUT = 20
+MAX_EXECUTION_TIMEOUT = 600
+EXECUTION_TIMEOUT_FACTOR = 3
+EXECUTION_TIME_SAMPLES = 20
+# 流水线提交时每个任务在 ComfyUI 队列中保持的提示词数量
+DEFAULT_QUEUE_DEPTH = 2
+# 单张图片最多尝试的后端数（后端出错时换其他后端重新提交）
+DEFAULT_MAX_ATTEMPTS = 3
+# 完成消息到达后历史记录尚未写入时的重试间隔（秒）
+HISTORY_RETRY_DELAYS = (0.05, 0.1, 0.2, 0.4, 0.8)
+# HTTP 请求超时（秒）与连接池上限：所有任务、所有后端共用一个保持连接的客户端
+HTTP_TIMEOUT = 60
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE = 20
+
 class ImageService(SingletonService):        
+    """
+    图像生成服务（asyncio）
+    生成任务、WebSocket 长连接和健康检查都是应用事件循环中的协程任务，
+    HTTP 请求共用一个保持连接的 httpx.AsyncClient，并发生成数量不再对应线程数量
+    """
+
     def _initialize(self):
         """初始化图像服务。"""
-        # 基本配置
-        self.comfyui_url = self.config['comfyui']['api_url']
-        self.ws_url = self.comfyui_url.replace('http', 'ws')
+        # 基本配置：api_url 为主后端，backends 为额外的 ComfyUI 后端
+        comfyui_config = self.config['comfyui']
+        self.comfyui_url = comfyui_config['api_url']
         self.client_id = str(uuid.uuid4())
+        # HTTP 连接池（keep-alive），首次在事件循环中使用时建立连接
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        )
+        self.backends = ComfyUIBackendPool(
+            [self.comfyui_url] + list(comfyui_config.get('backends') or []),
+            self.client_id,
+            self._http,
+            comfyui_config.get('health_check_interval', HEALTH_CHECK_INTERVAL),
+        )
         
         # 依赖服务
         self.workflow_service = WorkflowService()
@@ -31,71 +68,36 @@ class ImageService(SingletonService):
         if not hasattr(self, 'stop_flag'):
             self.stop_flag = False
 
-        # WebSocket相关
-        self._ws = None
-        self._ws_connected = False
-        self._ws_error = None
-        self._ws_messages = []
-        self._ws_queue = Queue()
-        self._ws_lock = threading.Lock()
+        # 任务 -> 运行中的生成协程（保持引用，避免任务被回收）
+        self._workers: Dict[str, asyncio.Task] = {}
+        # 后端 + 工作流 -> 最近的生成耗时（秒），用于推算等待超时
+        self._execution_times: Dict[str, deque] = {}
+        # 任务 -> 已提交但尚未完成的 prompt_id 及其所在后端（取消时从对应后端的队列中删除）
+        self._pending_prompts: Dict[str, Dict[str, ComfyUIBackend]] = {}
        
     def generate_seed(self) -> int:
         """生成随机种子。"""
         return random.randint(1, 1000000000)
         
-    def _connect_websocket(self) -> websocket.WebSocketApp:
-        """连接到 ComfyUI WebSocket。"""
-        ws_url = f"{self.ws_url}/ws?clientId={self.client_id}"
-   
-        def on_message(ws, message):
-            try:
-                data = json.loads(message)
-                self._ws_messages.append(data)
-            except Exception as e:
-                print(f"Error processing WebSocket message: {str(e)}")
-                
-        def on_error(ws, error):
-            print(f"WebSocket error: {error}")
-            self._ws_error = error
-            
-        def on_close(ws, close_status_code, close_msg):
-            self._ws_connected = False
-            
-        def on_open(ws):
-            self._ws_connected = True
-            
-        self._ws = websocket.WebSocketApp(
-            ws_url,
-            on_message=on_message,
-            on_error=on_error,
-            on_close=on_close,
-            on_open=on_open
-        )
-        
-        ws_thread = threading.Thread(target=self._ws.run_forever)
-        ws_thread.daemon = True
-        ws_thread.start()
+    async def _connect_websocket(self, backend: ComfyUIBackend, timeout: float = 10):
+        """等待后端的 WebSocket 长连接就绪（首次调用时建立）。"""
+        if not await backend.socket.wait_connected(timeout):
+            raise BackendError(f"WebSocket connection timeout: {backend.url}")
+        return backend.socket
         
-        start_time = time.time()
-        while not self._ws_connected and not self._ws_error and time.time() - start_time < 10:
-            time.sleep(0.1)
-            
-        if self._ws_error:
-            raise Exception(f"Failed to connect to WebSocket: {self._ws_error}")
-        if not self._ws_connected:
-            raise Exception("WebSocket connection timeout")
-            
-        return self._ws
-        
-    def _send_workflow(self, workflow: Dict[str, Any]) -> str:
-        """发送工作流到 ComfyUI。"""
+    async def _send_workflow(self, workflow: Dict[str, Any], backend: ComfyUIBackend) -> str:
+        """发送工作流到 ComfyUI 后端；连接失败或服务端错误时抛出 BackendError，可换后端重试。"""
+        payload = {
+            "prompt": workflow,
+            "client_id": self.client_id
+        }
+        try:
+            response = await self._http.post(f"{backend.url}/prompt", json=payload)
+        except httpx.RequestError as e:
+            raise BackendError(f"Error sending workflow: {str(e)}")
+        if response.status_code >= 500:
+            raise BackendError(f"Error sending workflow: {response.status_code} {response.text}")
         try:
-            payload = {
-                "prompt": workflow,
-                "client_id": self.client_id
-            }
-            response = requests.post(f"{self.comfyui_url}/prompt", json=payload)
-           
             if response.status_code != 200:
                 raise Exception(f"{response.text}")
                 
@@ -109,40 +111,100 @@ class ImageService(SingletonService):
         except Exception as e:
             raise Exception(f"Error sending workflow: {str(e)}")
             
-    def _wait_for_execution(self, prompt_id: str, timeout: int = 60) -> Tuple[bool, Optional[Dict]]:
-        """等待图片生成完成。"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            for message in self._ws_messages[:]:
-                if not isinstance(message, dict):
-                    continue
-                    
-                if message['type'] == 'executing':
-                    data = message.get('data', {})
-                    if data.get('prompt_id') == prompt_id and data.get('node') is None:
-                        time.sleep(1)
-                        try:
-                            response = requests.get(f"{self.comfyui_url}/history/{prompt_id}")
-                            if response.status_code == 200:
-                                history = response.json()
-                                if history and prompt_id in history:
-                                    return True, history[prompt_id]
-                        except Exception as e:
-                            print(f"获取历史记录失败: {str(e)}")
-                        return False, None
-            time.sleep(0.1)
+    def _execution_timeout(self, workflow_key: str) -> float:
+        """按该工作流最近的实际生成耗时推算等待超时。"""
+        samples = self._execution_times.get(workflow_key)
+        if not samples:
+            return self.config['comfyui'].get('execution_timeout', DEFAULT_EXECUTION_TIMEOUT)
+        timeout = max(samples) * EXECUTION_TIMEOUT_FACTOR
+        return min(max(timeout, MIN_EXECUTION_TIMEOUT), MAX_EXECUTION_TIMEOUT)
+
+    def _record_execution_time(self, workflow_key: str, seconds: float):
+        self._execution_times.setdefault(workflow_key, deque(maxlen=EXECUTION_TIME_SAMPLES)).append(seconds)
+
+    async def _fetch_history(self, prompt_id: str, backend: ComfyUIBackend, retry: bool = True) -> Optional[Dict]:
+        """获取任务的历史记录；完成消息先于历史记录写入到达时短暂重试。后端无法连接时抛出 BackendError。"""
+        for delay in HISTORY_RETRY_DELAYS + (None,):
+            try:
+                response = await self._http.get(f"{backend.url}/history/{prompt_id}")
+            except httpx.RequestError as e:
+                raise BackendError(f"获取历史记录失败: {str(e)}")
+            try:
+                if response.status_code == 200:
+                    history = response.json()
+                    if history and prompt_id in history:
+                        return history[prompt_id]
+            except ValueError as e:
+                logger.warning(f"获取历史记录失败: {str(e)}")
+            if not retry or delay is None:
+                break
+            await asyncio.sleep(delay)
+        return None
+
+    async def _wait_for_execution(self, prompt_id: str, backend: ComfyUIBackend, workflow_key: str = '',
+                            timeout: Optional[float] = None,
+                            queued_ahead: int = 0) -> Tuple[bool, Optional[Dict], Optional[float]]:
+        """
+        等待图片生成完成，返回 (是否成功, 历史记录, 生成耗时)。
+        长连接按 prompt_id 把消息投递到本任务的队列，等待队列即可，完成消息到达后立即获取历史记录；
+        超时从任务开始执行（execution_start）时起算；开始执行前按前面还有 queued_ahead 个本任务的提示词放宽。
+        超时视为后端故障，抛出 BackendError。
+        """
+        workflow_key = f"{backend.url}|{workflow_key}"
+        timeout = timeout or self._execution_timeout(workflow_key)
+        socket = await self._connect_websocket(backend)
+        messages = socket.subscribe(prompt_id)
+        started = time.time()
+        deadline = started + timeout * (1 + max(0, queued_ahead))
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    message = await asyncio.wait_for(messages.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+                message_type = message.get('type')
+                data = message.get('data', {})
+                if message_type in ('disconnected', 'reconnected'):
+                    # 断线期间可能错过了完成消息，直接核对历史记录；后端已经无法访问时抛出 BackendError 换后端
+                    history = await self._fetch_history(prompt_id, backend, retry=False)
+                    if history is not None:
+                        return True, history, None
+                elif message_type == 'execution_start':
+                    started = time.time()
+                    deadline = started + timeout
+                elif message_type == 'executing' and data.get('node') is None:
+                    history = await self._fetch_history(prompt_id, backend)
+                    if history is None:
+                        return False, None, None
+                    seconds = time.time() - started
+                    self._record_execution_time(workflow_key, seconds)
+                    return True, history, seconds
+                elif message_type in ('execution_error', 'execution_interrupted'):
+                    logger.error(f"ComfyUI 执行失败 {prompt_id}: {data.get('exception_message', message_type)}")
+                    return False, None, None
+        finally:
+            socket.unsubscribe(prompt_id)
             
-        print(f"等待执行超时: {prompt_id}")
-        return False, None
+        raise BackendError(f"等待执行超时({timeout:.0f}s): {prompt_id} @ {backend.url}")
         
-    def generate_images(
+    async def generate_images(
         self,
         prompts: List[str],
         output_dirs: List[str] = None,
         workflow: Optional[str] = None,
-        params: Optional[Dict[str, Any]] = None
+        params: Optional[Dict[str, Any]] = None,
+        queue_depth: Optional[int] = None
     ) -> Dict[str, Any]:
-        """批量生成图片。"""
+        """
+        批量生成图片。
+        流水线提交：ComfyUI 队列中始终保持 queue_depth 个本任务的提示词（默认取 comfyui.queue_depth），
+        每张图片完成后立即并行下载，进度仍按片段顺序推进；queue_depth 为 1 时逐张生成。
+        生成在当前事件循环的后台任务中进行，本方法提交后立即返回任务ID。
+        """
         if not isinstance(prompts, list):
             prompts = [prompts]
             
@@ -151,8 +213,11 @@ class ImageService(SingletonService):
             
         if not output_dirs:
             output_dirs = [None] * len(prompts)
+
+        queue_depth = max(1, int(queue_depth or self.config['comfyui'].get('queue_depth', DEFAULT_QUEUE_DEPTH)))
             
-        task_id = f"img_{time.strftime('%Y%m%d_%H%M%S')}"
+        # 同一秒内提交的多个任务也不能重名
+        task_id = f"img_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
         logger.info(f"Starting batch generation with workflow: {workflow}")
         
         workflow_data = self.workflow_service.load_workflow(workflow)
@@ -170,15 +235,104 @@ class ImageService(SingletonService):
         }
         
         if not workflow_error:
-            def generate_worker():
+            async def generate_worker():
+                task = self.tasks[task_id]
+                self.backends.start()
+                # 每个后端的 ComfyUI 队列中同时保持 queue_depth 个本任务的提示词；前一张生成期间下一张已在排队，GPU 不会空闲
+                concurrency = queue_depth * len(self.backends.backends)
+                slots = asyncio.Semaphore(concurrency)
+                max_attempts = max(1, int(self.config['comfyui'].get('max_attempts', DEFAULT_MAX_ATTEMPTS)))
+                pending = self._pending_prompts.setdefault(task_id, {})
+                results: Dict[int, Tuple[Optional[Dict], Optional[str]]] = {}
+                next_index = 0
+
+                def collect(i: int, outputs: Optional[Dict], error: Optional[str]):
+                    """记录结果，并按片段顺序推进进度（前面的片段未完成时，后面的结果先暂存）"""
+                    nonlocal next_index
+                    results[i] = (outputs, error)
+                    while next_index in results:
+                        outputs, error = results.pop(next_index)
+                        if error:
+                            task['errors'].append(error)
+                        for node_id, images in (outputs or {}).items():
+                            task['outputs'][node_id] = {'images': images}
+                        next_index += 1
+                    task['current'] = next_index
+                    task['current_prompt'] = prompts[next_index] if next_index < len(prompts) else None
+
+                async def submit(current_workflow: Dict[str, Any], tried: List[ComfyUIBackend]) -> Tuple[ComfyUIBackend, str]:
+                    """提交到预计最快完成的后端；后端故障时换下一个，直到没有可用后端或达到尝试次数"""
+                    while True:
+                        backend = await self.backends.acquire(exclude=tried)
+                        try:
+                            await self._connect_websocket(backend)
+                            return backend, await self._send_workflow(current_workflow, backend)
+                        except BackendError as e:
+                            self.backends.mark_failed(backend, str(e))
+                            self.backends.release(backend, success=False)
+                            tried.append(backend)
+                            if len(tried) >= max_attempts:
+                                raise
+                        except (Exception, asyncio.CancelledError):
+                            # 取消（服务关闭）时同样归还名额，否则后端会一直被当作繁忙
+                            self.backends.release(backend, success=False)
+                            raise
+
+                async def finish_prompt(i: int, prompt: str, output_dir: Optional[str], current_workflow: Dict[str, Any],
+                                        backend: ComfyUIBackend, prompt_id: str, tried: List[ComfyUIBackend]):
+                    """等待一张图片完成并下载（独立协程，与后续提示词的生成并行）；后端故障时换后端重新提交"""
+                    outputs, error = {}, None
+                    try:
+                        while True:
+                            # 每次等待结束（包括被取消）都要归还该后端的名额，否则负载均衡会一直把它当作繁忙
+                            released = False
+                            try:
+                                success, history, seconds = await self._wait_for_execution(
+                                    prompt_id, backend, workflow or '', queued_ahead=i - next_index
+                                )
+                                self.backends.release(backend, seconds, success)
+                                released = True
+                            except BackendError as e:
+                                pending.pop(prompt_id, None)
+                                self.backends.mark_failed(backend, str(e))
+                                self.backends.release(backend, success=False)
+                                released = True
+                                tried.append(backend)
+                                if len(tried) >= max_attempts or task.get('status') in ('cancelling', 'cancelled'):
+                                    raise
+                                logger.warning(f"后端 {backend.url} 出错，换后端重新提交: {prompt}")
+                                backend, prompt_id = await submit(current_workflow, tried)
+                                pending[prompt_id] = backend
+                                continue
+                            finally:
+                                if not released:
+                                    self.backends.release(backend, success=False)
+                            break
+
+                        if not success:
+                            error = f"Failed to generate image for prompt: {prompt}"
+                        elif history and 'outputs' in history:
+                            for node_id, node_output in history['outputs'].items():
+                                if 'images' in node_output and node_output['images']:
+                                    if output_dir:
+                                        await self._save_image(node_output['images'][0], output_dir, backend)
+                                    outputs[node_id] = node_output['images']
+                    except Exception as e:
+                        error = f"Error processing prompt '{prompt}': {str(e)}"
+                    finally:
+                        pending.pop(prompt_id, None)
+                        slots.release()
+                    collect(i, outputs, error)
+
+                downloads = []
                 try:
+                    task['current_prompt'] = prompts[0] if prompts else None
                     for i, (prompt, output_dir) in enumerate(zip(prompts, output_dirs)):
-                        if self.tasks[task_id].get('status') == 'cancelled':
+                        await slots.acquire()
+                        if task.get('status') in ('cancelling', 'cancelled'):
+                            slots.release()
                             break
                         
-                        self.tasks[task_id]['current'] = i
-                        self.tasks[task_id]['current_prompt'] = prompt
-                        
                         current_params = params.copy() if params else {}
                         current_params['seed'] = self.generate_seed()
                         
@@ -193,53 +347,48 @@ class ImageService(SingletonService):
                             if i < len(ref_paths):
                                 current_workflow = self.workflow_service.update_workflow_reference_image(current_workflow, ref_paths[i])
                         
-                        self._connect_websocket()
-                        
+                        tried: List[ComfyUIBackend] = []
                         try:
-                            prompt_id = self._send_workflow(current_workflow)
-                            success, history = self._wait_for_execution(prompt_id)
-                            
-                            if not success:
-                                self.tasks[task_id]['errors'].append(f"Failed to generate image for prompt: {prompt}")
-                                continue
-                                
-                            if history and 'outputs' in history:
-                                for node_id, node_output in history['outputs'].items():
-                                    if 'images' in node_output and node_output['images']:
-                                        image = node_output['images'][0]
-                                        if output_dir:
-                                            self._save_image(image, output_dir)
-                                        self.tasks[task_id]['outputs'][node_id] = {'images': node_output['images']}
-                                        
-                            self.tasks[task_id]['current'] += 1
-                            
+                            # 提交在本协程中按顺序进行，各后端按提交顺序执行
+                            backend, prompt_id = await submit(current_workflow, tried)
                         except Exception as e:
-                            self.tasks[task_id]['errors'].append(f"Error processing prompt '{prompt}': {str(e)}")
-                        finally:
-                            if self._ws:
-                                self._ws.close()
-                                self._ws = None
-                                self._ws_messages = []
-                                self._ws_connected = False
-                                self._ws_error = None
-                    
-                    if not self.tasks[task_id]['errors']:
-                        self.tasks[task_id]['status'] = 'completed'
+                            slots.release()
+                            collect(i, None, f"Error processing prompt '{prompt}': {str(e)}")
+                            continue
+                        pending[prompt_id] = backend
+                        downloads.append(asyncio.create_task(
+                            finish_prompt(i, prompt, output_dir, current_workflow, backend, prompt_id, tried)
+                        ))
+
+                    await asyncio.gather(*downloads)
+                    if task['status'] in ('cancelling', 'cancelled'):
+                        task['status'] = 'cancelled'
+                    elif not task['errors']:
+                        task['status'] = 'completed'
                     else:
-                        self.tasks[task_id]['status'] = 'error'
+                        task['status'] = 'error'
 
+                except asyncio.CancelledError:
+                    # 服务关闭时被取消：一并取消等待中的图片，任务标记为已取消
+                    for download in downloads:
+                        download.cancel()
+                    await asyncio.gather(*downloads, return_exceptions=True)
+                    task['status'] = 'cancelled'
+                    raise
                 except Exception as e:
-                    self.tasks[task_id]['status'] = 'error'
-                    self.tasks[task_id]['errors'].append(str(e))
+                    for download in downloads:
+                        download.cancel()
+                    task['status'] = 'error'
+                    task['errors'].append(str(e))
                     logger.error(f"Error in generation worker for task {task_id}: {str(e)}")
                     
                 finally:
-                    self.tasks[task_id]['current_prompt'] = None
-                    logger.info(f"Task {task_id} finished with status: {self.tasks[task_id]['status']}")
+                    self._pending_prompts.pop(task_id, None)
+                    self._workers.pop(task_id, None)
+                    task['current_prompt'] = None
+                    logger.info(f"Task {task_id} finished with status: {task['status']}")
                     
-            worker_thread = threading.Thread(target=generate_worker)
-            worker_thread.daemon = True
-            worker_thread.start()
+            self._workers[task_id] = asyncio.create_task(generate_worker())
         
         return {
             'task_id': task_id,
@@ -248,26 +397,33 @@ class ImageService(SingletonService):
             'errors': self.tasks[task_id]['errors']
         }
 
-    def _save_image(self, image_data: Dict[str, Any], output_dir: str):
-        """保存生成的图片到指定目录。"""
+    async def _save_image(self, image_data: Dict[str, Any], output_dir: str, backend: Optional[ComfyUIBackend] = None):
+        """从生成该图片的后端下载并保存到指定目录。"""
         try:
-            image_url = f"{self.comfyui_url}/view"
+            image_url = f"{(backend or self.backends.primary).url}/view"
             image_params = {
                 'filename': image_data['filename'],
                 'subfolder': image_data.get('subfolder', ''),
                 'type': image_data.get('type', 'output')
             }
-            image_response = requests.get(image_url, params=image_params)
+            image_response = await self._http.get(image_url, params=image_params)
             if image_response.status_code == 200:
                 output_path = os.path.join(output_dir, "image.png")
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                with open(output_path, 'wb') as f:
-                    f.write(image_response.content)
-                print(f"Saved generated image to {output_path}")
+                # 文件写入放到线程池，不阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._write_file, output_path, image_response.content
+                )
+                logger.info(f"Saved generated image to {output_path}")
             else:
                 raise Exception(f"Failed to download image: {image_response.status_code}")
         except Exception as e:
-            self.tasks[task_id]['errors'].append(f"Failed to save image: {str(e)}")
+            raise Exception(f"Failed to save image: {str(e)}")
+
+    @staticmethod
+    def _write_file(path: str, content: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
 
     def get_generation_progress(self, task_id: str) -> Dict[str, Any]:
         """获取生成进度。"""
@@ -286,24 +442,61 @@ class ImageService(SingletonService):
         """获取任务状态。"""
         return self.tasks.get(task_id, {'status': 'not_found'})
         
-    def cancel_generation(self, task_id: str) -> bool:
+    async def cancel_generation(self, task_id: str) -> bool:
         """取消生成任务。"""
         if task_id not in self.tasks:
             return False
         
         self.tasks[task_id]['status'] = 'cancelling'
         try:
-            response = requests.post(f"{self.comfyui_url}/interrupt")
-            if response.status_code == 200:
+            # 先删除本任务仍在各后端队列中排队的提示词；
+            # 只有正在执行的是本任务的提示词时才中断，/interrupt 会中断后端当前的任务（可能属于其他任务）
+            by_backend: Dict[str, List[str]] = {}
+            for prompt_id, backend in list(self._pending_prompts.get(task_id, {}).items()):
+                by_backend.setdefault(backend.url, []).append(prompt_id)
+            interrupted = True
+            for url, prompt_ids in by_backend.items():
+                backend = self.backends.get(url)
+                await self._http.post(f"{url}/queue", json={'delete': prompt_ids})
+                for prompt_id in prompt_ids:
+                    backend.socket.notify(prompt_id, {'type': 'execution_interrupted', 'data': {'prompt_id': prompt_id}})
+                running = await self._running_prompts(url)
+                for prompt_id in set(prompt_ids) & running:
+                    response = await self._http.post(f"{url}/interrupt", json={'prompt_id': prompt_id})
+                    interrupted = interrupted and response.status_code == 200
+            if interrupted:
                 self.tasks[task_id]['status'] = 'cancelled'
                 return True
             else:
                 self.tasks[task_id]['status'] = 'running' # Restore status
                 return False
         except Exception as e:
+            logger.error(f"Error cancelling task {task_id}: {str(e)}")
             self.tasks[task_id]['status'] = 'running' # Restore status
             return False
 
+    async def _running_prompts(self, url: str) -> set:
+        """后端正在执行的提示词ID（/queue 的 queue_running 项为 [序号, prompt_id, ...]）"""
+        response = await self._http.get(f"{url}/queue")
+        response.raise_for_status()
+        return {item[1] for item in response.json().get('queue_running', []) if len(item) > 1}
+
+    async def aclose(self):
+        """
+        关闭服务（应用退出时调用）：取消仍在运行的生成任务，
+        关闭各后端的 WebSocket 长连接与健康检查，最后关闭 HTTP 连接池
+        """
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await self.backends.close()
+        await self._http.aclose()
+
+    def get_backend_stats(self) -> List[Dict[str, Any]]:
+        """各 ComfyUI 后端的健康状态、队列长度与吞吐统计。"""
+        return self.backends.stats()
+
     def list_workflows(self) -> List[Dict[str, Any]]:
         """列出所有可用的工作流。"""
         return self.workflow_service.list_workflows()
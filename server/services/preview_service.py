@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from server.services import segment_worker
+from server.utils.metrics import StageMetrics
+from server.utils.render_cache import SegmentRenderCache
+
+logger = logging.getLogger(__name__)
+
+# 预览格式变化时递增，使旧预览全部失效
+PREVIEW_VERSION = 1
+
+DEFAULT_PREVIEW_WIDTH = 320
+DEFAULT_PREVIEW_FPS = 6
+DEFAULT_SHEET_COLUMNS = 6
+
+
+class PreviewGenerator:
+    """
+    章节预览
+    每个片段生成一段低分辨率动画 WebP 和一张海报帧，整章生成一张联系表（所有海报帧拼成的网格），
+    编辑器可以直接按片段浏览，不必加载完整的成片 mp4；
+    与片段渲染缓存使用同一个内容键，保存在章节目录的 .preview_cache 下，内容未变化的片段不重复生成
+    """
+
+    PREVIEW_DIR = '.preview_cache'
+    INDEX_FILE = 'previews.json'
+
+    def __init__(self, chapter_path: str, width: int = DEFAULT_PREVIEW_WIDTH, fps: float = DEFAULT_PREVIEW_FPS,
+                 columns: int = DEFAULT_SHEET_COLUMNS, quality: int = 60):
+        self.chapter_path = chapter_path
+        self.preview_dir = os.path.join(chapter_path, self.PREVIEW_DIR)
+        self.index_path = os.path.join(self.preview_dir, self.INDEX_FILE)
+        self.width = width
+        self.fps = fps
+        self.columns = max(1, columns)
+        self.quality = quality
+        self._keys = SegmentRenderCache(chapter_path)
+        self._lock = threading.Lock()
+        # 预览生成的耗时、CPU 与内存（preview 阶段）
+        self.metrics = StageMetrics()
+
+    def preview_settings(self, settings: Dict) -> Dict:
+        """
+        按预览尺寸缩放的渲染设置：宽度固定、高度按成片宽高比（取偶数）
+        帧率统一为预览帧率，草稿与成片共用同一份预览
+        """
+        width, height = settings['resolution']
+        preview_height = max(2, int(round(self.width * height / width / 2)) * 2)
+        return {**settings, 'resolution': (self.width, preview_height), 'fps': self.fps}
+
+    def _segment_key(self, subdir: str, settings: Dict) -> str:
+        return self._keys.segment_key(
+            subdir, settings, [f"preview_v{PREVIEW_VERSION}", f"quality={self.quality}"]
+        )
+
+    def _paths(self, subdir: str, key: str) -> Dict[str, str]:
+        return {
+            'preview': os.path.join(self.preview_dir, f"{subdir}_{key}.webp"),
+            'poster': os.path.join(self.preview_dir, f"{subdir}_{key}.jpg"),
+        }
+
+    def segment_preview(self, subdir: str, settings: Dict, stop_event=None) -> Optional[Dict]:
+        """生成（或复用）单个片段的预览，settings 为 preview_settings() 的结果；被取消时返回 None"""
+        with self.metrics.measure('preview'):
+            key = self._segment_key(subdir, settings)
+            paths = self._paths(subdir, key)
+            cached = all(os.path.exists(path) for path in paths.values())
+            if not cached:
+                result = segment_worker.render_segment_preview(
+                    subdir, paths['preview'], paths['poster'], settings, self.fps, self.quality, stop_event
+                )
+                if result is None:
+                    return None
+                self._remove_stale(subdir, key)
+            return {
+                'id': subdir,
+                'key': key,
+                'duration': segment_worker.segment_duration(settings, subdir),
+                'preview': os.path.basename(paths['preview']),
+                'poster': os.path.basename(paths['poster']),
+                'cached': cached,
+            }
+
+    def generate(self, subdirs: List[str], settings: Dict, stop_event=None,
+                 workers: Optional[int] = None) -> Optional[Dict]:
+        """
+        并行生成全部片段的预览与联系表，写入预览索引并返回
+        settings 为成片的视频设置（需包含 chapter_path）；被取消时返回 None
+        """
+        os.makedirs(self.preview_dir, exist_ok=True)
+        settings = self.preview_settings(settings)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(subdirs) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            segments = list(executor.map(
+                lambda subdir: self.segment_preview(subdir, settings, stop_event), subdirs
+            ))
+        if any(segment is None for segment in segments):
+            return None
+
+        # 片段在整章中的起始时间，便于按时间定位
+        start = 0.0
+        for segment in segments:
+            segment['start'] = round(start, 3)
+            start += int(segment['duration'] * settings['fps']) / settings['fps']
+
+        with self.metrics.measure('preview'):
+            sheet = self.contact_sheet(segments, settings['resolution'])
+        index = {
+            'version': PREVIEW_VERSION,
+            'width': settings['resolution'][0],
+            'height': settings['resolution'][1],
+            'fps': self.fps,
+            'total_duration': round(start, 3),
+            'segments': segments,
+            'contact_sheet': sheet,
+        }
+        self._prune(subdirs, segments, sheet)
+        self._save_index(index)
+        logger.info("章节预览生成完成: %s | 片段数: %d | 复用: %d", self.chapter_path, len(segments),
+                    sum(1 for segment in segments if segment['cached']))
+        return index
+
+    def contact_sheet(self, segments: List[Dict], tile_size) -> Dict:
+        """把各片段海报帧按 columns 列拼成一张联系表；内容键不变时直接复用"""
+        digest = hashlib.sha1(
+            json.dumps([self.columns] + [segment['key'] for segment in segments]).encode('utf-8')
+        ).hexdigest()[:16]
+        filename = f"contact_sheet_{digest}.jpg"
+        path = os.path.join(self.preview_dir, filename)
+        tile_w, tile_h = tile_size
+        columns = min(self.columns, len(segments)) or 1
+        rows = (len(segments) + columns - 1) // columns
+        if not os.path.exists(path):
+            sheet = Image.new('RGB', (tile_w * columns, tile_h * rows))
+            for i, segment in enumerate(segments):
+                with Image.open(os.path.join(self.preview_dir, segment['poster'])) as poster:
+                    sheet.paste(poster, ((i % columns) * tile_w, (i // columns) * tile_h))
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            sheet.save(temp_path, format='JPEG', quality=85)
+            os.replace(temp_path, path)
+        return {'file': filename, 'columns': columns, 'rows': rows, 'tile_width': tile_w, 'tile_height': tile_h}
+
+    def _remove_stale(self, subdir: str, key: str) -> None:
+        """删除该片段旧版本的预览"""
+        with self._lock:
+            for name in os.listdir(self.preview_dir):
+                if name.startswith(f"{subdir}_") and not name.startswith(f"{subdir}_{key}."):
+                    self._remove(os.path.join(self.preview_dir, name))
+
+    def _prune(self, subdirs: List[str], segments: List[Dict], sheet: Dict) -> None:
+        """删除已不存在的片段的预览和旧联系表"""
+        keep = {sheet['file'], self.INDEX_FILE}
+        for segment in segments:
+            keep.update((segment['preview'], segment['poster']))
+        for name in os.listdir(self.preview_dir):
+            if name not in keep and not name.endswith('.tmp'):
+                self._remove(os.path.join(self.preview_dir, name))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning("删除预览文件失败: %s. Error: %s", path, e)
+
+    def _save_index(self, index: Dict) -> None:
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(temp_path, self.index_path)
+
+    def load_index(self) -> Optional[Dict]:
+        """读取预览索引，未生成或版本不符时返回 None"""
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("预览索引读取失败: %s. Error: %s", self.index_path, e)
+            return None
+        return index if index.get('version') == PREVIEW_VERSION else None
+
+    def file_path(self, name: str) -> Optional[str]:
+        """预览目录中的文件路径，只接受索引中出现过的文件名"""
+        index = self.load_index()
+        if index is None:
+            return None
+        names = {index['contact_sheet']['file']}
+        for segment in index['segments']:
+            names.update((segment['preview'], segment['poster']))
+        if name not in names:
+            return None
+        path = os.path.join(self.preview_dir, name)
+        return path if os.path.exists(path) else None
@@ -0,0 +1,460 @@
+"""
+视频片段渲染任务
+这里的函数只依赖传入的参数，既可以在线程池中执行，也可以在独立的工作进程中执行
+"""
+import logging
+import os
+import subprocess
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from server.utils.image_effect import SegmentRenderer
+from server.utils.ffmpeg_writer import FFmpegFrameWriter
+from server.utils.frame_store import FrameStore
+from server.utils.media_index import ChapterMediaIndex
+from server.utils.metrics import StageMetrics, process_peak_rss_mb, wait_process
+
+logger = logging.getLogger(__name__)
+
+# 每渲染多少帧向父进程汇报一次进度
+PROGRESS_INTERVAL_FRAMES = 20
+
+
+def _check_file(path: str) -> None:
+    """验证文件有效性"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"文件不存在: {path}")
+    if os.path.getsize(path) < 1024:
+        raise ValueError(f"文件过小: {path}")
+
+
+def load_segment_image(subdir_path: str) -> Image.Image:
+    """加载片段图片"""
+    image_path = os.path.join(subdir_path, "image.png")
+    _check_file(image_path)
+    with Image.open(image_path) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img.copy()
+
+
+def probe_audio_duration(subdir_path: str) -> float:
+    """从章节媒体索引读取片段音频时长（不解码音频）"""
+    chapter_path, subdir = os.path.split(os.path.normpath(subdir_path))
+    return ChapterMediaIndex(chapter_path).segment_durations([subdir])[subdir]
+
+
+def segment_duration(settings: Dict, subdir: str) -> float:
+    """
+    片段时长（音频时长 + 片段后静音）
+    优先使用规划阶段得到的时长（settings['segment_durations']），否则查询章节媒体索引
+    """
+    durations = settings.get('segment_durations') or {}
+    if subdir in durations:
+        return durations[subdir]
+    return probe_audio_duration(os.path.join(settings['chapter_path'], subdir)) + (settings.get('segment_gap') or 0)
+
+
+def effect_params(settings: Dict, subdir: str) -> Dict:
+    """构建特效参数"""
+    return {
+        'output_size': settings['resolution'],
+        'fade_duration': settings.get('fade_duration', 1.0),
+        'use_pan': settings.get('use_pan', True),
+        'pan_range': settings.get('pan_range', (0.5, 0)),
+        'segment_index': int(subdir) if subdir.isdigit() else 0,
+        'smooth_motion': settings.get('smooth_motion', False),
+    }
+
+
+def create_renderer(image: Image.Image, duration: float, settings: Dict, subdir: str) -> SegmentRenderer:
+    """创建片段渲染器，整个片段只缩放一次原图"""
+    try:
+        return SegmentRenderer(image, duration, effect_params(settings, subdir))
+    except Exception as e:
+        logger.error("特效处理失败: %s", str(e))
+        raise
+
+
+def iter_frames(renderer: SegmentRenderer, total_frames: int, fps: float, stop_event=None) -> Iterator[np.ndarray]:
+    """逐帧生成器，遇到取消标志时提前结束"""
+    for i in range(total_frames):
+        if stop_event is not None and stop_event.is_set():
+            return
+        yield renderer.frame(i / fps)
+
+
+def new_frame_timing() -> Dict[str, float]:
+    """
+    单帧耗时统计（秒，累计值）
+    render: 特效计算; write: 写入编码器; dispatch: 执行器调度等待
+    """
+    return {'frames': 0, 'render': 0.0, 'write': 0.0, 'dispatch': 0.0}
+
+
+def render_frames_into(store: FrameStore, renderer: SegmentRenderer, start: int, count: int, fps: float,
+                       stop_event=None) -> Tuple[int, float]:
+    """
+    渲染一批帧并直接写入帧存储（内存列表或内存映射文件）
+    返回实际渲染的帧数和纯计算耗时
+    """
+    begin = time.perf_counter()
+    rendered = 0
+    for i in range(start, start + count):
+        if stop_event is not None and stop_event.is_set():
+            break
+        store.put(i, renderer.frame(i / fps))
+        rendered += 1
+    return rendered, time.perf_counter() - begin
+
+
+def _write_frames(frames: Iterator[np.ndarray], writer: FFmpegFrameWriter, timing: Dict[str, float],
+                  on_frame=None) -> Tuple[float, float]:
+    """
+    把帧依次写入编码器，累计渲染与写入的墙钟时间（timing），
+    返回渲染与写入各自占用的线程 CPU 时间
+    """
+    render_cpu = write_cpu = 0.0
+    while True:
+        tick, cpu_tick = time.perf_counter(), time.thread_time()
+        frame = next(frames, None)
+        if frame is None:
+            break
+        tock, cpu_tock = time.perf_counter(), time.thread_time()
+        writer.write(frame)
+        timing['render'] += tock - tick
+        timing['write'] += time.perf_counter() - tock
+        render_cpu += cpu_tock - cpu_tick
+        write_cpu += time.thread_time() - cpu_tock
+        if on_frame is not None:
+            on_frame(writer.frames_written)
+    return render_cpu, write_cpu
+
+
+def _record_encode(metrics: StageMetrics, timing: Dict[str, float], render_cpu: float, write_cpu: float,
+                   close_wall: float, close_cpu: float, writer: FFmpegFrameWriter) -> None:
+    """记录渲染、编码阶段指标；编码包含写入管道、等待编码器结束以及 ffmpeg 进程自身的 CPU 时间"""
+    peak = process_peak_rss_mb()
+    metrics.add('render', timing['render'], render_cpu, peak)
+    metrics.add('encode', timing['write'] + close_wall, write_cpu + close_cpu, peak)
+    metrics.add_process('encode', writer.usage)
+
+
+def render_segment(subdir: str, output_path: str, settings: Dict, video_params: List[str],
+                   stop_event=None, progress_queue=None, submitted_at: Optional[float] = None) -> Optional[Dict]:
+    """
+    流式渲染并编码单个片段（仅视频流）：帧由生成器产生后立即写入ffmpeg的stdin
+    音频由章节音轨统一编码，合并时再混流
+
+    Args:
+        subdir: 片段目录名（数字）
+        output_path: 输出的片段视频路径
+        settings: 视频设置，需包含 chapter_path
+        video_params: ffmpeg视频编码参数
+        stop_event: 取消标志（threading.Event 或 Manager().Event()）
+        progress_queue: 进度队列，按 (subdir, 已渲染帧数, 总帧数) 汇报
+        submitted_at: 提交到执行器的时间戳，用于统计调度等待
+
+    Returns:
+        {'output_path': 输出文件路径, 'timing': 帧耗时统计, 'metrics': 各阶段指标}；被取消时返回 None
+    """
+    start_time = time.time()
+    timing = new_frame_timing()
+    metrics = StageMetrics()
+    if submitted_at is not None:
+        timing['dispatch'] = max(0.0, start_time - submitted_at)
+    subdir_path = os.path.join(settings['chapter_path'], subdir)
+    with metrics.measure('load'):
+        duration = segment_duration(settings, subdir)
+        image = load_segment_image(subdir_path)
+
+    try:
+        total_frames = int(duration * settings['fps'])
+        if total_frames == 0:
+            raise ValueError(f"计算的总帧数为0，视频时长过短。 Subdir: {subdir}")
+
+        with metrics.measure('load'):
+            renderer = create_renderer(image, duration, settings, subdir)
+        writer = FFmpegFrameWriter(
+            output_path,
+            size=tuple(settings['resolution']),
+            fps=settings['fps'],
+            video_params=video_params,
+            threads=settings.get('threads', 4),
+            pix_fmt=settings.get('frame_format') or 'rgb24',
+        )
+        def report(frames_written: int):
+            if progress_queue is not None and frames_written % PROGRESS_INTERVAL_FRAMES == 0:
+                progress_queue.put((subdir, frames_written, total_frames))
+
+        with writer:
+            frames = iter_frames(renderer, total_frames, settings['fps'], stop_event)
+            render_cpu, write_cpu = _write_frames(frames, writer, timing, report)
+            if writer.frames_written < total_frames:
+                writer.abort()
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                return None
+            close_start, close_cpu_start = time.perf_counter(), time.thread_time()
+        _record_encode(metrics, timing, render_cpu, write_cpu, time.perf_counter() - close_start,
+                       time.thread_time() - close_cpu_start, writer)
+    finally:
+        image.close()
+
+    if progress_queue is not None:
+        progress_queue.put((subdir, total_frames, total_frames))
+    timing['frames'] = total_frames
+    logger.info("完成片段 %s | 耗时: %.1fs | 大小: %.1fMB | 单帧 渲染 %.2fms 写入 %.2fms",
+                subdir, time.time() - start_time, os.path.getsize(output_path) / 1024 / 1024,
+                timing['render'] * 1000 / total_frames, timing['write'] * 1000 / total_frames)
+    return {'output_path': output_path, 'timing': timing, 'metrics': metrics.to_dict()}
+
+
+def render_segment_preview(subdir: str, output_path: str, poster_path: str, settings: Dict,
+                           preview_fps: float, quality: int = 60, stop_event=None) -> Optional[Dict]:
+    """
+    渲染片段预览：低分辨率动画 WebP 与海报帧（中间一帧，JPEG）
+    与正式渲染使用同一个渲染器，settings['resolution'] 应为预览分辨率
+
+    Returns:
+        {'frames': 帧数, 'duration': 片段时长}；被取消时返回 None
+    """
+    duration = segment_duration(settings, subdir)
+    image = load_segment_image(os.path.join(settings['chapter_path'], subdir))
+    try:
+        renderer = create_renderer(image, duration, settings, subdir)
+    finally:
+        image.close()
+
+    total_frames = max(1, int(duration * preview_fps))
+    frames = [Image.fromarray(frame) for frame in iter_frames(renderer, total_frames, preview_fps, stop_event)]
+    if len(frames) < total_frames:
+        return None
+
+    # 先写临时文件再替换，避免前端读到写了一半的预览
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    frames[0].save(temp_path, format='WEBP', save_all=True, append_images=frames[1:],
+                   duration=int(round(1000 / preview_fps)), loop=0, quality=quality, method=4)
+    os.replace(temp_path, output_path)
+    temp_path = f"{poster_path}.{os.getpid()}.tmp"
+    frames[len(frames) // 2].save(temp_path, format='JPEG', quality=85)
+    os.replace(temp_path, poster_path)
+    return {'frames': total_frames, 'duration': duration}
+
+
+def has_motion(settings: Dict) -> bool:
+    """片段是否包含镜头平移"""
+    h_range, v_range = settings.get('pan_range', (0.5, 0))
+    return bool(settings.get('use_pan', True)) and (h_range > 0 or v_range > 0)
+
+
+def build_filter_graph(image_size: Tuple[int, int], duration: float, settings: Dict, subdir: str) -> str:
+    """
+    构建ffmpeg滤镜：缩放一次后循环单帧，平移用 crop 的时间表达式实现，淡入淡出用 fade 滤镜
+    缩放尺寸、偏移与 SegmentRenderer 一致
+    """
+    params = effect_params(settings, subdir)
+    output_w, output_h = params['output_size']
+    layout = SegmentRenderer.layout(image_size[0], image_size[1], params)
+    scaled_w, scaled_h = layout['scaled_size']
+    fps = settings['fps']
+
+    if layout['panning']:
+        # 与 ImageEffects._ease_in_out_progress 相同的正弦缓动
+        moving = f"floor({layout['max_offset']}*(0.5-0.5*cos(PI*t/{duration})))"
+        fixed = str(layout['fixed_offset'])
+        x, y = (moving, fixed) if layout['use_horizontal'] else (fixed, moving)
+    else:
+        x, y = str(layout['max_offset'] // 2), str(layout['fixed_offset'])
+
+    filters = [
+        f"scale={scaled_w}:{scaled_h}:flags=lanczos",
+        "format=rgb24",
+        "loop=loop=-1:size=1:start=0",
+        f"setpts=N/({fps}*TB)",
+        f"crop={output_w}:{output_h}:x='{x}':y='{y}'",
+    ]
+    fade_duration = params['fade_duration'] or 0
+    if fade_duration > 0:
+        filters.append(f"fade=t=in:st=0:d={fade_duration}")
+        filters.append(f"fade=t=out:st={max(0.0, duration - fade_duration)}:d={fade_duration}")
+    filters.append("format=yuv420p")
+    return f"[0:v]{','.join(filters)}[v]"
+
+
+def render_segment_ffmpeg(subdir: str, output_path: str, settings: Dict, video_params: List[str],
+                          stop_event=None, progress_queue=None, submitted_at: Optional[float] = None) -> Optional[Dict]:
+    """
+    静态图快速路径：整个片段由一次ffmpeg调用完成（单帧输入 + 滤镜），没有任何帧经过Python
+    参数与返回值同 render_segment
+    """
+    start_time = time.time()
+    timing = new_frame_timing()
+    metrics = StageMetrics()
+    if submitted_at is not None:
+        timing['dispatch'] = max(0.0, start_time - submitted_at)
+    subdir_path = os.path.join(settings['chapter_path'], subdir)
+    image_path = os.path.join(subdir_path, "image.png")
+
+    with metrics.measure('load'):
+        _check_file(image_path)
+        duration = segment_duration(settings, subdir)
+        total_frames = int(duration * settings['fps'])
+        if total_frames == 0:
+            raise ValueError(f"计算的总帧数为0，视频时长过短。 Subdir: {subdir}")
+        with Image.open(image_path) as img:
+            image_size = img.size
+
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-i', image_path,
+        '-filter_complex', build_filter_graph(image_size, duration, settings, subdir),
+        '-map', '[v]', '-an',
+        '-r', str(settings['fps']),
+        '-frames:v', str(total_frames),
+    ]
+    cmd.extend(video_params)
+    if 'libx264' in video_params and not has_motion(settings):
+        cmd.extend(['-tune', 'stillimage'])
+    cmd.extend(['-threads', str(settings.get('threads', 4)), output_path])
+
+    # 滤镜与编码在同一个 ffmpeg 进程中完成，整体计入编码阶段；
+    # 编码耗时只统计 ffmpeg 运行期间（不含图片检查与准备），CPU 取自 ffmpeg 进程的 rusage
+    encode_start, encode_cpu_start = time.perf_counter(), time.thread_time()
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        usage = wait_process(proc, lambda: stop_event is not None and stop_event.is_set())
+        if stop_event is not None and stop_event.is_set():
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        if proc.returncode != 0:
+            stderr_file.seek(0)
+            raise RuntimeError(f"ffmpeg编码失败({proc.returncode}): "
+                               f"{stderr_file.read().decode('utf-8', errors='replace')}")
+    encode_wall = time.perf_counter() - encode_start
+    metrics.add('encode', encode_wall, time.thread_time() - encode_cpu_start, process_peak_rss_mb())
+    metrics.add_process('encode', usage)
+
+    timing['frames'] = total_frames
+    timing['write'] = encode_wall
+    if progress_queue is not None:
+        progress_queue.put((subdir, total_frames, total_frames))
+    logger.info("完成片段 %s (ffmpeg滤镜) | 耗时: %.1fs | 大小: %.1fMB",
+                subdir, time.time() - start_time, os.path.getsize(output_path) / 1024 / 1024)
+    return {'output_path': output_path, 'timing': timing, 'metrics': metrics.to_dict()}
+
+
+def _blend(a: np.ndarray, b: np.ndarray, alpha: float, buffer: np.ndarray) -> np.ndarray:
+    """a*(1-alpha) + b*alpha"""
+    np.multiply(a, 1 - alpha, out=buffer, casting='unsafe')
+    buffer += b * np.float32(alpha)
+    return buffer.astype(np.uint8)
+
+
+def _timeline_frames(segments: List[Tuple[str, int]], settings: Dict, transition_frames: int,
+                     stop_event=None, progress_queue=None) -> Iterator[np.ndarray]:
+    """
+    整章帧生成器
+    片段 i 的画面持续 n_i + T 帧，后 T 帧与片段 i+1 的前 T 帧做交叉淡化，
+    因此总帧数等于各片段帧数之和，与拼接后的音轨严格对齐；同一时刻最多保留两个渲染器
+    """
+    fps = settings['fps']
+    # 片段之间使用转场，片段自身的淡入淡出只保留在整章开头和结尾
+    segment_settings = {**settings, 'fade_duration': 0}
+    fade_frames = int((settings.get('fade_duration') or 0) * fps)
+    total_frames = sum(count for _, count in segments)
+    width, height = settings['resolution']
+    buffer = np.empty((height, width, 3), dtype=np.float32)
+
+    previous = None  # (renderer, 已输出帧数)
+    frame_index = 0
+    for i, (subdir, count) in enumerate(segments):
+        tail = transition_frames if i < len(segments) - 1 else 0
+        with Image.open(os.path.join(settings['chapter_path'], subdir, "image.png")) as img:
+            renderer = create_renderer(img.convert('RGB'), (count + tail) / fps, segment_settings, subdir)
+
+        for f in range(count):
+            if stop_event is not None and stop_event.is_set():
+                return
+            frame = renderer.frame(f / fps)
+            if previous is not None and f < transition_frames:
+                prev_renderer, prev_count = previous
+                alpha = (f + 1) / (transition_frames + 1)
+                frame = _blend(prev_renderer.frame((prev_count + f) / fps), frame, alpha, buffer)
+
+            # 整章淡入淡出
+            brightness = 1.0
+            if fade_frames > 0:
+                brightness = min(1.0, frame_index / fade_frames, (total_frames - frame_index) / fade_frames)
+            if brightness < 1.0:
+                np.multiply(frame, brightness, out=buffer, casting='unsafe')
+                frame = buffer.astype(np.uint8)
+
+            yield frame
+            frame_index += 1
+            if progress_queue is not None and (f + 1) % PROGRESS_INTERVAL_FRAMES == 0:
+                progress_queue.put((subdir, f + 1, count))
+
+        if progress_queue is not None:
+            progress_queue.put((subdir, count, count))
+        previous = (renderer, count)
+
+
+def render_timeline(subdirs: List[str], output_path: str, settings: Dict, video_params: List[str],
+                    stop_event=None, progress_queue=None) -> Optional[Dict]:
+    """
+    单次编码整章（仅视频流）：所有片段的帧连续写入同一个编码器，片段间做交叉淡化
+    音轨由章节音轨统一编码，之后再混流
+
+    Returns:
+        {'output_path': 输出文件路径, 'timing': 帧耗时统计, 'metrics': 各阶段指标}；被取消时返回 None
+        图片加载发生在逐帧生成过程中，计入渲染阶段
+    """
+    start_time = time.time()
+    timing = new_frame_timing()
+    metrics = StageMetrics()
+    fps = settings['fps']
+
+    # 计算各片段帧数（与分段模式一致）
+    segments = []
+    for subdir in subdirs:
+        duration = segment_duration(settings, subdir)
+        count = int(duration * fps)
+        if count == 0:
+            raise ValueError(f"计算的总帧数为0，视频时长过短。 Subdir: {subdir}")
+        segments.append((subdir, count))
+
+    # 转场不能超过最短片段的一半
+    transition_frames = int((settings.get('transition_duration') or 0) * fps)
+    transition_frames = max(0, min(transition_frames, min(count for _, count in segments) // 2))
+
+    writer = FFmpegFrameWriter(
+        output_path,
+        size=tuple(settings['resolution']),
+        fps=fps,
+        video_params=video_params,
+        threads=settings.get('threads', 4),
+        pix_fmt=settings.get('frame_format') or 'rgb24',
+    )
+    total_frames = sum(count for _, count in segments)
+    with writer:
+        frames = _timeline_frames(segments, settings, transition_frames, stop_event, progress_queue)
+        render_cpu, write_cpu = _write_frames(frames, writer, timing)
+        if writer.frames_written < total_frames:
+            writer.abort()
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        close_start, close_cpu_start = time.perf_counter(), time.thread_time()
+    _record_encode(metrics, timing, render_cpu, write_cpu, time.perf_counter() - close_start,
+                   time.thread_time() - close_cpu_start, writer)
+
+    timing['frames'] = total_frames
+    logger.info("整章单次编码完成 | 片段: %d | 耗时: %.1fs | 大小: %.1fMB",
+                len(segments), time.time() - start_time, os.path.getsize(output_path) / 1024 / 1024)
+    return {'output_path': output_path, 'timing': timing, 'metrics': metrics.to_dict()}
@@ -0,0 +1,213 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from server.services.video_service import VideoService, RenderJob
+from server.utils.metrics import registry
+from server.utils.render_manifest import RenderManifest, find_interrupted
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先执行，草稿先于成片
+PRIORITY_DRAFT = 0
+PRIORITY_FINAL = 1
+
+
+class JobConflictError(Exception):
+    """同一章节（草稿/成片）已有未结束的任务，且不能直接复用（设置不同或正在取消）"""
+
+    def __init__(self, job: RenderJob, message: Optional[str] = None):
+        super().__init__(message or f"章节正在渲染（任务 {job.job_id}），设置与本次提交不同，请先取消该任务再重新提交")
+        self.job = job
+
+
+class VideoJobQueue:
+    """
+    视频渲染任务队列
+    提交后立即返回任务ID，由固定数量的渲染槽位按优先级（草稿优先）依次执行，
+    每个任务独立追踪进度、独立取消
+    """
+
+    def __init__(self, video_service: VideoService, slots: int = 1, max_history: int = 50):
+        self.video_service = video_service
+        self.slots = max(1, int(slots))
+        self.max_history = max_history
+        self.jobs: Dict[str, RenderJob] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._counter = itertools.count()
+        self._latest_job_id: Optional[str] = None
+
+    def _ensure_workers(self):
+        """在当前事件循环中按槽位数启动工作协程（首次提交时启动，槽位数调大后补齐）"""
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        for _ in range(self.slots - len(self._workers)):
+            index = len(self._workers)
+            self._workers.append(asyncio.create_task(self._worker(index), name=f"video-render-slot-{index}"))
+
+    def set_slots(self, slots: int):
+        """调整并发渲染槽位数；减少时正在执行的任务不受影响，多余槽位在空闲后退出"""
+        self.slots = max(1, int(slots))
+
+    async def submit(self, chapter_path: str, settings: Optional[Dict] = None,
+                     project_name: Optional[str] = None,
+                     chapter_name: Optional[str] = None) -> Tuple[RenderJob, bool]:
+        """
+        提交渲染任务，立即返回 (任务, 是否去重)
+        同一章节（草稿/成片）已有未结束的任务时：设置相同则返回该任务（去重），
+        设置不同则抛出 JobConflictError，不会为永远不会被渲染的设置返回任务ID；
+        上一个任务已请求取消但尚未结束时同样抛出 JobConflictError，
+        两个任务不能同时使用同一份渲染清单和工作目录
+        """
+        settings = settings or {}
+        existing = self.find_active(chapter_path, bool(settings.get('draft')))
+        if existing is not None:
+            if existing.stop_flag.is_set():
+                raise JobConflictError(
+                    existing, f"章节的上一个任务（{existing.job_id}）正在取消，请在其结束后重新提交"
+                )
+            if self._effective_settings(existing.settings) != self._effective_settings(settings):
+                raise JobConflictError(existing)
+            logger.info("章节已有设置相同的未结束视频任务 %s，不重复提交", existing.job_id)
+            return existing, True
+        priority = PRIORITY_DRAFT if settings.get('draft') else PRIORITY_FINAL
+        job = RenderJob(chapter_path, settings, priority=priority,
+                        project_name=project_name, chapter_name=chapter_name)
+        # 写入渲染清单，排队中的任务在服务重启后同样会被恢复
+        self._manifest(job).mark_queued(job.job_id, settings, project_name, chapter_name)
+        self.jobs[job.job_id] = job
+        self._latest_job_id = job.job_id
+        self._prune_history()
+        self._ensure_workers()
+        await self._queue.put((priority, next(self._counter), job.job_id))
+        logger.info("视频任务 %s 已加入队列 | 章节: %s | 优先级: %d", job.job_id, job.chapter_name, priority)
+        return job, False
+
+    def _effective_settings(self, settings: Dict) -> Dict:
+        """合并默认值后的设置，未显式传入与显式传入默认值视为相同"""
+        return {**self.video_service.default_settings, **settings}
+
+    async def resume_interrupted(self, projects_path: str) -> List[RenderJob]:
+        """重新提交服务退出时仍在排队或渲染中的任务，已完成的片段按渲染清单复用"""
+        jobs = []
+        for item in find_interrupted(projects_path):
+            logger.info("恢复中断的视频任务 | 章节: %s/%s | 已完成片段: %d",
+                        item['project_name'], item['chapter_name'], item['completed_segments'])
+            try:
+                job, _ = await self.submit(item['chapter_path'], item['settings'],
+                                           item['project_name'], item['chapter_name'])
+            except JobConflictError as e:
+                logger.warning("跳过中断的视频任务: %s", e)
+                continue
+            jobs.append(job)
+        return jobs
+
+    @staticmethod
+    def _manifest(job: RenderJob) -> RenderManifest:
+        return RenderManifest(job.chapter_path, 'draft' if job.settings.get('draft') else None)
+
+    def find_active(self, chapter_path: str, draft: bool = False) -> Optional[RenderJob]:
+        """同一章节、同一类型（草稿/成片）的未结束任务（包括已请求取消、仍在收尾的任务）"""
+        chapter_path = os.path.abspath(chapter_path)
+        for job in self.jobs.values():
+            if (not job.finished
+                    and os.path.abspath(job.chapter_path) == chapter_path
+                    and bool(job.settings.get('draft')) == draft):
+                return job
+        return None
+
+    async def _worker(self, index: int):
+        while True:
+            if index >= self.slots:
+                # 槽位数已调小，空闲时退出
+                return
+            _, _, job_id = await self._queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job is None or job.finished:
+                    continue
+                await self._run(job)
+            except Exception as e:
+                logger.error("渲染槽位 %d 异常: %s", index, e)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: RenderJob):
+        if job.stop_flag.is_set():
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.output_path = await self.video_service.generate_video(job.chapter_path, job.settings, job)
+            job.status = 'completed'
+        except Exception as e:
+            if job.stop_flag.is_set():
+                job.status = 'cancelled'
+                job.set_task("已取消")
+            else:
+                job.status = 'failed'
+                job.error = str(e)
+                job.set_task("生成失败")
+        finally:
+            job.finished_at = time.time()
+            registry.record_job(job.status, job.metrics.to_dict(), segments=job.progress,
+                                cached_segments=job.cached_segments, frames=job.frame_timing['frames'])
+            logger.info("视频任务 %s 结束，状态: %s | 阶段指标: %s", job.job_id, job.status, job.metrics.to_dict())
+
+    def _prune_history(self):
+        """只保留最近 max_history 个已结束的任务"""
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(0, len(finished) - self.max_history)]:
+            self.jobs.pop(job.job_id, None)
+
+    def get_job(self, job_id: Optional[str] = None) -> Optional[RenderJob]:
+        """按ID获取任务；不传ID时返回最近提交的任务"""
+        return self.jobs.get(job_id or self._latest_job_id or '')
+
+    def queue_position(self, job: RenderJob) -> int:
+        """排队任务前面还有几个待执行的任务，非排队状态返回 0"""
+        if job.status != 'queued':
+            return 0
+        return sum(
+            1 for other in self.jobs.values()
+            if other.status == 'queued' and not other.stop_flag.is_set()
+            and (other.priority, other.created_at) < (job.priority, job.created_at)
+        )
+
+    def get_progress(self, job_id: Optional[str] = None, include_segments: bool = False) -> Optional[Dict]:
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        progress = job.get_progress(include_segments)
+        progress['queue_position'] = self.queue_position(job)
+        return progress
+
+    def cancel(self, job_id: Optional[str] = None) -> bool:
+        """取消任务；排队中的任务直接标记为已取消"""
+        job = self.get_job(job_id)
+        if job is None or not job.cancel():
+            return False
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            job.set_task("已取消")
+            self._manifest(job).finish('cancelled')
+        return True
+
+    def active_counts(self) -> Dict[str, int]:
+        """排队中与执行中的任务数"""
+        counts = {'queued': 0, 'running': 0}
+        for job in list(self.jobs.values()):
+            if job.status in counts:
+                counts[job.status] += 1
+        return counts
+
+    def list_jobs(self) -> List[Dict]:
+        return [self.get_progress(job_id) for job_id in list(self.jobs)]
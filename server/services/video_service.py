@@ -1,18 +1,162 @@
 import logging
 import os
 import time
-import numpy as np
 import subprocess
+import tempfile
 import threading
 import asyncio
 import gc
+import multiprocessing
+import queue
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from typing import List, Dict, Optional, Tuple
-from PIL import Image
-from moviepy import ImageSequenceClip, AudioFileClip, CompositeAudioClip, AudioArrayClip
-from server.utils.image_effect import ImageEffects
+from moviepy import ImageSequenceClip
+from server.services import segment_worker
+from server.services.preview_service import PreviewGenerator
+from server.utils.render_cache import SegmentRenderCache
+from server.utils.render_manifest import RenderManifest
+from server.utils.frame_store import create_frame_store
+from server.utils.subtitles import SubtitleTrack, filter_path
+from server.utils.soundtrack import ChapterSoundtrack
+from server.utils.media_index import ChapterMediaIndex, list_segments
+from server.utils import encoder_profiles
+from server.utils.metrics import StageMetrics, process_peak_rss_mb, wait_process
 
 logger = logging.getLogger(__name__)
 
+
+class RenderJob:
+    """
+    单个视频渲染任务的状态
+    进度、取消标志都按任务独立保存，多个章节同时渲染时互不干扰
+    """
+
+    def __init__(self, chapter_path: str, settings: Optional[Dict] = None, job_id: Optional[str] = None,
+                 priority: int = 0, project_name: Optional[str] = None, chapter_name: Optional[str] = None):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.chapter_path = chapter_path
+        self.settings = settings or {}
+        self.priority = priority
+        self.project_name = project_name
+        self.chapter_name = chapter_name or os.path.basename(chapter_path)
+        self.status = 'queued'  # queued / running / completed / failed / cancelled
+        self.error: Optional[str] = None
+        self.output_path: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stop_flag = threading.Event()
+        self.lock = threading.Lock()
+        self.progress = 0
+        self.total_segments = 0
+        self.current_task: Optional[str] = None
+        self.rendered_frames = 0
+        self.segment_frames: Dict[str, Tuple[int, int]] = {}
+        self.frame_timing = segment_worker.new_frame_timing()
+        # 各阶段指标（整个任务）与每个片段的阶段指标
+        self.metrics = StageMetrics()
+        self.segment_metrics: Dict[str, Dict] = {}
+        self.cached_segments = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def reset_progress(self, total_segments: int):
+        with self.lock:
+            self.progress = 0
+            self.total_segments = total_segments
+            self.current_task = self.chapter_name
+            self.rendered_frames = 0
+            self.segment_frames = {}
+            self.frame_timing = segment_worker.new_frame_timing()
+            self.segment_metrics = {}
+            self.cached_segments = 0
+        self.metrics = StageMetrics()
+
+    def set_task(self, current_task: str):
+        with self.lock:
+            self.current_task = current_task
+
+    def advance(self, count: int = 1):
+        with self.lock:
+            self.progress += count
+
+    def record_segment(self, subdir: str, stages: Dict[str, Dict], cached: bool = False):
+        """记录片段的阶段指标，并累计到任务指标"""
+        self.metrics.merge(stages)
+        with self.lock:
+            self.segment_metrics[subdir] = {
+                'cached': cached,
+                'wall': round(sum(entry['wall'] for entry in stages.values()), 4),
+                'cpu': round(sum(entry['cpu'] for entry in stages.values()), 4),
+                'stages': stages,
+            }
+            if cached:
+                self.cached_segments += 1
+
+    def record_frame_timing(self, timing: Dict[str, float]):
+        """累计片段的帧耗时统计"""
+        with self.lock:
+            for key, value in timing.items():
+                self.frame_timing[key] += value
+
+    def _frame_timing_summary(self) -> Dict[str, float]:
+        """单帧平均耗时（毫秒），调用方需持有 lock"""
+        frames = max(1, self.frame_timing['frames'])
+        return {
+            'frames': self.frame_timing['frames'],
+            'render_ms': self.frame_timing['render'] * 1000 / frames,
+            'write_ms': self.frame_timing['write'] * 1000 / frames,
+            'dispatch_ms': self.frame_timing['dispatch'] * 1000 / frames,
+        }
+
+    def get_frame_timing(self) -> Dict[str, float]:
+        with self.lock:
+            return self._frame_timing_summary()
+
+    def cancel(self) -> bool:
+        """请求取消；已结束的任务返回 False"""
+        if self.finished:
+            return False
+        self.stop_flag.set()
+        return True
+
+    def get_progress(self, include_segments: bool = False) -> Dict:
+        """
+        任务进度；metrics.stages 为各阶段累计的墙钟时间、CPU 时间（秒，并发片段累加）与峰值内存（MB）
+        include_segments 为 True 时附带每个片段的阶段指标
+        """
+        stages = self.metrics.to_dict()
+        with self.lock:
+            total = max(1, self.total_segments)
+            metrics = {'stages': stages, 'cached_segments': self.cached_segments}
+            if include_segments:
+                metrics['segments'] = dict(self.segment_metrics)
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "project_name": self.project_name,
+                "chapter_name": self.chapter_name,
+                "draft": bool(self.settings.get('draft')),
+                "priority": self.priority,
+                "progress": self.progress,
+                "total": total,
+                "percentage": int((self.progress / total) * 100),
+                "current_task": self.current_task,
+                "rendered_frames": self.rendered_frames,
+                "frame_timing": self._frame_timing_summary(),
+                "metrics": metrics,
+                "output_path": self.output_path,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
 class VideoService:
     """视频生成服务"""
     
@@ -23,191 +167,400 @@ class VideoService:
             'threads': max(2,os.cpu_count()//2),
             'use_cuda': True,
             'codec': 'h264_nvenc',
+            'encoder_profile': 'auto',  # 编码配置档，见 encoder_profiles.ENCODER_PROFILES；auto / fastest
+            'target_bitrate_kbps': None,  # fastest 时只考虑实测码率不超过该值的配置档
             'batch_size': max(2, os.cpu_count()//2),
             'fade_duration': 1,  # 淡入淡出时长（秒）
             'use_pan': True,
             'pan_range': (0.5, 0.5),  # 横向移动原图可用范围的50%，纵向50%
+            'render_mode': 'stream',  # stream: 帧直接管道写入ffmpeg; memory: 全部帧缓存后交给moviepy; ffmpeg: 特效全部由ffmpeg滤镜实现
+            'static_fast_path': True,  # 流式模式下无平移的片段直接由ffmpeg生成
+            'smooth_motion': False,  # 亚像素平移，画面更平滑但每帧多一次混合
+            'frame_format': 'rgb24',  # 流式写入ffmpeg的帧格式；yuv420p: NumPy 转换后写入，管道数据量减半
+            'executor': 'thread',  # thread: 线程池; process: 进程池（仅流式模式），可用满多核
+            'workers': os.cpu_count(),  # 进程池工作进程数
+            'frame_chunk_size': 0,  # 内存模式下每次提交给线程池的帧数，0表示整段一次提交
+            'frame_ram_budget_mb': 1024,  # 内存模式下单个片段的帧内存预算（MB），超出时改用内存映射文件；None 表示不限制
+            'use_cache': True,  # 复用内容未变化的片段，只重新编码有改动的片段
+            'single_pass': False,  # 整章单次编码，片段间使用交叉淡化转场
+            'transition_duration': 0.5,  # 单次编码模式下的转场时长（秒）
+            'draft': False,  # 草稿模式：低分辨率、低帧率、最快编码，输出 video_draft.mp4
+            'draft_scale': 0.5,  # 草稿分辨率比例
+            'draft_fps_scale': 0.5,  # 草稿帧率比例
+            'audio_normalize': True,  # 按片段做响度归一化
+            'audio_target_dbfs': -20.0,  # 归一化目标响度（dBFS）
+            'segment_gap': 0.0,  # 每个片段后追加的静音时长（秒），画面随之延长
+            'background_music': None,  # 背景音乐文件（相对路径相对于章节目录），整章循环铺底
+            'music_volume_db': -18.0,  # 背景音乐相对旁白目标响度的电平（dB）
+            'music_duck_db': -12.0,  # 旁白出现时背景音乐的压低量（dB）
+            'music_duck_attack': 0.2,  # 闪避压低过渡时长（秒），人声开始前即开始压低
+            'music_duck_release': 0.6,  # 人声结束后保持压低的时长（秒）
+            'music_fade': 2.0,  # 背景音乐首尾淡入淡出（秒）
+            'previews': True,  # 渲染时并行生成片段预览（动画 WebP）与章节联系表
+            'preview_workers': 2,  # 预览生成线程数，避免与正式渲染争抢CPU
+            'subtitles': 'soft',  # 字幕（来自各片段 span.txt）：none; soft: 软字幕流; burn: 烧录到画面（需重新编码）
+            'subtitle_word_timing': True,  # 有 TTS 逐词时间时按词对齐字幕
+            'subtitle_max_chars': 18,  # 单条字幕最大字数
+            'subtitle_font': 'Microsoft YaHei',  # 烧录字幕的字体
+            'subtitle_language': 'chi',  # 软字幕流的语言标记
         }
-        self.stop_flag = threading.Event()
         self.cuda_available = self._check_hardware()
-        # 进度追踪
-        self.progress = 0
-        self.total_segments = 0
-        self.current_task = None
-        self.task_lock = threading.Lock()
+        # 最近一次启动的任务，供不带任务ID的旧接口查询进度/取消
+        self.current_job: Optional[RenderJob] = None
 
     def _check_hardware(self) -> bool:
         """检查硬件编码支持"""
-        try:
-            result = subprocess.run(['ffmpeg', '-encoders'], capture_output=True, text=True)
-            cuda_available = 'h264_nvenc' in result.stdout
-     
-            if not cuda_available:
-                logger.warning("NVENC不可用，切换至CPU模式")
-                self.default_settings.update({
-                    'use_cuda': False,
-                })
-            else:
-                logger.info("NVENC可用，使用GPU模式")
-            return cuda_available
-        except Exception as e:
-            logger.error("硬件检测失败: %s", str(e))
-            return False
+        cuda_available = encoder_profiles.is_available('nvenc')
+        if not cuda_available:
+            logger.warning("NVENC不可用，切换至CPU模式")
+            self.default_settings.update({
+                'use_cuda': False,
+            })
+        else:
+            logger.info("NVENC可用，使用GPU模式")
+        return cuda_available
 
-    def _load_resources(self, subdir_path: str, resolution: Tuple[int, int]) -> tuple:
-        """加载图片和音频资源"""
-        image_path = os.path.join(subdir_path, "image.png")
-        audio_path = os.path.join(subdir_path, "audio.mp3")
-
-        # 验证文件有效性
-        for path in [image_path, audio_path]:
-            if not os.path.exists(path):
-                raise FileNotFoundError(f"文件不存在: {path}")
-            if os.path.getsize(path) < 1024:
-                raise ValueError(f"文件过小: {path}")
-
-        # 加载图片
-        with Image.open(image_path) as img:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            image=img.copy()
-            # image = img.resize(resolution, Image.LANCZOS)
-
-        # 加载音频
-        audio = AudioFileClip(audio_path)
-        if audio.duration is None or audio.duration < 0.05:
-            audio.close()  # 释放文件句柄
-            raise ValueError(f"音频文件时长过短或无效: {audio_path}")
-            
-        return image, audio
-
-    async def _process_segment(self, subdir: str, temp_dir: str, settings: Dict) -> Optional[Tuple[str, str]]:
-        """处理单个视频片段"""
-        # 增加subdir，进一步确保唯一性
-        temp_file = os.path.join(temp_dir, f"vid_{subdir}_{os.getpid()}.mp4")
-        temp_audio_path = os.path.join(
-            os.path.dirname(temp_file), 
-            f"temp_audio_{subdir}_{os.getpid()}_{time.time_ns()}.m4a"
+    async def _process_segment(self, job: RenderJob, subdir: str, settings: Dict, manifest: RenderManifest,
+                               executor=None, stop_event=None, progress_queue=None,
+                               cache: Optional[SegmentRenderCache] = None) -> Optional[str]:
+        """
+        处理单个视频片段（仅视频流），返回片段视频路径
+        优先复用渲染缓存，其次复用渲染清单中上次中断前已完成的片段；
+        草稿与成片的清单各自独立（工作目录不同），片段文件名由清单决定
+        """
+        loop = asyncio.get_running_loop()
+        segment_metrics = StageMetrics()
+        # 渲染清单与缓存使用同一个片段键（内容哈希 + 特效/编码设置）
+        keys = cache if cache is not None else SegmentRenderCache(settings['chapter_path'])
+        segment_key = await loop.run_in_executor(
+            None, self._measured(segment_metrics, 'plan', keys.segment_key,
+                                 subdir, settings, self._video_codec_params(settings))
         )
+        reused_path = cache.lookup(subdir, segment_key) if cache is not None else None
+        if reused_path:
+            logger.info("片段 %s 命中渲染缓存", subdir)
+        else:
+            reused_path = manifest.lookup(subdir, segment_key)
+            if reused_path:
+                logger.info("片段 %s 已在上次渲染中完成，直接复用", subdir)
+        if reused_path:
+            manifest.record_segment(subdir, segment_key, reused_path)
+            job.advance()
+            job.record_segment(subdir, segment_metrics.to_dict(), cached=True)
+            return reused_path
+        job.metrics.merge(segment_metrics.to_dict())
+
+        # 固定文件名，服务重启后仍能按清单找到
+        output_path = manifest.segment_output_path(subdir)
+        video_path = await self._render_segment(job, subdir, output_path, settings,
+                                                executor, stop_event, progress_queue)
+        if video_path and cache is not None:
+            video_path = cache.store(subdir, segment_key, video_path)
+        if video_path:
+            manifest.record_segment(subdir, segment_key, video_path)
+        return video_path
+
+    async def _render_segment(self, job: RenderJob, subdir: str, temp_file: str, settings: Dict,
+                              executor=None, stop_event=None, progress_queue=None) -> Optional[str]:
+        """渲染单个视频片段到 temp_file"""
+        loop = asyncio.get_running_loop()
+
+        render_mode = settings.get('render_mode', 'stream')
+        if render_mode in ('stream', 'ffmpeg'):
+            # 无平移的静态片段或 ffmpeg 模式直接由ffmpeg滤镜生成，不经过Python逐帧渲染
+            if render_mode == 'ffmpeg' or (
+                settings.get('static_fast_path', True) and not segment_worker.has_motion(settings)
+            ):
+                render_func = segment_worker.render_segment_ffmpeg
+            else:
+                render_func = segment_worker.render_segment
+            # 加载、渲染、编码作为一个整体交给执行器（线程池或进程池）
+            result = await loop.run_in_executor(
+                executor,
+                partial(
+                    render_func, subdir, temp_file, settings,
+                    self._video_codec_params(settings),
+                    stop_event if stop_event is not None else job.stop_flag, progress_queue,
+                    time.time()
+                )
+            )
+            if not result:
+                return None
+            job.advance()
+            job.record_frame_timing(result['timing'])
+            job.record_segment(subdir, result['metrics'])
+            return temp_file
+
         start_time = time.time()
-        frames = []
+        frames = None
         image = None
-        audio = None
+        segment_metrics = StageMetrics()
 
         try:
             # 在线程中加载资源
-            loop = asyncio.get_running_loop()
-            image, audio = await loop.run_in_executor(
-                None, 
-                lambda: self._load_resources(os.path.join(settings['chapter_path'], subdir), settings['resolution'])
+            subdir_path = os.path.join(settings['chapter_path'], subdir)
+            image = await loop.run_in_executor(
+                None, self._measured(segment_metrics, 'load', segment_worker.load_segment_image, subdir_path)
             )
             
-            duration = audio.duration
+            duration = segment_worker.segment_duration(settings, subdir)
             total_frames = int(duration * settings['fps'])
             if total_frames == 0:
                 raise ValueError(f"计算的总帧数为0，视频时长过短。 Subdir: {subdir}")
 
             # 批量生成帧
-            for i in range(total_frames):
-                if self.stop_flag.is_set():
+            renderer = await loop.run_in_executor(
+                None,
+                self._measured(segment_metrics, 'load', segment_worker.create_renderer,
+                               image, duration, settings, subdir)
+            )
+            # 帧数据超过内存预算时写入片段输出目录下的内存映射文件，不占用进程堆
+            frames = create_frame_store(total_frames, tuple(settings['resolution']), os.path.dirname(temp_file),
+                                        settings.get('frame_ram_budget_mb'), f"frames_{subdir}")
+            # 按块提交，整段（或每N帧）只调度一次
+            chunk_size = settings.get('frame_chunk_size') or total_frames
+            timing = segment_worker.new_frame_timing()
+            for start in range(0, total_frames, chunk_size):
+                if job.stop_flag.is_set():
                     break
-                # 线程处理图像
-                frame = await loop.run_in_executor(
+                count = min(chunk_size, total_frames - start)
+                dispatched_at = time.perf_counter()
+                _, compute_time = await loop.run_in_executor(
                     None,
-                    lambda: self._apply_effects(image.copy(), i/settings['fps'], duration, settings, subdir)
+                    self._measured(segment_metrics, 'render', segment_worker.render_frames_into,
+                                   frames, renderer, start, count, settings['fps'], job.stop_flag)
                 )
-                frames.append(np.array(frame))
-                frame.close()
+                timing['render'] += compute_time
+                timing['dispatch'] += time.perf_counter() - dispatched_at - compute_time
+            if job.stop_flag.is_set() or len(frames) < total_frames:
+                # 不完整的片段不能编码，否则会被当作完成的片段写入缓存和渲染清单
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                logger.info("片段 %s 渲染中断（%d/%d 帧）", subdir, len(frames), total_frames)
+                raise ValueError("视频生成被用户取消")
+            timing['frames'] = len(frames)
 
             # 写入视频
+            write_start = time.perf_counter()
+            # moviepy 内部启动的 ffmpeg 无法单独统计，编码 CPU 只包含本进程线程
             await loop.run_in_executor(
                 None,
-                lambda: self._write_temp_video(frames, audio, temp_file, temp_audio_path, settings)
+                self._measured(segment_metrics, 'encode', self._write_temp_video, frames.frames(), temp_file, settings)
             )
+            timing['write'] = time.perf_counter() - write_start
             
             logger.info("完成片段 %s | 耗时: %.1fs | 大小: %.1fMB", 
                        subdir, time.time()-start_time, os.path.getsize(temp_file)/1024/1024)
             
             # 更新进度
-            with self.task_lock:
-                self.progress += 1
+            job.advance()
+            job.record_frame_timing(timing)
+            job.record_segment(subdir, segment_metrics.to_dict())
                 
-            return temp_file, temp_audio_path
+            return temp_file
 
         finally:
             # 只释放内存资源，不再处理文件删除
             if image:
                 image.close()
-            if audio:
-                audio.close()
+            if frames is not None:
+                frames.close()
             del frames
             gc.collect()
 
-    def _write_temp_video(self, frames: list, audio: AudioFileClip, output_path: str, temp_audio_path: str, settings: Dict):
+    def _write_temp_video(self, frames: list, output_path: str, settings: Dict):
         """
-        安全写入视频片段
-        使用临时文件来暂存，避免内存占用过高
+        写入视频片段（仅视频流）
+        音频由章节音轨统一编码，合并时再混流
         """
         with ImageSequenceClip(frames, fps=settings['fps']) as video_clip:
-            # 使用 .with_duration() 来精确、安全地对齐音视频时长
-            # 这会优雅地处理时长不匹配问题，无论是填充静音还是截断
-            final_audio = audio.with_duration(video_clip.duration)
-
-            # 绑定音频
-            final_clip = video_clip.with_audio(final_audio)
-
             # 设置编码参数
-            ffmpeg_params = []
-            if settings.get('use_cuda', False) and self.cuda_available:
-                ffmpeg_params.extend(['-c:v', 'h264_nvenc', '-preset', 'medium', '-gpu', '0'])
-            else:
-                ffmpeg_params.extend(['-c:v', 'libx264', '-preset', 'medium', '-crf', '23'])
+            ffmpeg_params = self._video_codec_params(settings)
 
             # 写入文件
-            final_clip.write_videofile(
+            video_clip.write_videofile(
                 output_path,
                 codec=None,
-                audio_codec='aac',
-                temp_audiofile=temp_audio_path, # 明确指定临时音频文件路径
+                audio=False,
                 threads=settings.get('threads', 4),
                 ffmpeg_params=ffmpeg_params,
                 logger=None
             )
 
-    async def generate_video(self, chapter_path: str, video_settings: Dict = None) -> str:
-        """生成视频主流程"""
+    @staticmethod
+    def _measured(metrics: StageMetrics, stage: str, func, *args):
+        """包装为在执行器线程中运行并记录阶段指标的调用"""
+        def run():
+            with metrics.measure(stage):
+                return func(*args)
+        return run
+
+    def _video_codec_params(self, settings: Dict) -> List[str]:
+        """视频编码参数（由编码配置档决定）"""
+        _, profile = encoder_profiles.resolve_profile(
+            settings.get('encoder_profile'), settings.get('use_cuda', False) and self.cuda_available
+        )
+        return list(profile['params'])
+
+    def _apply_draft_settings(self, settings: Dict) -> None:
+        """
+        草稿模式：按比例降低分辨率和帧率，使用最快的编码配置档
+        片段时长仍由音频决定，与成片的节奏一致
+        """
+        settings['resolution'] = encoder_profiles.scaled_resolution(
+            settings['resolution'], settings.get('draft_scale', 0.5)
+        )
+        settings['fps'] = max(1, settings['fps'] * settings.get('draft_fps_scale', 0.5))
+        if settings.get('encoder_profile') in (None, 'auto'):
+            settings['encoder_profile'] = 'fast_preview'
+        # 草稿只做预览，平滑平移的额外混合没有意义
+        settings['smooth_motion'] = False
+
+    def _apply_encoder_profile(self, settings: Dict) -> None:
+        """
+        解析本次任务使用的编码配置档，并应用其分辨率缩放（草稿模式的分辨率已单独缩放）
+        fastest 只在成片时排除降分辨率的配置档：草稿不应用配置档的缩放，可以放心选用
+        """
+        requested = settings.get('encoder_profile')
+        if requested == 'fastest':
+            requested = encoder_profiles.pick_fastest_profile(
+                settings.get('target_bitrate_kbps'), full_resolution=not settings.get('draft')
+            ) or 'auto'
+        name, profile = encoder_profiles.resolve_profile(
+            requested, settings.get('use_cuda', False) and self.cuda_available
+        )
+        settings['encoder_profile'] = name
+        scale = profile.get('resolution_scale', 1.0)
+        if scale != 1.0 and not settings.get('draft'):
+            settings['resolution'] = encoder_profiles.scaled_resolution(settings['resolution'], scale)
+        logger.info("编码配置: %s | 分辨率: %s", name, settings['resolution'])
+
+    @staticmethod
+    def output_filename(settings: Optional[Dict] = None) -> str:
+        """成片输出 video.mp4，草稿输出 video_draft.mp4"""
+        return "video_draft.mp4" if settings and settings.get('draft') else "video.mp4"
+
+    async def generate_video(self, chapter_path: str, video_settings: Dict = None,
+                             job: Optional[RenderJob] = None) -> str:
+        """
+        生成视频主流程
+        job 为空时新建一个任务；进度与取消都作用于该任务
+        """
         chapter_path = os.path.abspath(chapter_path)
-        self.stop_flag.clear()
+        if job is None:
+            job = RenderJob(chapter_path, video_settings)
+        self.current_job = job
         final_settings = {**self.default_settings, **(video_settings or {})}
         
         final_settings['chapter_path'] = chapter_path
-        output_path = os.path.join(chapter_path, "video.mp4")
+        if final_settings.get('draft'):
+            self._apply_draft_settings(final_settings)
+        self._apply_encoder_profile(final_settings)
+        output_path = os.path.join(chapter_path, self.output_filename(final_settings))
+        # 渲染清单：记录已完成的片段，服务重启或重试时从第一个缺失的片段继续
+        manifest = RenderManifest(chapter_path, 'draft' if final_settings.get('draft') else None)
+        manifest.mark_running(job.job_id, video_settings or {})
+        os.makedirs(manifest.work_dir, exist_ok=True)
+        audio_path = os.path.join(manifest.work_dir, f"audio_{job.job_id}.m4a")
         temp_video_files = []
-        all_temp_files = []
+        all_temp_files = [audio_path]
+        audio_task = None
+        preview_task = None
+        previews = None
+        process_pool = None
+        manager = None
+        progress_thread = None
+        progress_queue = None
+        stop_event = None
    
         try:
             # 获取待处理片段列表
-            subdirs = sorted([
-                d for d in os.listdir(chapter_path)
-                if os.path.isdir(os.path.join(chapter_path, d)) and d.isdigit()
-            ], key=lambda x: int(x))
+            # 初始化进度信息
+            job.reset_progress(0)
+            plan_start = time.perf_counter()
+            subdirs = list_segments(chapter_path)
             
             if not subdirs:
                 raise ValueError("无有效视频片段")
 
-            # 初始化进度信息
-            with self.task_lock:
-                self.progress = 0
-                self.total_segments = len(subdirs)
-                self.current_task = f"{os.path.basename(chapter_path)}"
+            cache = None
+            if final_settings.get('use_cache', True):
+                cache = SegmentRenderCache(chapter_path, 'draft' if final_settings.get('draft') else None)
+                cache.prune(subdirs)
+
+            with job.lock:
+                job.total_segments = len(subdirs)
           
-            logger.info("发现 %d 个待处理片段", len(subdirs))
+            logger.info("发现 %d 个待处理片段，渲染清单中已完成 %d 个",
+                        len(subdirs), len(manifest.completed_segments()))
+
+            # 规划：片段时长取自章节媒体索引（未变化的文件不再读取）
+            loop = asyncio.get_running_loop()
+            durations = await loop.run_in_executor(
+                None, ChapterMediaIndex(chapter_path).segment_durations, subdirs
+            )
+            job.metrics.add('plan', time.perf_counter() - plan_start, peak_rss_mb=process_peak_rss_mb())
+            gap = final_settings.get('segment_gap') or 0
+            final_settings['segment_durations'] = {subdir: d + gap for subdir, d in durations.items()}
+
+            # 字幕：与成片同名的 SRT 旁路文件，合并时混流或烧录
+            subtitle_path = await loop.run_in_executor(
+                None, self._prepare_subtitles, chapter_path, subdirs, final_settings, durations,
+                output_path, manifest.work_dir
+            )
+
+            # 章节音轨：所有音频只解码一次，解码与 AAC 编码在后台与视频渲染并行进行，合并时一次混流
+            soundtrack = ChapterSoundtrack.for_chapter(chapter_path, subdirs, final_settings)
+            audio_task = loop.run_in_executor(None, soundtrack.build, audio_path)
+            if final_settings.get('previews'):
+                # 预览作为旁路任务与视频渲染并行，失败不影响成片
+                previews = PreviewGenerator(chapter_path)
+                preview_task = loop.run_in_executor(
+                    None, previews.generate, subdirs, final_settings, job.stop_flag,
+                    final_settings.get('preview_workers')
+                )
+
+            batch_size = final_settings.get('batch_size', 8)
+            single_pass = bool(final_settings.get('single_pass'))
+            if (final_settings.get('executor') == 'process' and not single_pass
+                    and final_settings.get('render_mode', 'stream') != 'memory'):
+                # 进程池：每个片段在独立进程中渲染编码，避免GIL争用
+                workers = max(1, int(final_settings.get('workers') or os.cpu_count()))
+                if 'threads' not in (video_settings or {}):
+                    final_settings['threads'] = max(1, os.cpu_count() // workers)
+                ctx = multiprocessing.get_context('spawn')
+                manager = ctx.Manager()
+                stop_event = manager.Event()
+                progress_queue = manager.Queue()
+                process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+                # 由进程池控制并发，一次性提交所有片段
+                batch_size = len(subdirs)
+                logger.info("使用进程池渲染，工作进程数: %d", workers)
+            else:
+                if final_settings.get('executor') == 'process':
+                    logger.warning("进程池不支持内存渲染或整章单次编码模式，回退到线程池")
+                progress_queue = queue.Queue()
+            progress_thread = threading.Thread(
+                target=self._consume_progress, args=(job, progress_queue, stop_event, single_pass), daemon=True
+            )
+            progress_thread.start()
+
+            if single_pass:
+                # 整章单次编码，不产生片段文件，也不需要合并
+                result = await self._render_single_pass(job, subdirs, output_path, final_settings,
+                                                        progress_queue, audio_task, soundtrack, manifest,
+                                                        subtitle_path)
+                manifest.finish('completed', output_path)
+                return result
             
             # 分批处理片段
-            batch_size = final_settings.get('batch_size', 8)
             for i in range(0, len(subdirs), batch_size):
                 batch = subdirs[i:i+batch_size]
-                tasks = [self._process_segment(subdir, chapter_path, final_settings) for subdir in batch]
+                tasks = [
+                    self._process_segment(job, subdir, final_settings, manifest,
+                                          process_pool, stop_event, progress_queue, cache)
+                    for subdir in batch
+                ]
                 
                 # 等待当前批次完成，即使有异常也继续
                 batch_results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -217,12 +570,11 @@ class VideoService:
                     if isinstance(result, Exception):
                         logger.error("一个视频片段处理失败: %s", result)
                     elif result:
-                        video_path, audio_path = result
-                        temp_video_files.append(video_path)
-                        all_temp_files.extend([video_path, audio_path])
+                        # 片段文件由渲染清单管理，整章完成后才删除
+                        temp_video_files.append(result)
                 
                 # 检查是否取消
-                if self.stop_flag.is_set():
+                if job.stop_flag.is_set():
                     # 在finally中统一处理清理
                     logger.info("视频生成被用户取消")
                     raise ValueError("视频生成被用户取消")
@@ -236,39 +588,137 @@ class VideoService:
                 raise ValueError("没有生成有效视频片段")
                 
             # 更新进度状态为合并阶段
-            with self.task_lock:
-                self.current_task = "合并视频中"
+            job.set_task("合并视频中")
             
             # 执行合并
-            loop = asyncio.get_running_loop()
+            await audio_task
+            job.metrics.merge(soundtrack.metrics.to_dict())
             result = await loop.run_in_executor(
                 None,
-                lambda: self._merge_videos(temp_video_files, output_path, final_settings)
+                self._measured(job.metrics, 'concat', self._merge_videos,
+                               temp_video_files, output_path, final_settings, audio_path, job.metrics,
+                               subtitle_path)
             )
             
             # 标记完成
-            with self.task_lock:
-                self.current_task = "已完成"
-                self.progress = self.total_segments
+            manifest.finish('completed', result)
+            self._mark_completed(job)
+            self._record_encoder_throughput(job, final_settings)
                 
             return result
 
         except Exception as e:
             logger.error("视频生成失败: %s", str(e))
+            # 保留已完成片段，重试时从第一个缺失的片段继续
+            manifest.finish('cancelled' if job.stop_flag.is_set() else 'failed', error=str(e))
             raise
         finally:
+            if progress_thread:
+                progress_queue.put(None)
+                progress_thread.join(timeout=5)
+            if process_pool:
+                process_pool.shutdown(wait=True, cancel_futures=True)
+            if manager:
+                manager.shutdown()
+            if audio_task is not None:
+                # 出错或取消时也要等音轨编码结束再清理文件
+                await asyncio.gather(audio_task, return_exceptions=True)
+            if preview_task is not None:
+                preview_result, = await asyncio.gather(preview_task, return_exceptions=True)
+                if isinstance(preview_result, Exception):
+                    logger.warning("章节预览生成失败: %s", preview_result)
+                job.metrics.merge(previews.metrics.to_dict())
             # 清理临时文件
             if all_temp_files:
                 loop = asyncio.get_running_loop()
-                await loop.run_in_executor(None, self._cleanup_temp_files, all_temp_files)
+                await loop.run_in_executor(
+                    None, self._measured(job.metrics, 'cleanup', self._cleanup_temp_files, all_temp_files)
+                )
+
+    async def generate_previews(self, chapter_path: str, video_settings: Dict = None) -> Dict:
+        """单独生成章节预览（不渲染成片），内容未变化的片段直接复用"""
+        chapter_path = os.path.abspath(chapter_path)
+        settings = {**self.default_settings, **(video_settings or {}), 'chapter_path': chapter_path}
+        subdirs = list_segments(chapter_path)
+        if not subdirs:
+            raise ValueError("无有效视频片段")
+        loop = asyncio.get_running_loop()
+        durations = await loop.run_in_executor(None, ChapterMediaIndex(chapter_path).segment_durations, subdirs)
+        gap = settings.get('segment_gap') or 0
+        settings['segment_durations'] = {subdir: d + gap for subdir, d in durations.items()}
+        return await loop.run_in_executor(None, PreviewGenerator(chapter_path).generate, subdirs, settings)
+
+    async def _render_single_pass(self, job: RenderJob, subdirs: List[str], output_path: str,
+                                  settings: Dict, progress_queue, audio_task, soundtrack: ChapterSoundtrack,
+                                  manifest: RenderManifest, subtitle_path: Optional[str] = None) -> str:
+        """
+        整章单次编码：一个编码器、片段间交叉淡化，完成后与章节音轨混流
+        没有片段文件，中断后只能整章重新编码
+        """
+        job.set_task("整章单次编码中")
+        temp_video_path = os.path.join(manifest.work_dir, f"video_{job.job_id}{os.path.splitext(output_path)[1]}")
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                None,
+                partial(segment_worker.render_timeline, subdirs, temp_video_path, settings,
+                        self._video_codec_params(settings), job.stop_flag, progress_queue)
+            )
+            if not result:
+                logger.info("视频生成被用户取消")
+                raise ValueError("视频生成被用户取消")
+            job.metrics.merge(result['metrics'])
+            audio_path = await audio_task
+            job.metrics.merge(soundtrack.metrics.to_dict())
+            await loop.run_in_executor(
+                None,
+                self._measured(job.metrics, 'concat', self._merge_videos,
+                               [temp_video_path], output_path, settings, audio_path, job.metrics, subtitle_path)
+            )
+        finally:
+            if os.path.exists(temp_video_path):
+                os.remove(temp_video_path)
+
+        job.record_frame_timing(result['timing'])
+        self._mark_completed(job)
+        self._record_encoder_throughput(job, settings)
+        logger.info("视频生成成功: %s", output_path)
+        return output_path
+
+    def _prepare_subtitles(self, chapter_path: str, subdirs: List[str], settings: Dict,
+                           audio_durations: Dict[str, float], output_path: str, work_dir: str) -> Optional[str]:
+        """
+        生成章节字幕，返回合并时使用的字幕文件；没有字幕文本或未启用时返回 None
+        SRT 与成片同名保存（video.srt），烧录时另外在工作目录生成带样式的 ASS
+        """
+        mode = settings.get('subtitles') or 'none'
+        if mode == 'none':
+            return None
+        track = SubtitleTrack.for_chapter(chapter_path, subdirs, settings, audio_durations)
+        if not track.cues:
+            logger.info("章节没有字幕文本（span.txt），跳过字幕")
+            return None
+        srt_path = track.write_srt(f"{os.path.splitext(output_path)[0]}.srt")
+        logger.info("生成字幕 %d 条: %s", len(track.cues), srt_path)
+        if mode == 'burn':
+            return track.write_ass(os.path.join(work_dir, 'subtitles.ass'), tuple(settings['resolution']),
+                                   settings.get('subtitle_font') or 'Microsoft YaHei')
+        return srt_path
 
-    def _merge_videos(self, temp_files: List[str], output_path: str, settings: Dict) -> str:
-        """合并视频片段"""
-        concat_list = os.path.join(os.path.dirname(output_path), "concat.txt")
+    def _merge_videos(self, temp_files: List[str], output_path: str, settings: Dict,
+                      audio_path: Optional[str] = None, metrics: Optional[StageMetrics] = None,
+                      subtitle_path: Optional[str] = None) -> str:
+        """
+        合并视频片段，并混入章节音轨与字幕
+        音视频均直接复制不重新编码，字幕作为软字幕流写入；
+        字幕烧录（subtitles 为 burn）时视频经一次 ass 滤镜重新编码，音频仍直接复制
+        """
+        root, ext = os.path.splitext(output_path)
+        concat_list = f"{root}.concat.txt"
         # 写入到一个临时文件，避免在合并过程中被读取
         # 通过在扩展名前插入标记来创建临时文件名，保留原始扩展名
-        root, ext = os.path.splitext(output_path)
         temp_output_path = f"{root}.tmp_{os.getpid()}{ext}"
+        burn_in = bool(subtitle_path) and settings.get('subtitles') == 'burn'
        
         try:
             # 生成合并列表
@@ -283,15 +733,36 @@ class VideoService:
                 '-f', 'concat',
                 '-safe', '0',
                 '-i', concat_list,
-                '-c', 'copy',
-                '-movflags', '+faststart',
-                '-y', temp_output_path
             ]
-            if settings.get('use_cuda', False) and self.cuda_available:
+            maps = ['-map', '0:v:0']
+            if audio_path:
+                cmd.extend(['-i', audio_path])
+                maps.extend(['-map', f'{len(maps) // 2}:a:0'])
+            if subtitle_path and not burn_in:
+                cmd.extend(['-i', subtitle_path])
+                maps.extend(['-map', f'{len(maps) // 2}:s:0'])
+            cmd.extend(maps)
+            if burn_in:
+                cmd.extend(['-vf', f"ass={filter_path(subtitle_path)}", *self._video_codec_params(settings),
+                            '-pix_fmt', 'yuv420p', '-c:a', 'copy'])
+            else:
+                cmd.extend(['-c', 'copy'])
+                if subtitle_path:
+                    cmd.extend(['-c:s', 'mov_text',
+                                '-metadata:s:s:0', f"language={settings.get('subtitle_language') or 'chi'}"])
+            cmd.extend(['-movflags', '+faststart', '-y', temp_output_path])
+            if settings.get('use_cuda', False) and self.cuda_available and not burn_in:
                 cmd[1:1] = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
       
             # 执行命令
-            subprocess.run(cmd, check=True, capture_output=True)
+            with tempfile.TemporaryFile() as stderr_file:
+                proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr_file)
+                usage = wait_process(proc)
+                if metrics is not None:
+                    metrics.add_process('concat', usage)
+                if proc.returncode != 0:
+                    stderr_file.seek(0)
+                    raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr_file.read())
             
             # 原子化地替换/重命名文件
             os.replace(temp_output_path, output_path)
@@ -313,41 +784,66 @@ class VideoService:
             if os.path.exists(temp_output_path):
                 os.remove(temp_output_path)
 
-    def _apply_effects(self, image: Image.Image, time_val: float, 
-                      duration: float, settings: Dict, subdir: str) -> Image.Image:
-        """应用视频特效"""
-        try:
-            effect_params = {
-                'output_size': settings.get('resolution', self.default_settings['resolution']),
-                'fade_duration': settings.get('fade_duration', 1.0),
-                'use_pan': settings.get('use_pan', True),
-                'pan_range': settings.get('pan_range', (0.5, 0)),
-                'segment_index': int(subdir) if subdir.isdigit() else 0
-            }
-            
-            return ImageEffects.apply_effects(
-                image, time_val, duration, effect_params
-            )
-        except Exception as e:
-            logger.error("特效处理失败: %s", str(e))
-            raise
+    def _consume_progress(self, job: RenderJob, progress_queue, stop_event=None, track_segments: bool = False):
+        """
+        汇总执行器回传的帧进度，直到收到 None
+        进程池模式下同时把取消标志转发给工作进程
+        track_segments 为 True 时（整章单次编码）按帧进度统计已完成片段数
+        """
+        while True:
+            if stop_event is not None and job.stop_flag.is_set() and not stop_event.is_set():
+                stop_event.set()
+            try:
+                item = progress_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if item is None:
+                break
+            subdir, done, total = item
+            with job.lock:
+                previous, _ = job.segment_frames.get(subdir, (0, total))
+                job.rendered_frames += done - previous
+                job.segment_frames[subdir] = (done, total)
+                if track_segments and done >= total > previous:
+                    job.progress += 1
+
+    @staticmethod
+    def _mark_completed(job: RenderJob):
+        with job.lock:
+            job.current_task = "已完成"
+            job.progress = job.total_segments
+
+    def _record_encoder_throughput(self, job: RenderJob, settings: Dict):
+        """把本次渲染的实测编码吞吐（单个编码器实例）记入配置档统计"""
+        with job.lock:
+            frames = job.frame_timing['frames']
+            write_seconds = job.frame_timing['write']
+        encoder_profiles.record_throughput(settings['encoder_profile'], frames, write_seconds, settings['resolution'])
+
+    def get_frame_timing(self) -> Dict[str, float]:
+        """最近一次任务的单帧平均耗时（毫秒），用于对比不同调度方式的开销"""
+        if self.current_job is None:
+            return RenderJob('')._frame_timing_summary()
+        return self.current_job.get_frame_timing()
 
     def get_progress(self) -> Dict:
-        """获取当前视频生成进度"""
-        with self.task_lock:
-            total = max(1, self.total_segments)
-            percentage = int((self.progress / total) * 100)
+        """获取最近一次任务的视频生成进度"""
+        if self.current_job is None:
             return {
-                "progress": self.progress,
-                "total": total,
-                "percentage": percentage,
-                "current_task": self.current_task
+                "progress": 0,
+                "total": 1,
+                "percentage": 0,
+                "current_task": None,
+                "rendered_frames": 0,
+                "frame_timing": RenderJob('')._frame_timing_summary(),
             }
+        return self.current_job.get_progress()
             
     def cancel_generation(self) -> bool:
-        """取消视频生成"""
-        self.stop_flag.set()
-        return True
+        """取消最近一次任务"""
+        return self.current_job.cancel() if self.current_job else False
 
     def _cleanup_temp_files(self, files: List[str]):
         """Robustly cleans up temporary files, with retries for locked files."""
@@ -0,0 +1,62 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from server.utils.colorspace import rgb_to_yuv420p, yuv420p_frame_size
+
+WIDTH, HEIGHT = 64, 36
+
+
+def noise_frame(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+
+def gradient_frame() -> np.ndarray:
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    return np.stack([x * 4, y * 7, (x + y) * 2], axis=-1).astype(np.uint8)
+
+
+def ffmpeg_yuv420p(frame: np.ndarray) -> np.ndarray:
+    output = subprocess.run([
+        'ffmpeg', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{WIDTH}x{HEIGHT}',
+        '-i', '-', '-pix_fmt', 'yuv420p', '-f', 'rawvideo', '-',
+    ], input=frame.tobytes(), capture_output=True, check=True).stdout
+    return np.frombuffer(output, dtype=np.uint8)
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='需要 ffmpeg')
+def test_matches_ffmpeg_swscale():
+    luma_size = WIDTH * HEIGHT
+    # 亮度与 swscale 逐像素相同
+    for frame in (noise_frame(), gradient_frame()):
+        ours, reference = rgb_to_yuv420p(frame), ffmpeg_yuv420p(frame)
+        assert ours.shape == reference.shape
+        assert np.array_equal(ours[:luma_size], reference[:luma_size])
+    # 色度取 2x2 均值，与 swscale 的滤波在平滑画面上最多相差 1
+    frame = gradient_frame()
+    difference = np.abs(rgb_to_yuv420p(frame).astype(int) - ffmpeg_yuv420p(frame).astype(int))[luma_size:]
+    assert difference.max() <= 1
+
+
+def test_batch_matches_single_frames_and_reuses_buffer():
+    frames = np.stack([noise_frame(seed) for seed in range(3)])
+    out = np.empty(3 * yuv420p_frame_size(WIDTH, HEIGHT), dtype=np.uint8)
+    batch = rgb_to_yuv420p(frames, out)
+    assert batch.shape == (3, yuv420p_frame_size(WIDTH, HEIGHT))
+    assert np.shares_memory(batch, out)
+    for frame, converted in zip(frames, batch):
+        assert np.array_equal(rgb_to_yuv420p(frame), converted)
+
+
+def test_known_colors():
+    frame = np.zeros((2, 2, 3), dtype=np.uint8)
+    assert list(rgb_to_yuv420p(frame)) == [16] * 4 + [128, 128]
+    frame[:] = 255
+    assert list(rgb_to_yuv420p(frame)) == [235] * 4 + [128, 128]
+
+
+def test_rejects_odd_sizes():
+    with pytest.raises(ValueError):
+        rgb_to_yuv420p(np.zeros((3, 4, 3), dtype=np.uint8))
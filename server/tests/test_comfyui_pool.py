@@ -0,0 +1,97 @@
+import asyncio
+
+import httpx
+import pytest
+
+from server.utils.comfyui_pool import BackendError, ComfyUIBackendPool, DEFAULT_IMAGE_SECONDS
+
+URLS = ['http://a:8188', 'http://b:8188', 'http://c:8188']
+
+
+def make_pool(handler=None) -> ComfyUIBackendPool:
+    handler = handler or (lambda request: httpx.Response(200, json={'queue_running': [], 'queue_pending': []}))
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return ComfyUIBackendPool(URLS, 'client', http)
+
+
+def test_deduplicates_urls():
+    async def scenario():
+        pool = ComfyUIBackendPool(['http://a:8188/', 'http://a:8188', '', 'http://b:8188'], 'client',
+                                  httpx.AsyncClient())
+        assert [backend.url for backend in pool.backends] == URLS[:2]
+        with pytest.raises(ValueError):
+            ComfyUIBackendPool([''], 'client', pool.http)
+
+    asyncio.run(scenario())
+
+
+def test_acquire_picks_shortest_estimated_wait():
+    async def scenario():
+        pool = make_pool()
+        a, b, c = pool.backends
+        # 无耗时记录时按队列长度分配，同等条件下依次轮到各后端
+        assert [await pool.acquire() for _ in range(3)] == [a, b, c]
+        assert [backend.inflight for backend in pool.backends] == [1, 1, 1]
+        # 实测更快的后端即使队列更长也优先
+        a.average_seconds, b.average_seconds, c.average_seconds = 2.0, 10.0, 10.0
+        assert await pool.acquire() is a
+        assert a.estimated_wait() == 3 * 2.0
+        # 其他客户端提交的任务（queue_remaining）同样计入
+        c.average_seconds = None
+        c.queue_remaining = 5
+        assert c.estimated_wait() == 6 * DEFAULT_IMAGE_SECONDS
+        assert await pool.acquire(exclude=[a]) is b
+
+    asyncio.run(scenario())
+
+
+def test_release_updates_statistics():
+    async def scenario():
+        pool = make_pool()
+        backend = await pool.acquire()
+        pool.release(backend, seconds=10.0)
+        assert (backend.inflight, backend.completed, backend.average_seconds) == (0, 1, 10.0)
+        await pool.acquire()
+        pool.release(backend, seconds=20.0)
+        assert backend.average_seconds == pytest.approx(13.0)
+        assert backend.busy_seconds == 30.0
+        await pool.acquire()
+        pool.release(backend, success=False)
+        assert (backend.inflight, backend.completed, backend.failed) == (0, 2, 1)
+        # 多余的 release 不会让名额变成负数
+        pool.release(backend, success=False)
+        assert backend.inflight == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_backend_skipped_until_recheck():
+    down = {'http://a:8188'}
+
+    def handler(request):
+        if f"{request.url.scheme}://{request.url.host}:{request.url.port}" in down:
+            raise httpx.ConnectError('refused', request=request)
+        return httpx.Response(200, json={'queue_running': [[0, 'x']], 'queue_pending': []})
+
+    async def scenario():
+        pool = make_pool(handler)
+        a, b, c = pool.backends
+        pool.mark_failed(a, 'boom')
+        assert not a.healthy and a.last_error == 'boom'
+        assert a not in [await pool.acquire() for _ in range(4)]
+        # 全部不可用时立即重新检查，恢复的后端可以继续派发
+        for backend in pool.backends:
+            pool.mark_failed(backend, 'boom')
+        assert await pool.acquire() in (b, c)
+        assert not a.healthy and b.healthy and c.healthy
+        assert b.queue_remaining == 1
+        # 重新检查仍然没有可用后端
+        down.update(URLS)
+        for backend in pool.backends:
+            pool.mark_failed(backend, 'boom')
+        with pytest.raises(BackendError):
+            await pool.acquire()
+        with pytest.raises(BackendError):
+            await pool.acquire(exclude=[b, c])
+
+    asyncio.run(scenario())
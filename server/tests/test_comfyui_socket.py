@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from server.utils import comfyui_socket
+from server.utils.comfyui_socket import ComfyUISocket
+
+
+def message(message_type: str, prompt_id: str = None, **data) -> str:
+    if prompt_id is not None:
+        data['prompt_id'] = prompt_id
+    return json.dumps({'type': message_type, 'data': data})
+
+
+def drain(queue: asyncio.Queue) -> list:
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_routes_messages_by_prompt_id():
+    async def scenario():
+        socket = ComfyUISocket('ws://127.0.0.1:1', 'client')
+        first, second = socket.subscribe('a'), socket.subscribe('b')
+        socket._dispatch(message('executing', 'a', node='3'))
+        socket._dispatch(message('executed', 'b', node='9'))
+        # 二进制预览图、无法解析的消息直接丢弃
+        socket._dispatch(b'\x00\x01')
+        socket._dispatch('not json')
+        # 状态消息只保留最近一条
+        socket._dispatch(message('status', status={'exec_info': {'queue_remaining': 2}}))
+        socket._dispatch(message('status', status={'exec_info': {'queue_remaining': 1}}))
+        assert [item['data']['node'] for item in drain(first)] == ['3']
+        assert [item['data']['node'] for item in drain(second)] == ['9']
+        assert socket.status == {'status': {'exec_info': {'queue_remaining': 1}}}
+        assert socket._unclaimed == {}
+
+    asyncio.run(scenario())
+
+
+def test_unclaimed_messages_delivered_on_subscribe():
+    async def scenario():
+        socket = ComfyUISocket('ws://127.0.0.1:1', 'client')
+        # prompt_id 返回前 ComfyUI 已推送了该任务的消息
+        socket._dispatch(message('execution_start', 'a'))
+        socket._dispatch(message('executing', 'a', node='3'))
+        queue = socket.subscribe('a')
+        assert [item['type'] for item in drain(queue)] == ['execution_start', 'executing']
+        assert 'a' not in socket._unclaimed
+        # 取消订阅后的消息重新进入未认领缓冲
+        socket.unsubscribe('a')
+        socket.notify('a', {'type': 'execution_interrupted', 'data': {'prompt_id': 'a'}})
+        assert queue.empty()
+        assert len(socket._unclaimed['a']) == 1
+
+    asyncio.run(scenario())
+
+
+def test_unclaimed_messages_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(comfyui_socket.time, 'monotonic', lambda: now[0])
+
+    async def scenario():
+        socket = ComfyUISocket('ws://127.0.0.1:1', 'client')
+        socket._dispatch(message('executing', 'stale', node='1'))
+        now[0] += comfyui_socket.UNCLAIMED_TTL_SECONDS / 2
+        socket._dispatch(message('executing', 'recent', node='1'))
+        now[0] += comfyui_socket.UNCLAIMED_TTL_SECONDS / 2 + 1
+        # 下一条未认领消息到达时清理过期的缓冲
+        socket._dispatch(message('executing', 'other', node='1'))
+        assert set(socket._unclaimed) == {'recent', 'other'}
+        assert drain(socket.subscribe('stale')) == []
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_reaches_all_waiters():
+    async def scenario():
+        socket = ComfyUISocket('ws://127.0.0.1:1', 'client')
+        queues = [socket.subscribe('a'), socket.subscribe('b')]
+        socket._broadcast('disconnected')
+        for queue in queues:
+            assert drain(queue) == [{'type': 'disconnected', 'data': {}}]
+
+    asyncio.run(scenario())
+
+
+def test_wait_connected_times_out_without_server():
+    async def scenario():
+        socket = ComfyUISocket('ws://127.0.0.1:1', 'client')
+        assert not await socket.wait_connected(timeout=0.2)
+        assert not socket.connected
+        await socket.close()
+        assert socket._task.done()
+
+    asyncio.run(scenario())
@@ -0,0 +1,31 @@
+import pytest
+
+from server.utils import encoder_profiles
+
+
+@pytest.fixture(autouse=True)
+def isolated_stats(monkeypatch):
+    monkeypatch.setattr(encoder_profiles, '_profile_stats', {})
+    monkeypatch.setattr(encoder_profiles, 'is_available', lambda name: name in encoder_profiles.ENCODER_PROFILES)
+
+
+def test_fastest_compares_pixels_per_second():
+    # fast_preview 在半分辨率下帧率更高，但每秒像素数低于 balanced
+    encoder_profiles.record_throughput('fast_preview', 300, 1.0, (800, 450))
+    encoder_profiles.record_throughput('balanced', 100, 1.0, (1600, 900))
+    encoder_profiles.record_throughput('final', 40, 1.0, (1600, 900))
+    assert encoder_profiles.pick_fastest_profile(full_resolution=False) == 'balanced'
+
+
+def test_fastest_excludes_scaled_profiles_for_full_resolution():
+    encoder_profiles.record_throughput('fast_preview', 1000, 1.0, (800, 450))
+    encoder_profiles.record_throughput('balanced', 100, 1.0, (1600, 900))
+    assert encoder_profiles.pick_fastest_profile() == 'balanced'
+    assert encoder_profiles.pick_fastest_profile(full_resolution=False) == 'fast_preview'
+    assert encoder_profiles.resolve_profile('fastest')[0] == 'balanced'
+
+
+def test_fastest_respects_target_bitrate():
+    encoder_profiles.record_throughput('balanced', 100, 1.0, (1600, 900), size_bytes=1_000_000, duration=1.0)
+    encoder_profiles.record_throughput('final', 40, 1.0, (1600, 900), size_bytes=500_000, duration=1.0)
+    assert encoder_profiles.pick_fastest_profile(target_bitrate_kbps=5000) == 'final'
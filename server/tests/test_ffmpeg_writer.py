@@ -0,0 +1,43 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from server.utils.colorspace import yuv420p_frame_size
+from server.utils.ffmpeg_writer import FFmpegFrameWriter
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='需要 ffmpeg')
+
+SIZE = (64, 36)
+
+
+def open_writer(tmp_path, pix_fmt):
+    return FFmpegFrameWriter(str(tmp_path / 'out.mp4'), size=SIZE, fps=25, pix_fmt=pix_fmt).open()
+
+
+@pytest.mark.parametrize('pix_fmt', ['rgb24', 'yuv420p'])
+def test_write_accepts_matching_frames(tmp_path, pix_fmt):
+    writer = open_writer(tmp_path, pix_fmt)
+    for _ in range(3):
+        writer.write(np.zeros((SIZE[1], SIZE[0], 3), dtype=np.uint8))
+    if pix_fmt == 'yuv420p':
+        writer.write(np.zeros(yuv420p_frame_size(*SIZE), dtype=np.uint8))
+    writer.close()
+    assert writer.frames_written == (4 if pix_fmt == 'yuv420p' else 3)
+
+
+@pytest.mark.parametrize('pix_fmt', ['rgb24', 'yuv420p'])
+@pytest.mark.parametrize('frame', [
+    np.zeros((SIZE[1], SIZE[0] - 1, 3), dtype=np.uint8),
+    np.zeros((SIZE[1], 1, 3), dtype=np.uint8),
+    np.zeros((SIZE[1], SIZE[0], 3), dtype=np.float32),
+    np.zeros(yuv420p_frame_size(*SIZE) - 1, dtype=np.uint8),
+])
+def test_write_rejects_mismatched_frames(tmp_path, pix_fmt, frame):
+    writer = open_writer(tmp_path, pix_fmt)
+    try:
+        with pytest.raises(ValueError):
+            writer.write(frame)
+        assert writer.frames_written == 0
+    finally:
+        writer.abort()
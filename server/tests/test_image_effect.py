@@ -0,0 +1,49 @@
+import pytest
+from PIL import Image
+
+from server.utils.image_effect import SegmentRenderer
+
+# ComfyUI 常见出图尺寸与常用输出分辨率
+IMAGE_SIZES = [(832, 1216), (1216, 832), (1024, 1024)]
+OUTPUT_SIZES = [(1920, 1080), (1600, 900)]
+PAN_OPTIONS = [
+    {'use_pan': True, 'pan_range': (0.3, 0)},
+    {'use_pan': True, 'pan_range': (0, 0.3)},
+    {'use_pan': True, 'pan_range': (0.3, 0.3)},
+    {'use_pan': False},
+]
+
+
+@pytest.mark.parametrize('image_size', IMAGE_SIZES)
+@pytest.mark.parametrize('output_size', OUTPUT_SIZES)
+@pytest.mark.parametrize('segment_index', [0, 1])
+@pytest.mark.parametrize('pan', PAN_OPTIONS)
+def test_layout_covers_output(image_size, output_size, segment_index, pan):
+    params = {'output_size': output_size, 'segment_index': segment_index, **pan}
+    layout = SegmentRenderer.layout(image_size[0], image_size[1], params)
+    scaled_w, scaled_h = layout['scaled_size']
+    output_w, output_h = output_size
+    assert scaled_w >= output_w and scaled_h >= output_h
+    moving, fixed = (scaled_w - output_w, scaled_h - output_h) if layout['use_horizontal'] \
+        else (scaled_h - output_h, scaled_w - output_w)
+    assert layout['max_offset'] == moving
+    assert 0 <= layout['fixed_offset'] <= fixed
+
+
+@pytest.mark.parametrize('image_size', IMAGE_SIZES)
+@pytest.mark.parametrize('output_size', OUTPUT_SIZES)
+@pytest.mark.parametrize('segment_index', [0, 1])
+@pytest.mark.parametrize('smooth_motion', [False, True])
+def test_frame_shape_matches_output(image_size, output_size, segment_index, smooth_motion):
+    params = {
+        'output_size': output_size,
+        'segment_index': segment_index,
+        'pan_range': (0.3, 0.3),
+        'fade_duration': 0.5,
+        'smooth_motion': smooth_motion,
+    }
+    renderer = SegmentRenderer(Image.new('RGB', image_size, (120, 60, 30)), 3.0, params)
+    output_w, output_h = output_size
+    for time_val in (0.0, 0.25, 1.0, 1.37, 2.9, 3.0):
+        frame = renderer.frame(time_val)
+        assert frame.shape == (output_h, output_w, 3)
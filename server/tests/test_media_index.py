@@ -0,0 +1,56 @@
+import shutil
+import subprocess
+
+import pytest
+
+from server.utils.media_index import mp3_metadata
+
+# MPEG1 Layer III，128kbps，44.1kHz，立体声，无填充：每帧 417 字节、1152 个采样
+FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+FRAME_LENGTH = 417
+
+
+def mp3_frames(count: int) -> bytes:
+    return (FRAME_HEADER + bytes(FRAME_LENGTH - 4)) * count
+
+
+def test_duration_from_frame_headers(tmp_path):
+    path = tmp_path / 'audio.mp3'
+    path.write_bytes(mp3_frames(100))
+    metadata = mp3_metadata(str(path))
+    assert metadata['duration'] == pytest.approx(100 * 1152 / 44100)
+    assert metadata['sample_rate'] == 44100
+    assert metadata['channels'] == 2
+    assert metadata['bitrate_kbps'] == pytest.approx(128)
+
+
+def test_skips_id3_tags_and_resyncs_after_garbage(tmp_path):
+    id3 = b'ID3' + bytes([4, 0, 0, 0, 0, 0, 20]) + bytes(20)
+    path = tmp_path / 'audio.mp3'
+    path.write_bytes(id3 + mp3_frames(10) + b'\x00\x12garbage' + mp3_frames(5) + b'TAG' + bytes(125))
+    assert mp3_metadata(str(path))['duration'] == pytest.approx(15 * 1152 / 44100)
+
+
+def test_returns_none_for_non_mp3(tmp_path):
+    path = tmp_path / 'audio.mp3'
+    path.write_bytes(b'RIFF' + bytes(4000))
+    assert mp3_metadata(str(path)) is None
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='需要 ffmpeg')
+@pytest.mark.parametrize('sample_rate,channels,bitrate', [(44100, 2, '128k'), (24000, 1, '48k'), (48000, 2, '192k')])
+def test_duration_matches_decoded_samples(tmp_path, sample_rate, channels, bitrate):
+    path = tmp_path / 'audio.mp3'
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', f"sine=frequency=440:duration=2.37:sample_rate={sample_rate}",
+        '-ac', str(channels), '-c:a', 'libmp3lame', '-b:a', bitrate, str(path),
+    ], check=True)
+    decoded = subprocess.run(
+        ['ffmpeg', '-loglevel', 'error', '-i', str(path), '-f', 's16le', '-ac', '1', '-'],
+        check=True, capture_output=True,
+    ).stdout
+    metadata = mp3_metadata(str(path))
+    assert metadata['sample_rate'] == sample_rate
+    assert metadata['channels'] == channels
+    # 扣除 LAME 标签记录的编码延迟与填充后，与解码得到的采样数一致
+    assert metadata['duration'] == pytest.approx(len(decoded) / 2 / sample_rate, abs=1 / sample_rate)
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from server.utils.render_cache import SegmentRenderCache
+
+SETTINGS = {'fps': 20, 'resolution': [1600, 900], 'pan_range': [0.3, 0], 'fade_duration': 1.0}
+VIDEO_PARAMS = ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23']
+
+
+@pytest.fixture
+def chapter(tmp_path):
+    for subdir in ('1', '2'):
+        (tmp_path / subdir).mkdir()
+        (tmp_path / subdir / 'image.png').write_bytes(b'image ' + subdir.encode())
+        (tmp_path / subdir / 'audio.mp3').write_bytes(b'audio ' + subdir.encode())
+    return tmp_path
+
+
+def test_key_is_stable_for_same_inputs(chapter):
+    cache = SegmentRenderCache(str(chapter))
+    assert cache.segment_key('1', SETTINGS, VIDEO_PARAMS) == cache.segment_key('1', dict(SETTINGS), list(VIDEO_PARAMS))
+    # 不影响画面的设置不改变缓存键
+    assert cache.segment_key('1', SETTINGS, VIDEO_PARAMS) == \
+        cache.segment_key('1', {**SETTINGS, 'subtitles': 'burn', 'threads': 8}, VIDEO_PARAMS)
+
+
+@pytest.mark.parametrize('change', [
+    lambda chapter, settings, params: (chapter / '1' / 'image.png').write_bytes(b'new image'),
+    lambda chapter, settings, params: (chapter / '1' / 'audio.mp3').write_bytes(b'new audio'),
+    lambda chapter, settings, params: settings.update(fps=30),
+    lambda chapter, settings, params: settings.update(resolution=[1920, 1080]),
+    lambda chapter, settings, params: settings.update(fade_duration=0.5),
+    lambda chapter, settings, params: params.__setitem__(-1, '20'),
+])
+def test_key_changes_when_inputs_change(chapter, change):
+    cache = SegmentRenderCache(str(chapter))
+    settings, params = dict(SETTINGS), list(VIDEO_PARAMS)
+    before = cache.segment_key('1', settings, params)
+    change(chapter, settings, params)
+    assert cache.segment_key('1', settings, params) != before
+
+
+def test_pan_direction_depends_on_segment_parity(chapter):
+    (chapter / '3').mkdir()
+    for name in ('image.png', 'audio.mp3'):
+        (chapter / '3' / name).write_bytes((chapter / '1' / name).read_bytes())
+        (chapter / '2' / name).write_bytes((chapter / '1' / name).read_bytes())
+    cache = SegmentRenderCache(str(chapter))
+    key = cache.segment_key('1', SETTINGS, VIDEO_PARAMS)
+    assert cache.segment_key('3', SETTINGS, VIDEO_PARAMS) == key
+    assert cache.segment_key('2', SETTINGS, VIDEO_PARAMS) != key
+
+
+def test_store_replaces_stale_versions(chapter, tmp_path_factory):
+    cache = SegmentRenderCache(str(chapter))
+    work = tmp_path_factory.mktemp('work')
+    old_key = cache.segment_key('1', SETTINGS, VIDEO_PARAMS)
+    (work / 'old.mp4').write_bytes(b'old')
+    cache.store('1', old_key, str(work / 'old.mp4'))
+    assert cache.lookup('1', old_key)
+
+    (chapter / '1' / 'image.png').write_bytes(b'edited image')
+    new_key = cache.segment_key('1', SETTINGS, VIDEO_PARAMS)
+    assert cache.lookup('1', new_key) is None
+    (work / 'new.mp4').write_bytes(b'new')
+    cache.store('1', new_key, str(work / 'new.mp4'))
+    assert cache.lookup('1', new_key)
+    assert cache.lookup('1', old_key) is None
+    assert os.listdir(cache.cache_dir) == [os.path.basename(cache.path_for('1', new_key))]
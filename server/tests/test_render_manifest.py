@@ -0,0 +1,94 @@
+import os
+
+from server.utils.render_manifest import RenderManifest, find_interrupted
+
+
+def test_finish_does_not_overwrite_manifest_taken_over_by_new_job(tmp_path):
+    old = RenderManifest(str(tmp_path))
+    old.mark_running('old-job', {'fps': 20})
+    # 取消后重新提交的任务接管清单，旧任务稍后才结束
+    RenderManifest(str(tmp_path)).mark_queued('new-job', {'fps': 30})
+    old.finish('cancelled', error='cancelled')
+
+    manifest = RenderManifest(str(tmp_path))
+    assert manifest.data['job_id'] == 'new-job'
+    assert manifest.status == 'queued'
+    assert manifest.settings == {'fps': 30}
+
+
+def test_finish_records_own_job(tmp_path):
+    manifest = RenderManifest(str(tmp_path))
+    manifest.mark_queued('job', {'fps': 20})
+    manifest.mark_running('job')
+    manifest.finish('failed', error='boom')
+    assert RenderManifest(str(tmp_path)).status == 'failed'
+
+
+def test_resume_reuses_completed_segments_only_when_key_matches(tmp_path):
+    manifest = RenderManifest(str(tmp_path))
+    manifest.mark_running('job', {'fps': 20})
+    output = manifest.segment_output_path('1')
+    with open(output, 'wb') as f:
+        f.write(b'segment')
+    manifest.record_segment('1', 'key-1', output)
+
+    # 服务重启后重新读取清单
+    resumed = RenderManifest(str(tmp_path))
+    assert resumed.completed_segments() == ['1']
+    assert resumed.lookup('1', 'key-1') == output
+    assert resumed.lookup('1', 'other-key') is None
+    assert resumed.lookup('2', 'key-1') is None
+    os.remove(output)
+    assert resumed.lookup('1', 'key-1') is None
+
+
+def test_mark_running_removes_unrecorded_files(tmp_path):
+    manifest = RenderManifest(str(tmp_path))
+    manifest.mark_running('job', {'fps': 20})
+    kept = manifest.segment_output_path('1')
+    with open(kept, 'wb') as f:
+        f.write(b'done')
+    manifest.record_segment('1', 'key-1', kept)
+    # 中断时写了一半的片段与临时音轨
+    partial = manifest.segment_output_path('2')
+    with open(partial, 'wb') as f:
+        f.write(b'partial')
+    audio = os.path.join(manifest.work_dir, 'audio_job.m4a')
+    with open(audio, 'wb') as f:
+        f.write(b'audio')
+
+    RenderManifest(str(tmp_path)).mark_running('job-2')
+    assert os.path.exists(kept)
+    assert not os.path.exists(partial)
+    assert not os.path.exists(audio)
+
+
+def test_completed_render_clears_segments_and_work_dir(tmp_path):
+    manifest = RenderManifest(str(tmp_path))
+    manifest.mark_running('job', {'fps': 20})
+    output = manifest.segment_output_path('1')
+    with open(output, 'wb') as f:
+        f.write(b'segment')
+    manifest.record_segment('1', 'key-1', output)
+    manifest.finish('completed', str(tmp_path / 'video.mp4'))
+    assert RenderManifest(str(tmp_path)).completed_segments() == []
+    assert not os.path.exists(manifest.work_dir)
+
+
+def test_find_interrupted_lists_queued_and_running_jobs(tmp_path):
+    chapters = {}
+    for name, status in (('running', 'running'), ('queued', 'queued'), ('done', 'completed'), ('failed', 'failed')):
+        chapter = tmp_path / 'project' / name
+        chapter.mkdir(parents=True)
+        manifest = RenderManifest(str(chapter), 'draft' if name == 'queued' else None)
+        manifest.mark_queued(f"job-{name}", {'fps': 20, 'draft': name == 'queued'}, 'project', name)
+        if status != 'queued':
+            manifest.mark_running(f"job-{name}")
+        if status in ('completed', 'failed'):
+            manifest.finish(status)
+        chapters[name] = str(chapter)
+
+    found = {item['chapter_name']: item for item in find_interrupted(str(tmp_path))}
+    assert set(found) == {'running', 'queued'}
+    assert found['queued']['settings'] == {'fps': 20, 'draft': True}
+    assert found['running']['chapter_path'] == chapters['running']
@@ -0,0 +1,45 @@
+import shutil
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from server.services import segment_worker
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='需要 ffmpeg')
+
+
+def test_ffmpeg_path_times_only_the_encoder(tmp_path, monkeypatch):
+    segment = tmp_path / '1'
+    segment.mkdir()
+    noise = np.random.default_rng(0).integers(0, 255, (72, 128, 3), dtype=np.uint8)
+    Image.fromarray(noise).save(segment / 'image.png')
+    check_file = segment_worker._check_file
+
+    def slow_check(path):
+        # 模拟较慢的加载，不应计入编码耗时
+        time.sleep(0.5)
+        check_file(path)
+
+    monkeypatch.setattr(segment_worker, '_check_file', slow_check)
+    settings = {
+        'chapter_path': str(tmp_path),
+        'resolution': (64, 36),
+        'fps': 10,
+        'segment_durations': {'1': 1.0},
+        'use_pan': False,
+        'fade_duration': 0,
+        'threads': 1,
+    }
+    result = segment_worker.render_segment_ffmpeg(
+        '1', str(tmp_path / 'out.mp4'), settings, ['-c:v', 'libx264', '-preset', 'ultrafast']
+    )
+
+    encode = result['metrics']['encode']
+    assert result['timing']['frames'] == 10
+    assert result['timing']['write'] == pytest.approx(encode['wall'], abs=1e-3)
+    assert result['timing']['write'] < 0.5
+    assert result['metrics']['load']['wall'] >= 0.5
+    # ffmpeg 进程的 CPU 时间来自 rusage
+    assert encode['cpu'] > 0
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from server.utils.soundtrack import block_power_dbfs, ducking_envelope
+
+BLOCK = 0.02
+DUCKED = 10 ** (-12 / 20)
+
+
+def speech(blocks: int, start: int, end: int) -> np.ndarray:
+    power = np.full(blocks, -90.0)
+    power[start:end] = -20.0
+    return power
+
+
+def test_envelope_is_flat_without_speech():
+    gain = ducking_envelope(np.full(200, -90.0), BLOCK, -12)
+    assert np.allclose(gain, 1.0)
+
+
+def test_envelope_ducks_ahead_of_speech_and_holds_release():
+    # 人声位于第 100~200 块；attack 0.2s = 10 块，release 0.6s = 30 块
+    gain = ducking_envelope(speech(400, 100, 200), BLOCK, -12, attack=0.2, release=0.6)
+    assert np.allclose(gain[:80], 1.0)
+    # 人声开始时已完全压低（前瞻）
+    assert np.allclose(gain[100:200], DUCKED)
+    # 人声结束后保持 release 再恢复
+    assert np.allclose(gain[200:220], DUCKED)
+    assert np.allclose(gain[245:], 1.0)
+    # 过渡是单调的，且在 attack 长度内完成
+    assert np.all(np.diff(gain[80:101]) <= 1e-7)
+    assert np.all(np.diff(gain[200:246]) >= -1e-7)
+    assert np.count_nonzero((gain > DUCKED + 1e-4) & (gain < 1 - 1e-4)) <= 2 * 10
+
+
+def test_short_gaps_between_words_stay_ducked():
+    power = speech(400, 100, 150)
+    power[170:220] = -20.0
+    gain = ducking_envelope(power, BLOCK, -12, attack=0.2, release=0.6)
+    assert np.allclose(gain[100:220], DUCKED)
+
+
+def test_empty_input():
+    assert len(ducking_envelope(np.array([]), BLOCK, -12)) == 0
+
+
+def test_block_power_dbfs():
+    sr = 1000
+    t = np.arange(sr) / sr
+    tone = (np.sin(2 * np.pi * 50 * t) * 32767).astype(np.int16)
+    pcm = np.stack([tone, tone], axis=1)
+    pcm[500:] = 0
+    power = block_power_dbfs(pcm, 100)
+    assert len(power) == 10
+    # 满幅正弦约为 -3 dBFS，静音被截断在 -120 dBFS
+    assert power[:5] == pytest.approx(-3.01, abs=0.05)
+    assert np.allclose(power[5:], -120)
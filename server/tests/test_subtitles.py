@@ -0,0 +1,54 @@
+import pytest
+
+from server.utils.subtitles import _visible_length, cues_from_text, cues_from_words, format_srt_time, split_text
+
+
+def test_split_text_keeps_short_sentences_whole():
+    assert split_text('第一句。第二句！第三句？', 18) == ['第一句。', '第二句！', '第三句？']
+
+
+def test_split_text_breaks_long_sentences_at_clauses():
+    text = '这是一个很长的句子，中间有好几个分句，每个分句都不算太长，但合在一起超过了上限。'
+    pieces = split_text(text, 18)
+    assert ''.join(pieces) == text
+    assert all(_visible_length(piece) <= 18 for piece in pieces)
+    assert pieces[0].endswith('，')
+
+
+def test_split_text_hard_cuts_text_without_punctuation():
+    text = '一' * 40
+    pieces = split_text(text, 18)
+    assert [len(piece) for piece in pieces] == [18, 18, 4]
+
+
+def words(*items):
+    return [{'text': text, 'start': start, 'end': end} for text, start, end in items]
+
+
+def test_cues_from_words_groups_by_length():
+    timings = words(('你好', 0.0, 0.3), ('世界', 0.3, 0.6), ('再见', 0.6, 0.9))
+    assert cues_from_words(timings, max_chars=4) == [(0.0, 0.6, '你好世界'), (0.6, 0.9, '再见')]
+
+
+def test_cues_from_words_splits_on_pauses():
+    timings = words(('你好', 0.0, 0.3), ('世界', 1.0, 1.3))
+    assert cues_from_words(timings, max_chars=18) == [(0.0, 0.3, '你好'), (1.0, 1.3, '世界')]
+
+
+def test_cues_from_words_spaces_latin_words():
+    timings = words(('hello', 0.0, 0.3), ('world', 0.3, 0.6), ('。', 0.6, 0.6))
+    assert cues_from_words(timings) == [(0.0, 0.6, 'hello world。')]
+
+
+def test_cues_from_text_distributes_duration_by_length():
+    cues = cues_from_text('一二三。四五六七八九。', 9.0, 18)
+    assert [text for _, _, text in cues] == ['一二三。', '四五六七八九。']
+    assert cues[0][0] == 0.0
+    assert cues[0][1] == pytest.approx(cues[1][0])
+    assert cues[1][1] == pytest.approx(9.0)
+    assert cues[0][1] == pytest.approx(9.0 * 4 / 11)
+
+
+def test_format_srt_time():
+    assert format_srt_time(3723.4567) == '01:02:03,457'
+    assert format_srt_time(-1) == '00:00:00,000'
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from server.services.video_job_service import JobConflictError, VideoJobQueue
+
+
+class StubVideoService:
+    default_settings = {'fps': 20, 'resolution': [1600, 900]}
+
+    async def generate_video(self, chapter_path, settings, job):
+        await asyncio.sleep(0.05)
+        return chapter_path
+
+
+def test_submit_deduplicates_identical_settings(tmp_path):
+    async def run():
+        queue = VideoJobQueue(StubVideoService())
+        job, deduplicated = await queue.submit(str(tmp_path), {'fps': 20})
+        assert not deduplicated
+        # 显式传入默认值与不传视为相同设置
+        same, deduplicated = await queue.submit(str(tmp_path), {})
+        assert deduplicated and same is job
+        # 草稿与成片是不同的任务
+        draft, deduplicated = await queue.submit(str(tmp_path), {'draft': True})
+        assert not deduplicated and draft is not job
+
+    asyncio.run(run())
+
+
+def test_submit_rejects_different_settings_while_active(tmp_path):
+    async def run():
+        queue = VideoJobQueue(StubVideoService())
+        job, _ = await queue.submit(str(tmp_path), {'fps': 20})
+        with pytest.raises(JobConflictError) as error:
+            await queue.submit(str(tmp_path), {'fps': 30})
+        assert error.value.job is job
+        # 原任务结束后可以按新设置提交
+        while not job.finished:
+            await asyncio.sleep(0.01)
+        new_job, deduplicated = await queue.submit(str(tmp_path), {'fps': 30})
+        assert not deduplicated and new_job is not job
+
+    asyncio.run(run())
+
+
+class SlowCancellingVideoService(StubVideoService):
+    async def generate_video(self, chapter_path, settings, job):
+        while not job.stop_flag.is_set():
+            await asyncio.sleep(0.01)
+        # 取消后仍需一段时间收尾（等待编码进程退出、写渲染清单）
+        await asyncio.sleep(0.1)
+        raise ValueError("视频生成被用户取消")
+
+
+def test_resubmit_waits_until_cancelled_job_has_finished(tmp_path):
+    async def run():
+        queue = VideoJobQueue(SlowCancellingVideoService())
+        job, _ = await queue.submit(str(tmp_path), {'fps': 20})
+        while job.status != 'running':
+            await asyncio.sleep(0.01)
+        assert queue.cancel(job.job_id)
+        for settings in ({'fps': 20}, {'fps': 30}):
+            with pytest.raises(JobConflictError):
+                await queue.submit(str(tmp_path), settings)
+        while not job.finished:
+            await asyncio.sleep(0.01)
+        assert job.status == 'cancelled'
+        new_job, deduplicated = await queue.submit(str(tmp_path), {'fps': 30})
+        assert not deduplicated and new_job is not job
+        new_job.stop_flag.set()
+
+    asyncio.run(run())
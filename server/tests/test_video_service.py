@@ -0,0 +1,57 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from server.services import segment_worker
+from server.services.video_service import RenderJob, VideoService
+from server.utils.render_cache import SegmentRenderCache
+from server.utils.render_manifest import RenderManifest
+
+
+@pytest.fixture
+def chapter(tmp_path):
+    segment = tmp_path / '1'
+    segment.mkdir()
+    noise = np.random.default_rng(0).integers(0, 255, (72, 128, 3), dtype=np.uint8)
+    Image.fromarray(noise).save(segment / 'image.png')
+    (segment / 'audio.mp3').write_bytes(b'\xff\xfb' + bytes(2048))
+    return str(tmp_path)
+
+
+def test_cancel_mid_segment_leaves_no_cache_or_manifest_entry(chapter, monkeypatch):
+    service = VideoService()
+    job = RenderJob(chapter, {})
+    settings = {
+        **service.default_settings,
+        'chapter_path': chapter,
+        'resolution': (64, 36),
+        'fps': 10,
+        'segment_durations': {'1': 3.0},
+        'render_mode': 'memory',
+        'frame_chunk_size': 5,
+    }
+    render_frames_into = segment_worker.render_frames_into
+    chunks = []
+
+    def cancel_after_second_chunk(*args):
+        result = render_frames_into(*args)
+        chunks.append(result)
+        if len(chunks) == 2:
+            job.stop_flag.set()
+        return result
+
+    monkeypatch.setattr(segment_worker, 'render_frames_into', cancel_after_second_chunk)
+    cache = SegmentRenderCache(chapter)
+    manifest = RenderManifest(chapter)
+
+    with pytest.raises(ValueError):
+        asyncio.run(service._process_segment(job, '1', settings, manifest, cache=cache))
+
+    assert len(chunks) == 2
+    assert not os.path.isdir(cache.cache_dir) or not os.listdir(cache.cache_dir)
+    assert manifest.completed_segments() == []
+    assert RenderManifest(chapter).completed_segments() == []
+    assert not os.path.exists(manifest.segment_output_path('1'))
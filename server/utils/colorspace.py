@@ -0,0 +1,64 @@
+from typing import Optional
+
+import numpy as np
+
+# BT.601 有限范围（16-235），与 ffmpeg swscale 把 rgb24 转为 yuv420p 时的默认矩阵一致
+# 亮度使用 swscale 的 15 位定点系数与舍入，结果与 swscale 逐像素相同（有偏差时编码器的运动估计效果明显变差）；
+# 整数系数与像素的乘加结果小于 2^24，用 float32 矩阵乘法计算仍是精确的
+_RGB2YUV_SHIFT = 15
+_Y_COEFFS = np.array([
+    int(0.299 * 219 / 255 * (1 << _RGB2YUV_SHIFT) + 0.5),
+    int(0.587 * 219 / 255 * (1 << _RGB2YUV_SHIFT) + 0.5),
+    int(0.114 * 219 / 255 * (1 << _RGB2YUV_SHIFT) + 0.5),
+], dtype=np.float32)
+# 16 << 15 的亮度偏移加上 swscale 两级舍入合并后的常数
+_Y_OFFSET = float((16 << _RGB2YUV_SHIFT) + (1 << 8) + (1 << 14))
+_Y_SCALE = 1.0 / (1 << _RGB2YUV_SHIFT)
+_UV_COEFFS = np.array([[-38, 112], [-74, -94], [112, -18]], dtype=np.float32) / 256
+# 相邻两个像素（6 个分量）-> 水平方向求和后的 U、V；再与下一行相加即为 2x2 块均值
+_UV_PAIR_COEFFS = np.vstack([_UV_COEFFS, _UV_COEFFS]) / 4
+
+
+def yuv420p_frame_size(width: int, height: int) -> int:
+    """单帧 yuv420p 字节数（rgb24 的一半）"""
+    return width * height * 3 // 2
+
+
+def rgb_to_yuv420p(frames: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    把 RGB 帧（HxWx3 或 NxHxWx3，uint8）整体转换为 yuv420p 平面格式，宽高必须为偶数
+    亮度逐像素计算（与 swscale 相同）；色度取 2x2 像素块的均值（与 swscale 的滤波有细微差别）。
+    矩阵乘法代替逐通道运算，水平方向的两像素求和并入系数矩阵，避免跨步切片
+
+    Returns:
+        形状 (N, H*W*3/2) 的 uint8 数组（单帧输入时为一维），依次为 Y、U、V 平面，可直接写入 ffmpeg rawvideo
+    """
+    frames = np.asarray(frames)
+    single = frames.ndim == 3
+    if single:
+        frames = frames[np.newaxis]
+    count, height, width, _ = frames.shape
+    if height % 2 or width % 2:
+        raise ValueError(f"yuv420p 要求宽高为偶数: {width}x{height}")
+
+    luma_size = width * height
+    chroma_size = luma_size // 4
+    if out is None:
+        out = np.empty((count, yuv420p_frame_size(width, height)), dtype=np.uint8)
+    else:
+        out = out.reshape(count, -1)
+
+    rgb = frames.astype(np.float32)
+    # 结果恒为正，写入 uint8 时截断即向下取整
+    luma = rgb @ _Y_COEFFS
+    luma += _Y_OFFSET
+    luma *= _Y_SCALE
+    out[:, :luma_size] = luma.reshape(count, -1)
+
+    chroma = (rgb.reshape(count, height, width // 2, 6) @ _UV_PAIR_COEFFS).reshape(count, height // 2, 2, width // 2, 2)
+    chroma = chroma[:, :, 0] + chroma[:, :, 1]
+    chroma += 128.5
+    out[:, luma_size:luma_size + chroma_size] = chroma[..., 0].reshape(count, -1)
+    out[:, luma_size + chroma_size:] = chroma[..., 1].reshape(count, -1)
+
+    return out[0] if single else out
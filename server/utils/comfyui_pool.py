@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from server.utils.comfyui_socket import ComfyUISocket
+
+logger = logging.getLogger(__name__)
+
+# 健康检查（同时轮询 /queue 队列长度）的间隔与请求超时（秒）
+HEALTH_CHECK_INTERVAL = 10
+HEALTH_CHECK_TIMEOUT = 3
+# 尚无耗时记录时按该值估算单张图片的生成耗时（秒），只用于后端之间的比较
+DEFAULT_IMAGE_SECONDS = 10.0
+# 生成耗时的指数滑动平均系数
+THROUGHPUT_SMOOTHING = 0.3
+
+
+class BackendError(Exception):
+    """ComfyUI 后端不可用（连接失败、超时等），可以换一个后端重试"""
+
+
+class ComfyUIBackend:
+    """
+    单个 ComfyUI 后端
+    维护 WebSocket 长连接、健康状态、队列长度和本进程提交到该后端的统计
+    """
+
+    def __init__(self, url: str, client_id: str):
+        self.url = url.rstrip('/')
+        self.socket = ComfyUISocket(self.url.replace('http', 'ws', 1), client_id)
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        # 最近一次轮询 /queue 得到的排队 + 执行中的任务数（含其他客户端提交的）
+        self.queue_remaining = 0
+        # 本进程已提交、尚未完成的提示词数
+        self.inflight = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        # 单张图片生成耗时（秒）的滑动平均
+        self.average_seconds: Optional[float] = None
+
+    def pending(self) -> int:
+        """后端上待完成的任务数；WebSocket 状态消息比轮询更及时，优先使用"""
+        status = (self.socket.status if self.socket.connected else None) or {}
+        remaining = ((status.get('status') or {}).get('exec_info') or {}).get('queue_remaining')
+        if remaining is None:
+            remaining = self.queue_remaining
+        # 刚提交的提示词可能还没有反映在队列长度里
+        return max(remaining, self.inflight)
+
+    def estimated_wait(self) -> float:
+        """新提交一张图片预计的完成时间：排在前面的任务数 + 1，乘以该后端的单张耗时"""
+        return (self.pending() + 1) * (self.average_seconds or DEFAULT_IMAGE_SECONDS)
+
+    async def check(self, http: httpx.AsyncClient) -> bool:
+        """健康检查并更新队列长度"""
+        self.last_checked = time.time()
+        try:
+            response = await http.get(f"{self.url}/queue", timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            queue = response.json()
+            self.queue_remaining = len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+            if not self.healthy:
+                logger.info("ComfyUI 后端恢复: %s", self.url)
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            if self.healthy:
+                logger.warning("ComfyUI 后端不可用: %s. Error: %s", self.url, e)
+            self.healthy = False
+            self.last_error = str(e)
+        return self.healthy
+
+    def to_dict(self) -> Dict:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'connected': self.socket.connected,
+            'last_error': self.last_error,
+            'last_checked': self.last_checked,
+            'pending': self.pending(),
+            'inflight': self.inflight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'average_seconds': round(self.average_seconds, 3) if self.average_seconds else None,
+            'images_per_hour': round(self.completed * 3600 / self.busy_seconds, 1) if self.busy_seconds else None,
+        }
+
+
+class ComfyUIBackendPool:
+    """
+    ComfyUI 后端池（asyncio）
+    后台任务定期做健康检查并轮询各后端的队列长度；
+    每次提交选择预计完成时间最短的健康后端（队列长度 x 实测单张耗时），
+    后端出错时标记为不可用，由调用方换其他后端重试，下次健康检查通过后恢复
+    """
+
+    def __init__(self, urls: Iterable[str], client_id: str, http: httpx.AsyncClient,
+                 health_interval: float = HEALTH_CHECK_INTERVAL):
+        self.backends: List[ComfyUIBackend] = []
+        for url in urls:
+            if url and url.rstrip('/') not in (backend.url for backend in self.backends):
+                self.backends.append(ComfyUIBackend(url, client_id))
+        if not self.backends:
+            raise ValueError("至少需要配置一个 ComfyUI 后端")
+        self.http = http
+        self.health_interval = health_interval
+        self._lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def primary(self) -> ComfyUIBackend:
+        return self.backends[0]
+
+    def get(self, url: str) -> Optional[ComfyUIBackend]:
+        url = url.rstrip('/')
+        return next((backend for backend in self.backends if backend.url == url), None)
+
+    def start(self) -> 'ComfyUIBackendPool':
+        """在当前事件循环中建立各后端的 WebSocket 长连接并启动健康检查（重复调用无副作用）；只有一个后端时不做周期检查"""
+        for backend in self.backends:
+            backend.socket.start()
+        if len(self.backends) > 1 and (self._health_task is None or self._health_task.done()):
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+        return self
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for backend in self.backends:
+            await backend.socket.close()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(backend.check(self.http) for backend in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    async def acquire(self, exclude: Iterable[ComfyUIBackend] = ()) -> ComfyUIBackend:
+        """选择预计完成时间最短的健康后端并占用一个名额；exclude 为本次已失败过的后端"""
+        exclude = set(id(backend) for backend in exclude)
+        async with self._lock:
+            candidates = [backend for backend in self.backends if backend.healthy and id(backend) not in exclude]
+            if not candidates:
+                # 全部被标记为不可用时立即重新检查一次，而不是等下一轮健康检查
+                candidates = [backend for backend in self.backends
+                              if id(backend) not in exclude and await backend.check(self.http)]
+            if not candidates:
+                raise BackendError("没有可用的 ComfyUI 后端")
+            backend = min(candidates, key=lambda b: (b.estimated_wait(), b.inflight))
+            backend.inflight += 1
+            return backend
+
+    def release(self, backend: ComfyUIBackend, seconds: Optional[float] = None, success: bool = True):
+        """归还名额；seconds 为该张图片的实际生成耗时"""
+        backend.inflight = max(0, backend.inflight - 1)
+        if success:
+            backend.completed += 1
+            if seconds is not None:
+                backend.busy_seconds += seconds
+                if backend.average_seconds is None:
+                    backend.average_seconds = seconds
+                else:
+                    backend.average_seconds += THROUGHPUT_SMOOTHING * (seconds - backend.average_seconds)
+        else:
+            backend.failed += 1
+
+    def mark_failed(self, backend: ComfyUIBackend, error: str):
+        """后端出错，暂停向其派发直到健康检查通过"""
+        logger.warning("ComfyUI 后端出错，暂停派发: %s. Error: %s", backend.url, error)
+        backend.healthy = False
+        backend.last_error = error
+
+    def stats(self) -> List[Dict]:
+        return [backend.to_dict() for backend in self.backends]
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+logger = logging.getLogger(__name__)
+
+# 尚未被认领的消息保留时长（秒）：提交工作流后 prompt_id 返回前，ComfyUI 可能已推送该任务的消息
+UNCLAIMED_TTL_SECONDS = 60
+# 断线重连的退避区间（秒）
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+
+class ComfyUISocket:
+    """
+    ComfyUI WebSocket 长连接（asyncio）
+    每个 ComfyUI 后端一个连接（同一 clientId），由事件循环中的后台任务维持并在断开后自动重连；
+    收到的消息按 data.prompt_id 分发到各任务的等待队列，多个生成任务共用同一连接。
+    不含 prompt_id 的状态消息（队列长度等）只保留最近一条。
+    断线期间的消息会丢失：断开时向所有等待队列投递 {'type': 'disconnected'}，重新连上后投递 {'type': 'reconnected'}，
+    由等待方自行核对任务状态。
+    所有方法都在同一事件循环中调用，不需要加锁
+    """
+
+    def __init__(self, ws_url: str, client_id: str, ping_interval: float = 20):
+        self.url = f"{ws_url}/ws?clientId={client_id}"
+        self.ping_interval = ping_interval
+        self.status: Optional[Dict] = None
+        # 成功建立连接的次数
+        self.generation = 0
+        self._connected = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._waiters: Dict[str, asyncio.Queue] = {}
+        self._unclaimed: Dict[str, list] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self) -> 'ComfyUISocket':
+        """在当前事件循环中启动连接任务（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._closed.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def wait_connected(self, timeout: float = 10) -> bool:
+        """等待连接建立，不轮询"""
+        self.start()
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self):
+        self._closed.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._connected.clear()
+
+    def subscribe(self, prompt_id: str) -> asyncio.Queue:
+        """登记任务的等待队列，并补发登记前已到达的该任务消息"""
+        queue = asyncio.Queue()
+        self._waiters[prompt_id] = queue
+        for message in self._unclaimed.pop(prompt_id, []):
+            queue.put_nowait(message[1])
+        return queue
+
+    def notify(self, prompt_id: str, message: Dict):
+        """按收到服务端消息的方式投递本地生成的消息（如取消任务时的 execution_interrupted）"""
+        self._route(prompt_id, message)
+
+    def unsubscribe(self, prompt_id: str):
+        self._waiters.pop(prompt_id, None)
+
+    async def _run(self):
+        delay = RECONNECT_MIN_DELAY
+        while not self._closed.is_set():
+            opened_at = None
+            try:
+                async with connect(self.url, ping_interval=self.ping_interval,
+                                   ping_timeout=self.ping_interval / 2, max_size=None) as ws:
+                    opened_at = time.monotonic()
+                    self.generation += 1
+                    self._connected.set()
+                    logger.info("ComfyUI WebSocket 已连接: %s", self.url)
+                    if self.generation > 1:
+                        self._broadcast('reconnected')
+                    async for message in ws:
+                        self._dispatch(message)
+            except (OSError, WebSocketException, asyncio.TimeoutError) as e:
+                logger.warning("ComfyUI WebSocket 错误: %s", e)
+            self._connected.clear()
+            if self._closed.is_set():
+                break
+            if opened_at is not None:
+                self._broadcast('disconnected')
+            # 连上后稳定运行过一段时间才重置退避，避免服务端反复拒绝时快速重连
+            if opened_at is not None and time.monotonic() - opened_at > RECONNECT_MAX_DELAY:
+                delay = RECONNECT_MIN_DELAY
+            logger.info("ComfyUI WebSocket 断开，%.1f 秒后重连", delay)
+            try:
+                await asyncio.wait_for(self._closed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def _broadcast(self, message_type: str):
+        for queue in self._waiters.values():
+            queue.put_nowait({'type': message_type, 'data': {}})
+
+    def _dispatch(self, message):
+        # 二进制消息是采样预览图，不需要
+        if not isinstance(message, str):
+            return
+        try:
+            data = json.loads(message)
+        except ValueError as e:
+            logger.warning("无法解析 ComfyUI 消息: %s", e)
+            return
+        if not isinstance(data, dict):
+            return
+        prompt_id = (data.get('data') or {}).get('prompt_id')
+        if not prompt_id:
+            if data.get('type') == 'status':
+                self.status = data.get('data')
+            return
+        self._route(prompt_id, data)
+
+    def _route(self, prompt_id: str, data: Dict):
+        queue = self._waiters.get(prompt_id)
+        if queue is not None:
+            queue.put_nowait(data)
+            return
+        now = time.monotonic()
+        self._unclaimed.setdefault(prompt_id, []).append((now, data))
+        # 清理过期未认领的消息（其他客户端的任务或已放弃等待的任务）
+        expired = [key for key, messages in self._unclaimed.items()
+                   if now - messages[-1][0] > UNCLAIMED_TTL_SECONDS]
+        for key in expired:
+            del self._unclaimed[key]
@@ -0,0 +1,214 @@
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 编码器配置档
+# encoder: ffmpeg 编码器名; params: 视频编码参数; resolution_scale: 输出分辨率缩放
+ENCODER_PROFILES: Dict[str, Dict] = {
+    'fast_preview': {
+        'description': '快速预览：ultrafast + 半分辨率',
+        'encoder': 'libx264',
+        'params': ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28'],
+        'resolution_scale': 0.5,
+    },
+    'balanced': {
+        'description': '默认：libx264 medium',
+        'encoder': 'libx264',
+        'params': ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23'],
+    },
+    'final': {
+        'description': '成片：libx264 slow，体积更小',
+        'encoder': 'libx264',
+        'params': ['-c:v', 'libx264', '-preset', 'slow', '-crf', '20'],
+    },
+    'archive_x265': {
+        'description': '归档：libx265',
+        'encoder': 'libx265',
+        'params': ['-c:v', 'libx265', '-preset', 'medium', '-crf', '26', '-tag:v', 'hvc1'],
+    },
+    'archive_av1': {
+        'description': '归档：SVT-AV1',
+        'encoder': 'libsvtav1',
+        'params': ['-c:v', 'libsvtav1', '-preset', '8', '-crf', '35'],
+    },
+    'nvenc': {
+        'description': 'NVIDIA 硬件编码',
+        'encoder': 'h264_nvenc',
+        'params': ['-c:v', 'h264_nvenc', '-preset', 'medium', '-gpu', '0'],
+    },
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+_encoders_lock = threading.Lock()
+_available_encoders: Optional[List[str]] = None
+
+_stats_lock = threading.Lock()
+# 每个配置档的实测数据：fps（编码帧率）、pixels_per_second（按分辨率折算的吞吐）、resolution、
+# bitrate_kbps（码率）、source（benchmark / render）
+_profile_stats: Dict[str, Dict] = {}
+
+
+def available_encoders(refresh: bool = False) -> List[str]:
+    """ffmpeg 支持的视频编码器列表（进程内缓存）"""
+    global _available_encoders
+    with _encoders_lock:
+        if _available_encoders is None or refresh:
+            try:
+                result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True)
+                encoders = []
+                for line in result.stdout.splitlines():
+                    parts = line.split()
+                    # 形如 " V....D libx264   libx264 H.264 ..."
+                    if len(parts) >= 2 and parts[0].startswith('V') and parts[1] != '=':
+                        encoders.append(parts[1])
+                _available_encoders = encoders
+            except Exception as e:
+                logger.error("硬件检测失败: %s", str(e))
+                _available_encoders = []
+        return list(_available_encoders)
+
+
+def is_available(name: str) -> bool:
+    profile = ENCODER_PROFILES.get(name)
+    return bool(profile) and profile['encoder'] in available_encoders()
+
+
+def resolve_profile(name: Optional[str], use_cuda: bool = False) -> Tuple[str, Dict]:
+    """
+    解析配置档名称
+    auto: 可用且允许时使用 NVENC，否则使用默认档；fastest: 使用实测最快的全分辨率可用配置档
+    不可用的编码器回退到默认档
+    """
+    if not name or name == 'auto':
+        name = 'nvenc' if use_cuda and is_available('nvenc') else DEFAULT_PROFILE
+    elif name == 'fastest':
+        name = pick_fastest_profile() or DEFAULT_PROFILE
+
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"未知的编码配置: {name}")
+    if not is_available(name):
+        logger.warning("编码器 %s 不可用，回退到 %s", ENCODER_PROFILES[name]['encoder'], DEFAULT_PROFILE)
+        name = DEFAULT_PROFILE
+    return name, ENCODER_PROFILES[name]
+
+
+def record_throughput(name: str, frames: int, seconds: float, resolution: Tuple[int, int],
+                      size_bytes: Optional[int] = None, duration: Optional[float] = None,
+                      source: str = 'render') -> None:
+    """
+    记录一次实测的编码吞吐
+    各次测量的分辨率不同（基准测试按配置档缩放、渲染按任务设置），比较时使用每秒像素数
+    """
+    if frames <= 0 or seconds <= 0:
+        return
+    width, height = resolution
+    stats = {
+        'fps': frames / seconds,
+        'pixels_per_second': frames * width * height / seconds,
+        'resolution': [width, height],
+        'source': source,
+        'measured_at': time.time(),
+    }
+    if size_bytes and duration:
+        stats['bitrate_kbps'] = size_bytes * 8 / 1000 / duration
+    with _stats_lock:
+        previous = _profile_stats.get(name, {})
+        # 渲染实测没有码率时保留基准测试得到的码率
+        if 'bitrate_kbps' not in stats and 'bitrate_kbps' in previous:
+            stats['bitrate_kbps'] = previous['bitrate_kbps']
+        _profile_stats[name] = stats
+
+
+def pick_fastest_profile(target_bitrate_kbps: Optional[float] = None,
+                         full_resolution: bool = True) -> Optional[str]:
+    """
+    在已测量的可用配置档中选出每秒编码像素数最高的一个；给出目标码率时只考虑码率不超过目标的配置档
+    full_resolution 为真时排除带 resolution_scale 的配置档，避免成片被悄悄降为低分辨率
+    """
+    with _stats_lock:
+        candidates = [
+            (stats['pixels_per_second'], name) for name, stats in _profile_stats.items()
+            if is_available(name) and 'pixels_per_second' in stats
+            and not (full_resolution and ENCODER_PROFILES[name].get('resolution_scale', 1.0) != 1.0)
+            and (target_bitrate_kbps is None or stats.get('bitrate_kbps', float('inf')) <= target_bitrate_kbps)
+        ]
+    if not candidates:
+        return None
+    return max(candidates)[1]
+
+
+def list_profiles() -> List[Dict]:
+    """所有配置档及其可用性与实测数据"""
+    with _stats_lock:
+        stats = {name: dict(value) for name, value in _profile_stats.items()}
+    return [
+        {
+            'name': name,
+            'description': profile['description'],
+            'encoder': profile['encoder'],
+            'resolution_scale': profile.get('resolution_scale', 1.0),
+            'available': is_available(name),
+            'stats': stats.get(name),
+        }
+        for name, profile in ENCODER_PROFILES.items()
+    ]
+
+
+def benchmark_profile(name: str, resolution: Tuple[int, int] = (1600, 900), fps: float = 20,
+                      seconds: float = 3.0, threads: int = 0) -> Dict:
+    """用合成画面测量配置档的编码帧率与码率"""
+    profile = ENCODER_PROFILES[name]
+    scale = profile.get('resolution_scale', 1.0)
+    width, height = scaled_resolution(resolution, scale)
+    frames = int(seconds * fps)
+    fd, output_path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size={width}x{height}:rate={fps}",
+        '-frames:v', str(frames),
+        *profile['params'],
+        '-pix_fmt', 'yuv420p', '-threads', str(threads),
+        output_path,
+    ]
+    try:
+        start = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', errors='replace'))
+        size = os.path.getsize(output_path)
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+    record_throughput(name, frames, elapsed, (width, height), size, frames / fps, source='benchmark')
+    with _stats_lock:
+        return dict(_profile_stats[name])
+
+
+def benchmark_all(resolution: Tuple[int, int] = (1600, 900), fps: float = 20, seconds: float = 3.0) -> Dict[str, Dict]:
+    """测量所有可用配置档"""
+    results = {}
+    for name in ENCODER_PROFILES:
+        if not is_available(name):
+            continue
+        try:
+            results[name] = benchmark_profile(name, resolution, fps, seconds)
+        except Exception as e:
+            logger.error("编码配置 %s 测试失败: %s", name, e)
+            results[name] = {'error': str(e)}
+    return results
+
+
+def scaled_resolution(resolution: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    """按比例缩放分辨率，保证宽高为偶数（yuv420p 要求）"""
+    width, height = resolution
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
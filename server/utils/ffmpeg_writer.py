@@ -0,0 +1,148 @@
+import logging
+import subprocess
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from server.utils.colorspace import rgb_to_yuv420p, yuv420p_frame_size
+from server.utils.metrics import wait_process
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegFrameWriter:
+    """
+    流式帧写入器
+    通过 stdin 以 rawvideo 格式把帧直接送入 ffmpeg，只输出视频流（音轨在合并时统一混流），
+    进程内只保留当前正在写入的帧，内存占用与片段时长无关
+    pix_fmt 为 yuv420p 时，RGB 帧在写入前由 NumPy 转换为 yuv420p，
+    管道传输量减半，ffmpeg 端不再需要 swscale 颜色空间转换
+    """
+
+    def __init__(self, output_path: str, size: Tuple[int, int], fps: float,
+                 video_params: Optional[List[str]] = None, threads: int = 4, pix_fmt: str = 'rgb24',
+                 output_params: Optional[List[str]] = None):
+        self.output_path = output_path
+        self.size = size
+        self.fps = fps
+        self.video_params = video_params or ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23']
+        self.threads = threads
+        if pix_fmt == 'yuv420p' and (size[0] % 2 or size[1] % 2):
+            logger.warning("yuv420p 要求宽高为偶数，%dx%d 回退为 rgb24 输入", size[0], size[1])
+            pix_fmt = 'rgb24'
+        self.pix_fmt = pix_fmt
+        # yuv420p 转换的输出缓冲区，逐帧复用
+        self._yuv_buffer = np.empty(yuv420p_frame_size(*size), dtype=np.uint8) if pix_fmt == 'yuv420p' else None
+        self.output_params = output_params or []
+        self.frames_written = 0
+        # ffmpeg 进程结束后的 CPU 时间与峰值内存，平台不支持时为 None
+        self.usage: Optional[dict] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._stderr_tail = deque(maxlen=50)
+        self._stderr_thread: Optional[threading.Thread] = None
+
+    def _build_command(self) -> List[str]:
+        """构建ffmpeg命令"""
+        width, height = self.size
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', self.pix_fmt,
+            '-s', f'{width}x{height}',
+            '-r', str(self.fps),
+            '-i', '-',
+            '-map', '0:v:0',
+        ]
+        cmd.extend(self.video_params)
+        cmd.extend(['-pix_fmt', 'yuv420p', '-threads', str(self.threads)])
+        cmd.extend(self.output_params)
+        cmd.append(self.output_path)
+        return cmd
+
+    def _drain_stderr(self):
+        """持续读取stderr，防止管道写满导致ffmpeg阻塞"""
+        for line in iter(self._proc.stderr.readline, b''):
+            self._stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+
+    def open(self) -> 'FFmpegFrameWriter':
+        cmd = self._build_command()
+        logger.debug("启动ffmpeg: %s", ' '.join(cmd))
+        self._proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        return self
+
+    def write(self, frame: np.ndarray):
+        """写入单帧（HxWx3 uint8 RGB；pix_fmt 为 yuv420p 时也可直接传入已转换的平面数据）"""
+        if self._proc is None:
+            raise RuntimeError("写入器尚未打开")
+        self._check_frame(frame)
+        if self._yuv_buffer is not None and frame.ndim == 3:
+            frame = rgb_to_yuv420p(frame, self._yuv_buffer)
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError) as e:
+            self._proc.wait()
+            raise RuntimeError(f"ffmpeg写入失败: {self.stderr_text() or e}") from e
+        self.frames_written += 1
+
+    def _check_frame(self, frame: np.ndarray):
+        """
+        rawvideo 没有帧边界，尺寸或类型不对的帧会让之后的每一帧错位，
+        因此写入前严格校验，出错时让片段直接失败
+        """
+        width, height = self.size
+        if frame.dtype != np.uint8:
+            raise ValueError(f"帧数据类型应为 uint8，实际为 {frame.dtype}")
+        if frame.ndim == 3 or self.pix_fmt == 'rgb24':
+            if frame.shape != (height, width, 3):
+                raise ValueError(f"帧尺寸应为 {(height, width, 3)}，实际为 {frame.shape}")
+        elif frame.size != yuv420p_frame_size(width, height):
+            raise ValueError(f"yuv420p 帧应为 {yuv420p_frame_size(width, height)} 字节，实际为 {frame.size}")
+
+    def close(self):
+        """结束写入并等待编码完成"""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self.usage = wait_process(proc)
+        returncode = proc.wait()
+        if self._stderr_thread:
+            self._stderr_thread.join(timeout=1)
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg编码失败({returncode}): {self.stderr_text()}")
+
+    def abort(self):
+        """中止编码（用于取消或异常），不抛出异常"""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        try:
+            proc.kill()
+            proc.wait()
+        except Exception as e:
+            logger.debug("终止ffmpeg进程失败: %s", e)
+
+    def stderr_text(self) -> str:
+        return '\n'.join(self._stderr_tail)
+
+    def __enter__(self) -> 'FFmpegFrameWriter':
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,112 @@
+import itertools
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_store_ids = itertools.count()
+
+
+def estimate_frame_bytes(count: int, size: Tuple[int, int]) -> int:
+    """count 帧 RGB 画面占用的字节数"""
+    width, height = size
+    return count * width * height * 3
+
+
+class FrameStore:
+    """
+    帧存储（进程堆上的列表）
+    需要随机访问全部帧、无法流式写入编码器时使用；帧按下标写入，写入时拷贝
+    """
+
+    def __init__(self, count: int, size: Tuple[int, int]):
+        self.count = count
+        self.size = size
+        self._frames: List[np.ndarray] = []
+
+    def put(self, index: int, frame: np.ndarray) -> None:
+        if index != len(self._frames):
+            raise IndexError(f"帧需按顺序写入: {index}")
+        self._frames.append(np.array(frame, dtype=np.uint8))
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self._frames[index]
+
+    def frames(self) -> List[np.ndarray]:
+        """已写入的帧（可直接交给 ImageSequenceClip）"""
+        return self._frames
+
+    def close(self) -> None:
+        self._frames = []
+
+    def __enter__(self) -> 'FrameStore':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class MemmapFrameStore(FrameStore):
+    """
+    内存映射帧存储
+    整段帧保存在磁盘上的定长 uint8 缓冲区（count x H x W x 3）中，按下标随机访问，
+    帧数据由操作系统页缓存管理，不占用进程堆；关闭时删除映射文件
+    """
+
+    def __init__(self, count: int, size: Tuple[int, int], directory: str, name: str = 'frames'):
+        super().__init__(count, size)
+        width, height = size
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}_{os.getpid()}_{next(_store_ids)}.frames")
+        self._buffer: Optional[np.memmap] = np.memmap(
+            self.path, dtype=np.uint8, mode='w+', shape=(count, height, width, 3)
+        )
+        self._length = 0
+
+    def put(self, index: int, frame: np.ndarray) -> None:
+        self._buffer[index] = frame
+        self._length = max(self._length, index + 1)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if index >= self._length:
+            raise IndexError(index)
+        return self._buffer[index]
+
+    def frames(self) -> List[np.ndarray]:
+        """已写入帧的视图列表（不拷贝）"""
+        return [self._buffer[i] for i in range(self._length)]
+
+    def close(self) -> None:
+        # 只释放引用：调用方可能仍持有帧视图，强制关闭映射会使这些视图失效；
+        # Windows 上映射中的文件无法删除，遗留文件在下次渲染时随工作目录一起清理
+        self._buffer = None
+        self._length = 0
+        if os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.warning("删除帧映射文件失败: %s. Error: %s", self.path, e)
+
+
+def create_frame_store(count: int, size: Tuple[int, int], directory: str,
+                       ram_budget_mb: Optional[float] = None, name: str = 'frames') -> FrameStore:
+    """
+    按预估帧数据量选择帧存储：超过 ram_budget_mb 时使用内存映射文件（保存在 directory 下），否则使用内存列表
+    ram_budget_mb 为 None 时始终使用内存列表
+    """
+    estimated = estimate_frame_bytes(count, size)
+    if ram_budget_mb is not None and estimated > ram_budget_mb * 1024 * 1024:
+        logger.info("帧数据预计 %.1fMB，超过内存预算 %.0fMB，使用内存映射帧存储",
+                    estimated / 1024 / 1024, ram_budget_mb)
+        return MemmapFrameStore(count, size, directory, name)
+    return FrameStore(count, size)
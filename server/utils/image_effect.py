@@ -130,4 +130,125 @@ class ImageEffects:
             processed_image = effect(processed_image, time_val, duration, params)
             # 这里不再对每个效果进行裁剪，因为每个效果函数内部已经处理好了尺寸
         
-        return processed_image
\ No newline at end of file
+        return processed_image
+
+
+class SegmentRenderer:
+    """
+    片段渲染器（向量化的 Ken Burns 平移 + 淡入淡出）
+    整个片段只做一次 LANCZOS 缩放，之后每一帧都是缩放图上的切片视图，
+    淡入淡出以 NumPy 乘法实现，单帧开销从一次缩放降为一次内存拷贝
+    """
+
+    def __init__(self, image: Image.Image, duration: float, params: Dict):
+        self.duration = duration
+        self.output_w, self.output_h = params['output_size']
+        self.fade_duration = params.get('fade_duration', 0) or 0
+        # 亚像素平移：相邻两个整数偏移的裁剪按小数部分线性混合，消除低速平移时的抖动
+        self.smooth_motion = params.get('smooth_motion', False)
+
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        layout = self.layout(image.width, image.height, params)
+        self.panning = layout['panning']
+        self.use_horizontal = layout['use_horizontal']
+        self.max_offset = layout['max_offset']
+        self.fixed_offset = layout['fixed_offset']
+        self.scaled = np.asarray(image.resize(layout['scaled_size'], Image.LANCZOS))
+
+        # 淡入淡出计算缓冲区，避免每帧重新分配
+        self._buffer = np.empty((self.output_h, self.output_w, 3), dtype=np.float32)
+        self._next_buffer = np.empty_like(self._buffer) if self.smooth_motion else None
+
+    @staticmethod
+    def layout(image_w: int, image_h: int, params: Dict) -> Dict:
+        """
+        计算缩放尺寸与裁剪偏移，方向与缩放比例与 ImageEffects.pan_effect 保持一致
+        无平移时为居中裁剪（沿水平方向取 max_offset 的一半）
+        """
+        output_w, output_h = params['output_size']
+        h_range, v_range = params.get('pan_range', (0.3, 0)) if params.get('use_pan', True) else (0, 0)
+        segment_index = params.get('segment_index', 0)
+        panning = h_range > 0 or v_range > 0
+        use_horizontal = True
+
+        if panning:
+            if h_range > 0 and v_range > 0:
+                use_horizontal = segment_index % 2 == 0
+            elif v_range > 0:
+                use_horizontal = False
+
+            if use_horizontal:
+                scale_ratio = max(output_w * (1 + h_range) / image_w, output_h / image_h)
+            else:
+                scale_ratio = max(output_w / image_w, output_h * (1 + v_range) / image_h)
+            new_width = math.ceil(image_w * scale_ratio)
+            new_height = math.ceil(image_h * scale_ratio)
+        else:
+            img_aspect = image_w / image_h
+            if img_aspect > output_w / output_h:
+                new_height = output_h
+                new_width = math.ceil(new_height * img_aspect)
+            else:
+                new_width = output_w
+                new_height = math.ceil(new_width / img_aspect)
+        # 向上取整并且不小于输出尺寸，否则裁剪结果会比输出帧少 1 像素
+        new_width = max(output_w, new_width)
+        new_height = max(output_h, new_height)
+
+        if use_horizontal:
+            max_offset = new_width - output_w
+            fixed_offset = min(max(0, (new_height - output_h) // 2), new_height - output_h)
+        else:
+            max_offset = new_height - output_h
+            fixed_offset = min(max(0, (new_width - output_w) // 2), new_width - output_w)
+
+        return {
+            'panning': panning,
+            'use_horizontal': use_horizontal,
+            'scaled_size': (new_width, new_height),
+            'max_offset': max_offset,
+            'fixed_offset': fixed_offset,
+        }
+
+    def _crop(self, offset: int) -> np.ndarray:
+        """返回指定偏移处的裁剪视图（不拷贝）"""
+        if self.use_horizontal:
+            return self.scaled[self.fixed_offset:self.fixed_offset + self.output_h,
+                               offset:offset + self.output_w]
+        return self.scaled[offset:offset + self.output_h,
+                           self.fixed_offset:self.fixed_offset + self.output_w]
+
+    def _brightness(self, time_val: float) -> float:
+        """与 ImageEffects.fade_effect 相同的亮度曲线"""
+        if self.fade_duration <= 0:
+            return 1.0
+        if time_val < self.fade_duration:
+            return time_val / self.fade_duration
+        if self.duration - time_val < self.fade_duration:
+            return (self.duration - time_val) / self.fade_duration
+        return 1.0
+
+    def frame(self, time_val: float) -> np.ndarray:
+        """渲染指定时间点的帧，返回 HxWx3 的 uint8 数组（可能是缩放图的只读视图）"""
+        if self.panning:
+            position = self.max_offset * ImageEffects._ease_in_out_progress(min(1.0, time_val / self.duration))
+        else:
+            position = float(self.max_offset // 2)
+
+        offset = min(max(0, int(position)), self.max_offset)
+        brightness = self._brightness(time_val)
+        fraction = position - offset if self.smooth_motion else 0.0
+
+        if fraction > 0 and offset < self.max_offset:
+            np.multiply(self._crop(offset), (1 - fraction) * brightness, out=self._buffer, casting='unsafe')
+            np.multiply(self._crop(offset + 1), fraction * brightness, out=self._next_buffer, casting='unsafe')
+            self._buffer += self._next_buffer
+            return self._buffer.astype(np.uint8)
+
+        crop = self._crop(offset)
+        if brightness >= 1.0:
+            return crop
+        np.multiply(crop, brightness, out=self._buffer, casting='unsafe')
+        return self._buffer.astype(np.uint8)
@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 索引格式变化时递增，使旧索引全部失效
+INDEX_VERSION = 1
+
+# 文件小于该值视为无效（与渲染时的校验一致）
+MIN_FILE_SIZE = 1024
+MIN_AUDIO_DURATION = 0.05
+
+# MPEG 音频帧头对应的码率表（kbps），按 (版本是否为 MPEG1, 层) 区分
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# 版本位 -> 采样率表；0: MPEG2.5, 2: MPEG2, 3: MPEG1
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+
+def _parse_frame_header(data: bytes, pos: int) -> Optional[Dict]:
+    """解析 MPEG 音频帧头，无效时返回 None"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        'length': length,
+        'samples': samples,
+        'sample_rate': sample_rate,
+        'channels': 1 if (b3 >> 6) == 3 else 2,
+        'bitrate': bitrate,
+    }
+
+
+def _lame_padding(frame: bytes) -> int:
+    """
+    Xing/Info 信息帧中 LAME 标签记录的编码器延迟与末尾填充采样数，解码器会去掉这部分
+    没有 LAME 标签时返回 0
+    """
+    for tag in (b'Xing', b'Info'):
+        offset = frame.find(tag)
+        if offset >= 0:
+            break
+    else:
+        return 0
+    flags = int.from_bytes(frame[offset + 4:offset + 8], 'big')
+    # 依次跳过可选的帧数、字节数、TOC、质量字段
+    lame = offset + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0) \
+        + (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0)
+    # 编码器标识为 LAMExxx 或 ffmpeg 写入的 Lavcxx/Lavfxx，结构相同
+    if len(frame) < lame + 24 or frame[lame:lame + 1] != b'L':
+        return 0
+    value = int.from_bytes(frame[lame + 21:lame + 24], 'big')
+    return (value >> 12) + (value & 0xFFF)
+
+
+def mp3_metadata(path: str) -> Optional[Dict]:
+    """
+    逐帧读取 MP3 帧头统计时长，不解码音频
+    无法识别时返回 None，由调用方回退到 ffprobe
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos = 0
+    # 跳过 ID3v2 标签
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    samples = 0
+    skipped = 0
+    frames = 0
+    bitrate_total = 0
+    first = None
+    while pos < len(data):
+        header = _parse_frame_header(data, pos)
+        if header is None:
+            if data[pos:pos + 3] == b'TAG':
+                break
+            # 失去同步时向后查找下一个帧头
+            pos = data.find(b'\xff', pos + 1)
+            if pos < 0:
+                break
+            continue
+        if first is None:
+            first = header
+            # 首帧为 Xing/Info 信息帧时不计入时长，并扣除 LAME 标签记录的延迟与填充（与解码结果一致）
+            frame = data[pos:pos + header['length']]
+            if b'Xing' in frame or b'Info' in frame:
+                skipped = _lame_padding(frame)
+                pos += header['length']
+                continue
+        samples += header['samples']
+        frames += 1
+        bitrate_total += header['bitrate']
+        pos += max(header['length'], 1)
+
+    if first is None or frames == 0:
+        return None
+    return {
+        'duration': max(0, samples - skipped) / first['sample_rate'],
+        'sample_rate': first['sample_rate'],
+        'channels': first['channels'],
+        'bitrate_kbps': bitrate_total / frames / 1000,
+    }
+
+
+def ffprobe_metadata(path: str) -> Dict:
+    """用 ffprobe 读取音频时长与格式（只读容器/流头信息）"""
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'format=duration,bit_rate:stream=sample_rate,channels',
+        '-of', 'json', path,
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe失败: {path}: {result.stderr.decode('utf-8', errors='replace')}")
+    info = json.loads(result.stdout or b'{}')
+    stream = (info.get('streams') or [{}])[0]
+    fmt = info.get('format') or {}
+    return {
+        'duration': float(fmt.get('duration') or 0),
+        'sample_rate': int(stream.get('sample_rate') or 0),
+        'channels': int(stream.get('channels') or 0),
+        'bitrate_kbps': float(fmt.get('bit_rate') or 0) / 1000,
+    }
+
+
+def probe_audio(path: str) -> Dict:
+    """读取音频元数据：MP3 优先解析帧头，其余格式或解析失败时使用 ffprobe"""
+    metadata = None
+    if path.lower().endswith('.mp3'):
+        metadata = mp3_metadata(path)
+    if metadata is None:
+        metadata = ffprobe_metadata(path)
+    return metadata
+
+
+def _check_file(path: str) -> os.stat_result:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"文件不存在: {path}")
+    stat = os.stat(path)
+    if stat.st_size < MIN_FILE_SIZE:
+        raise ValueError(f"文件过小: {path}")
+    return stat
+
+
+class ChapterMediaIndex:
+    """
+    章节媒体索引
+    记录每个片段 audio.mp3 的时长/采样率和 image.png 的尺寸，保存在章节目录下，
+    以文件大小和修改时间判断是否过期；规划渲染、时间轴展示和章节统计都无需解码音频
+    """
+
+    INDEX_FILE = '.media_index.json'
+
+    def __init__(self, chapter_path: str):
+        self.chapter_path = chapter_path
+        self.index_path = os.path.join(chapter_path, self.INDEX_FILE)
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._dirty = False
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    if data.get('version') == INDEX_VERSION:
+                        self._entries = data.get('entries', {})
+                except (OSError, ValueError) as e:
+                    logger.warning("媒体索引读取失败，将重新生成: %s. Error: %s", self.index_path, e)
+        return self._entries
+
+    def _lookup(self, relative_path: str, probe) -> Dict:
+        """命中且未过期时直接返回索引记录，否则重新探测并更新索引"""
+        path = os.path.join(self.chapter_path, relative_path)
+        stat = _check_file(path)
+        with self._lock:
+            entry = self._load().get(relative_path)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                return entry
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, **probe(path)}
+        with self._lock:
+            self._load()[relative_path] = entry
+            self._dirty = True
+        return entry
+
+    @staticmethod
+    def _probe_image(path: str) -> Dict:
+        # PIL 打开时只读取文件头
+        with Image.open(path) as img:
+            return {'width': img.width, 'height': img.height}
+
+    def audio_info(self, subdir: str) -> Dict:
+        """片段音频元数据，时长无效时抛出异常"""
+        entry = self._lookup(f"{subdir}/audio.mp3", probe_audio)
+        if entry['duration'] < MIN_AUDIO_DURATION:
+            raise ValueError(f"音频文件时长过短或无效: {os.path.join(self.chapter_path, subdir, 'audio.mp3')}")
+        return entry
+
+    def image_info(self, subdir: str) -> Dict:
+        return self._lookup(f"{subdir}/image.png", self._probe_image)
+
+    def segment_durations(self, subdirs: Iterable[str]) -> Dict[str, float]:
+        """各片段音频时长，并把更新后的索引写回磁盘"""
+        try:
+            return {subdir: self.audio_info(subdir)['duration'] for subdir in subdirs}
+        finally:
+            self.save()
+
+    def summary(self, subdirs: Optional[List[str]] = None) -> Dict:
+        """章节统计：每个片段的时长与图片尺寸，以及总时长；单个片段出错时记录错误而不中断"""
+        if subdirs is None:
+            subdirs = list_segments(self.chapter_path)
+        segments = []
+        total_duration = 0.0
+        for subdir in subdirs:
+            item = {'id': subdir, 'duration': None, 'width': None, 'height': None, 'error': None}
+            try:
+                audio = self.audio_info(subdir)
+                item['duration'] = audio['duration']
+                total_duration += audio['duration']
+                image = self.image_info(subdir)
+                item['width'], item['height'] = image['width'], image['height']
+            except Exception as e:
+                item['error'] = str(e)
+            segments.append(item)
+        self.save()
+        return {
+            'segments': segments,
+            'segment_count': len(segments),
+            'total_duration': total_duration,
+            'invalid_count': sum(1 for item in segments if item['error']),
+        }
+
+    def save(self) -> None:
+        """有更新时写回索引文件（先写临时文件再替换，避免并发读到半个文件）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            # 只保留仍存在的片段文件
+            entries = {
+                key: value for key, value in self._load().items()
+                if os.path.exists(os.path.join(self.chapter_path, key))
+            }
+            temp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': INDEX_VERSION, 'entries': entries}, f)
+                os.replace(temp_path, self.index_path)
+                self._entries = entries
+                self._dirty = False
+            except OSError as e:
+                logger.warning("媒体索引保存失败: %s. Error: %s", self.index_path, e)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+
+def list_segments(chapter_path: str) -> List[str]:
+    """章节下按序号排序的片段目录"""
+    return sorted([
+        d for d in os.listdir(chapter_path)
+        if os.path.isdir(os.path.join(chapter_path, d)) and d.isdigit()
+    ], key=lambda x: int(x))
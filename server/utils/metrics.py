@@ -0,0 +1,167 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 渲染流程的阶段
+# plan: 读取片段列表与时长; load: 加载图片、创建渲染器; render: 逐帧渲染; encode: 视频编码;
+# audio: 章节音轨解码与编码; preview: 片段预览与联系表; concat: 合并与混流; cleanup: 清理临时文件
+STAGES = ('plan', 'load', 'render', 'encode', 'audio', 'preview', 'concat', 'cleanup')
+
+# ru_maxrss 在 Linux 上以 KB 为单位，macOS 上以字节为单位
+_RSS_UNIT = 1024 * 1024 if sys.platform == 'darwin' else 1024
+
+
+def process_peak_rss_mb() -> Optional[float]:
+    """当前进程的峰值 RSS（MB），平台不支持时返回 None"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / _RSS_UNIT
+
+
+def wait_process(proc, should_stop: Optional[Callable[[], bool]] = None, poll: float = 0.2) -> Optional[Dict]:
+    """
+    等待子进程结束，返回其 CPU 时间与峰值内存 {'cpu': 秒, 'peak_rss_mb': MB}
+    should_stop 返回 True 时结束子进程；平台不支持 wait4 时退回 proc.wait() 并返回 None
+    """
+    if not hasattr(os, 'wait4'):
+        while True:
+            try:
+                proc.wait(timeout=poll if should_stop else None)
+                return None
+            except Exception:
+                if should_stop and should_stop():
+                    proc.kill()
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG if should_stop else 0)
+        if pid:
+            break
+        if should_stop():
+            proc.kill()
+            pid, status, usage = os.wait4(proc.pid, 0)
+            break
+        time.sleep(poll)
+    # 已由 wait4 回收，同步到 Popen 对象，之后的 proc.wait() 直接返回
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {'cpu': usage.ru_utime + usage.ru_stime, 'peak_rss_mb': usage.ru_maxrss / _RSS_UNIT}
+
+
+class StageMetrics:
+    """
+    各阶段的墙钟时间、CPU 时间与峰值内存
+    CPU 时间 = 执行该阶段的线程的 CPU 时间 + 该阶段启动的子进程（ffmpeg）的 CPU 时间；
+    峰值内存取所在进程与子进程峰值 RSS 的较大值（进程峰值是阶段结束时的历史最高值）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict] = {}
+
+    def add(self, stage: str, wall: float = 0.0, cpu: float = 0.0,
+            peak_rss_mb: Optional[float] = None, count: int = 1) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(stage, {'wall': 0.0, 'cpu': 0.0, 'peak_rss_mb': None, 'count': 0})
+            entry['wall'] += wall
+            entry['cpu'] += cpu
+            entry['count'] += count
+            if peak_rss_mb is not None:
+                entry['peak_rss_mb'] = max(entry['peak_rss_mb'] or 0.0, peak_rss_mb)
+
+    def add_process(self, stage: str, usage: Optional[Dict]) -> None:
+        """计入子进程的 CPU 时间与峰值内存（不增加次数和墙钟时间）"""
+        if usage:
+            self.add(stage, cpu=usage['cpu'], peak_rss_mb=usage['peak_rss_mb'], count=0)
+
+    @contextmanager
+    def measure(self, stage: str):
+        """测量当前线程中一段代码"""
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - wall_start, time.thread_time() - cpu_start,
+                     process_peak_rss_mb())
+
+    def merge(self, stages: Dict[str, Dict]) -> None:
+        """合并另一份 to_dict() 结果（例如工作进程回传的片段指标）"""
+        for stage, entry in stages.items():
+            self.add(stage, entry['wall'], entry['cpu'], entry.get('peak_rss_mb'), entry.get('count', 1))
+
+    def to_dict(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                stage: {
+                    'wall': round(entry['wall'], 4),
+                    'cpu': round(entry['cpu'], 4),
+                    'peak_rss_mb': round(entry['peak_rss_mb'], 1) if entry['peak_rss_mb'] is not None else None,
+                    'count': entry['count'],
+                }
+                for stage, entry in self.stages.items()
+            }
+
+
+class MetricsRegistry:
+    """进程内累计的渲染指标（已结束的任务），用于 Prometheus 文本输出"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = StageMetrics()
+        self.segments = 0
+        self.cached_segments = 0
+        self.frames = 0
+        self.jobs: Dict[str, int] = {}
+
+    def record_job(self, status: str, stages: Dict[str, Dict], segments: int = 0,
+                   cached_segments: int = 0, frames: int = 0) -> None:
+        self.stages.merge(stages)
+        with self._lock:
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+            self.segments += segments
+            self.cached_segments += cached_segments
+            self.frames += frames
+
+    def render_prometheus(self, active_jobs: Optional[Dict[str, int]] = None, prefix: str = 'aicreation_video') -> str:
+        """Prometheus 文本格式"""
+        stages = self.stages.to_dict()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: Iterable):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        metric('stage_wall_seconds_total', 'counter', 'Wall time spent in each render stage',
+               (({'stage': stage}, entry['wall']) for stage, entry in stages.items()))
+        metric('stage_cpu_seconds_total', 'counter', 'CPU time (threads and ffmpeg children) spent in each render stage',
+               (({'stage': stage}, entry['cpu']) for stage, entry in stages.items()))
+        metric('stage_runs_total', 'counter', 'Number of times each render stage ran',
+               (({'stage': stage}, entry['count']) for stage, entry in stages.items()))
+        metric('stage_peak_rss_bytes', 'gauge', 'Peak resident memory observed in each render stage',
+               (({'stage': stage}, int(entry['peak_rss_mb'] * 1024 * 1024))
+                for stage, entry in stages.items() if entry['peak_rss_mb'] is not None))
+        with self._lock:
+            jobs = dict(self.jobs)
+            segments, cached_segments, frames = self.segments, self.cached_segments, self.frames
+        metric('jobs_finished_total', 'counter', 'Finished render jobs by final status',
+               (({'status': status}, count) for status, count in jobs.items()))
+        metric('segments_total', 'counter', 'Segments processed by finished jobs', [({}, segments)])
+        metric('cached_segments_total', 'counter', 'Segments reused from the render cache', [({}, cached_segments)])
+        metric('frames_total', 'counter', 'Frames rendered by finished jobs', [({}, frames)])
+        if active_jobs is not None:
+            metric('jobs', 'gauge', 'Render jobs currently queued or running',
+                   (({'status': status}, count) for status, count in active_jobs.items()))
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内全局注册表
+registry = MetricsRegistry()
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 片段输出格式变化时递增，使旧缓存全部失效
+CACHE_VERSION = 3
+
+# 影响片段画面/编码结果的设置项，变化后缓存失效
+CACHE_SETTING_KEYS = ('fps', 'resolution', 'pan_range', 'fade_duration', 'use_pan', 'smooth_motion',
+                      'render_mode', 'static_fast_path', 'segment_gap', 'frame_format')
+
+
+class SegmentRenderCache:
+    """
+    片段渲染缓存（仅视频流，音轨在合并时混入）
+    按 image.png、audio.mp3 的内容哈希和特效设置生成缓存键，
+    重新导出章节时只有内容变化的片段需要重新编码，其余直接复用
+    """
+
+    CACHE_DIR = '.render_cache'
+
+    def __init__(self, chapter_path: str, namespace: Optional[str] = None):
+        self.chapter_path = chapter_path
+        # 草稿与成片使用不同的缓存目录，互不淘汰
+        cache_dir = f"{self.CACHE_DIR}_{namespace}" if namespace else self.CACHE_DIR
+        self.cache_dir = os.path.join(chapter_path, cache_dir)
+
+    @staticmethod
+    def _file_digest(path: str, hasher) -> None:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+
+    def segment_key(self, subdir: str, settings: Dict, video_params: List[str]) -> str:
+        """计算片段缓存键"""
+        hasher = hashlib.sha1()
+        subdir_path = os.path.join(self.chapter_path, subdir)
+        for name in ('image.png', 'audio.mp3'):
+            self._file_digest(os.path.join(subdir_path, name), hasher)
+
+        effect_settings = {key: settings.get(key) for key in CACHE_SETTING_KEYS}
+        # 片段序号只影响平移方向（奇偶交替）
+        effect_settings['segment_parity'] = int(subdir) % 2 if subdir.isdigit() else 0
+        effect_settings['video_params'] = video_params
+        effect_settings['version'] = CACHE_VERSION
+        hasher.update(json.dumps(effect_settings, sort_keys=True, default=list).encode('utf-8'))
+        return hasher.hexdigest()[:16]
+
+    def path_for(self, subdir: str, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{subdir}_{key}.mp4")
+
+    def lookup(self, subdir: str, key: str) -> Optional[str]:
+        """命中时返回缓存的片段路径"""
+        path = self.path_for(subdir, key)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return path
+        return None
+
+    def store(self, subdir: str, key: str, rendered_path: str) -> str:
+        """把渲染完成的片段移入缓存，并清理该片段的旧版本"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target = self.path_for(subdir, key)
+        os.replace(rendered_path, target)
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(f"{subdir}_") and name != os.path.basename(target):
+                self._remove(os.path.join(self.cache_dir, name))
+        return target
+
+    def prune(self, subdirs: Iterable[str]) -> None:
+        """删除已不存在的片段的缓存"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        valid = set(subdirs)
+        for name in os.listdir(self.cache_dir):
+            if name.split('_', 1)[0] not in valid:
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def clear(self) -> None:
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            self._remove(os.path.join(self.cache_dir, name))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning("清理渲染缓存失败: %s. Error: %s", path, e)
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+# 未结束的任务状态，服务重启后需要恢复
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class RenderManifest:
+    """
+    章节渲染清单
+    记录任务状态、提交时的视频设置以及已完成片段（缓存键 + 输出文件），保存在章节目录下；
+    服务重启或任务重试时，缓存键一致且文件仍存在的片段直接复用，从第一个缺失的片段继续渲染
+    """
+
+    MANIFEST_FILE = '.render_manifest'
+    WORK_DIR = '.render_work'
+
+    def __init__(self, chapter_path: str, namespace: Optional[str] = None):
+        self.chapter_path = chapter_path
+        # 草稿与成片各自独立
+        suffix = f"_{namespace}" if namespace else ''
+        self.path = os.path.join(chapter_path, f"{self.MANIFEST_FILE}{suffix}.json")
+        self.work_dir = os.path.join(chapter_path, f"{self.WORK_DIR}{suffix}")
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    return data
+            except (OSError, ValueError) as e:
+                logger.warning("渲染清单读取失败，将重新生成: %s. Error: %s", self.path, e)
+        return {'version': MANIFEST_VERSION, 'status': None, 'segments': {}}
+
+    def save(self) -> None:
+        """先写临时文件再替换，进程中途退出也不会留下半个清单"""
+        with self._lock:
+            data = json.dumps(self.data, ensure_ascii=False, indent=2)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.warning("渲染清单保存失败: %s. Error: %s", self.path, e)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.data.get('status')
+
+    @property
+    def settings(self) -> Dict:
+        return self.data.get('settings') or {}
+
+    def mark_queued(self, job_id: str, settings: Dict, project_name: Optional[str] = None,
+                    chapter_name: Optional[str] = None) -> None:
+        """任务提交时记录设置，排队中的任务在重启后同样会被恢复"""
+        self.data.update({
+            'job_id': job_id,
+            'status': 'queued',
+            'settings': settings,
+            'project_name': project_name,
+            'chapter_name': chapter_name,
+            'queued_at': time.time(),
+            'error': None,
+        })
+        self.save()
+
+    def mark_running(self, job_id: str, settings: Optional[Dict] = None) -> None:
+        """开始渲染；保留已完成片段的记录，并清理上次中断遗留的未记录文件"""
+        self.data['job_id'] = job_id
+        self.data['status'] = 'running'
+        self.data['started_at'] = time.time()
+        if settings is not None and not self.data.get('settings'):
+            self.data['settings'] = settings
+        self.data['error'] = None
+        self._remove_orphans()
+        self.save()
+
+    def finish(self, status: str, output_path: Optional[str] = None, error: Optional[str] = None) -> None:
+        """
+        记录任务结束；完成时清空片段记录和工作目录
+        清单已被之后提交的任务接管（job_id 不同）时不写入，避免用过期数据覆盖新任务的记录
+        """
+        owner = self._load().get('job_id')
+        if owner and self.data.get('job_id') and owner != self.data['job_id']:
+            logger.info("渲染清单已属于任务 %s，不记录任务 %s 的结束状态", owner, self.data['job_id'])
+            return
+        self.data['status'] = status
+        self.data['finished_at'] = time.time()
+        self.data['error'] = error
+        if output_path:
+            self.data['output_path'] = output_path
+        if status == 'completed':
+            self.data['segments'] = {}
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.save()
+
+    def segment_output_path(self, subdir: str) -> str:
+        """不使用渲染缓存时片段的输出位置（固定文件名，重启后仍可找到）"""
+        os.makedirs(self.work_dir, exist_ok=True)
+        return os.path.join(self.work_dir, f"{subdir}.mp4")
+
+    def lookup(self, subdir: str, key: str) -> Optional[str]:
+        """片段已完成且缓存键一致、文件仍存在时返回其输出路径"""
+        entry = self.data['segments'].get(subdir)
+        if entry and entry.get('key') == key and os.path.exists(entry['output']) \
+                and os.path.getsize(entry['output']) > 0:
+            return entry['output']
+        return None
+
+    def record_segment(self, subdir: str, key: str, output_path: str) -> None:
+        self.data['segments'][subdir] = {'key': key, 'output': output_path, 'completed_at': time.time()}
+        self.save()
+
+    def completed_segments(self) -> List[str]:
+        return list(self.data['segments'])
+
+    def _remove_orphans(self) -> None:
+        """删除工作目录中没有被清单记录的文件（中断时写了一半的片段、临时音轨等）"""
+        if not os.path.isdir(self.work_dir):
+            return
+        recorded = {os.path.abspath(entry['output']) for entry in self.data['segments'].values()}
+        for name in os.listdir(self.work_dir):
+            path = os.path.abspath(os.path.join(self.work_dir, name))
+            if path not in recorded:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning("清理中断遗留文件失败: %s. Error: %s", path, e)
+
+
+def find_interrupted(projects_path: str) -> List[Dict]:
+    """扫描所有章节，找出排队中或渲染中（即服务退出时未结束）的任务清单"""
+    results = []
+    if not os.path.isdir(projects_path):
+        return results
+    for project_name in os.listdir(projects_path):
+        project_path = os.path.join(projects_path, project_name)
+        if not os.path.isdir(project_path):
+            continue
+        for chapter_name in os.listdir(project_path):
+            chapter_path = os.path.join(project_path, chapter_name)
+            if not os.path.isdir(chapter_path):
+                continue
+            for name in os.listdir(chapter_path):
+                if not (name.startswith(RenderManifest.MANIFEST_FILE) and name.endswith('.json')):
+                    continue
+                namespace = name[len(RenderManifest.MANIFEST_FILE):-len('.json')].lstrip('_') or None
+                manifest = RenderManifest(chapter_path, namespace)
+                if manifest.status in ACTIVE_STATUSES:
+                    results.append({
+                        'chapter_path': chapter_path,
+                        'project_name': manifest.data.get('project_name') or project_name,
+                        'chapter_name': manifest.data.get('chapter_name') or chapter_name,
+                        'settings': manifest.settings,
+                        'completed_segments': len(manifest.completed_segments()),
+                    })
+    return results
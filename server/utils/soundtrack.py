@@ -0,0 +1,324 @@
+import logging
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from server.utils.metrics import StageMetrics, wait_process
+
+logger = logging.getLogger(__name__)
+
+# 响度测量的分块时长（秒）与绝对门限，低于门限的块（静音）不参与计算
+LOUDNESS_BLOCK_SECONDS = 0.4
+LOUDNESS_GATE_DBFS = -70.0
+# 归一化后的峰值上限与最大增益，避免削波和把底噪放大过多
+PEAK_CEILING_DBFS = -1.0
+MAX_GAIN_DB = 20.0
+# 背景音乐闪避（ducking）：按块检测旁白，块内响度高于门限视为有人声
+DUCK_BLOCK_SECONDS = 0.02
+DUCK_THRESHOLD_DBFS = -45.0
+
+
+def decode_audio(path: str, sample_rate: int = 44100, channels: int = 2,
+                 metrics: Optional[StageMetrics] = None) -> np.ndarray:
+    """用ffmpeg把音频文件解码为 float32 PCM，形状 (采样数, 声道数)；给出 metrics 时计入 ffmpeg 的资源占用"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"文件不存在: {path}")
+    if os.path.getsize(path) < 1024:
+        raise ValueError(f"文件过小: {path}")
+    cmd = [
+        'ffmpeg', '-loglevel', 'error', '-i', path,
+        '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', str(channels), '-ar', str(sample_rate), '-',
+    ]
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        data = proc.stdout.read()
+        proc.stdout.close()
+        usage = wait_process(proc)
+        if proc.returncode != 0:
+            stderr_file.seek(0)
+            raise RuntimeError(f"音频解码失败: {path}: {stderr_file.read().decode('utf-8', errors='replace')}")
+    if metrics is not None:
+        metrics.add_process('audio', usage)
+    pcm = np.frombuffer(data, dtype=np.float32).reshape(-1, channels)
+    if len(pcm) < sample_rate * 0.05:
+        raise ValueError(f"音频文件时长过短或无效: {path}")
+    return pcm
+
+
+def measure_loudness(pcm: np.ndarray, sample_rate: int) -> Optional[float]:
+    """分块均方根响度（dBFS），忽略静音块；全部静音时返回 None"""
+    block = max(1, int(sample_rate * LOUDNESS_BLOCK_SECONDS))
+    usable = len(pcm) // block * block
+    if usable == 0:
+        blocks = pcm[np.newaxis]
+    else:
+        blocks = pcm[:usable].reshape(-1, block, pcm.shape[1])
+    power = np.mean(np.square(blocks, dtype=np.float64), axis=(1, 2))
+    gate = 10 ** (LOUDNESS_GATE_DBFS / 10)
+    power = power[power > gate]
+    if power.size == 0:
+        return None
+    return 10 * np.log10(np.mean(power))
+
+
+def normalization_gain(pcm: np.ndarray, sample_rate: int, target_dbfs: float) -> float:
+    """把响度调整到 target_dbfs 所需的线性增益，受峰值上限和最大增益约束"""
+    loudness = measure_loudness(pcm, sample_rate)
+    if loudness is None:
+        return 1.0
+    gain_db = min(target_dbfs - loudness, MAX_GAIN_DB)
+    peak = float(np.max(np.abs(pcm))) if len(pcm) else 0.0
+    if peak > 0:
+        gain_db = min(gain_db, PEAK_CEILING_DBFS - 20 * np.log10(peak))
+    return float(10 ** (gain_db / 20))
+
+
+def block_power_dbfs(pcm: np.ndarray, block: int) -> np.ndarray:
+    """按 block 个采样分块计算响度（dBFS，各声道平均），末尾不足一块的部分补零；pcm 为 int16"""
+    blocks = -(-len(pcm) // block)
+    padded = np.zeros((blocks * block, pcm.shape[1]), dtype=np.float32)
+    padded[:len(pcm)] = pcm
+    padded *= 1.0 / 32768
+    power = np.mean(np.square(padded).reshape(blocks, -1), axis=1)
+    return 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def _sliding_any(mask: np.ndarray, before: int, after: int) -> np.ndarray:
+    """mask[i - before : i + after] 中任一为真时为真（累加和实现，与窗口长度无关）"""
+    counts = np.concatenate([[0], np.cumsum(mask, dtype=np.int64)])
+    index = np.arange(len(mask))
+    upper = np.minimum(index + after + 1, len(mask))
+    lower = np.maximum(index - before, 0)
+    return counts[upper] - counts[lower] > 0
+
+
+def ducking_envelope(power_dbfs: np.ndarray, block_seconds: float, duck_db: float,
+                     threshold_dbfs: float = DUCK_THRESHOLD_DBFS,
+                     attack: float = 0.2, release: float = 0.6) -> np.ndarray:
+    """
+    根据旁白的分块响度计算背景音乐的逐块增益（线性）
+    离线处理可以前瞻：人声开始前 attack 秒音乐即开始压低，人声结束后保持 release 秒再恢复；
+    压低/恢复过程为长度 attack 的线性过渡（对二值掩码做滑动平均），全部为数组运算，无逐采样循环
+    """
+    if len(power_dbfs) == 0:
+        return np.ones(0, dtype=np.float32)
+    attack_blocks = max(1, int(round(attack / block_seconds)))
+    release_blocks = max(0, int(round(release / block_seconds)))
+    active = power_dbfs > threshold_dbfs
+    # 向前扩展 attack（提前压低）、向后扩展 release（保持后恢复）
+    ducked = _sliding_any(active, release_blocks, attack_blocks).astype(np.float64)
+    # 滑动平均把阶跃变为线性过渡，窗口居中，过渡落在扩展出的区间内
+    kernel = attack_blocks
+    counts = np.concatenate([[0.0], np.cumsum(ducked)])
+    index = np.arange(len(ducked))
+    upper = np.minimum(index + kernel // 2 + 1, len(ducked))
+    lower = np.maximum(index - (kernel - 1) // 2, 0)
+    amount = (counts[upper] - counts[lower]) / (upper - lower)
+    return (10 ** (duck_db * amount / 20)).astype(np.float32)
+
+
+class BackgroundMusic:
+    """
+    背景音乐混音
+    音乐只解码一次，按章节总时长循环铺满，响度归一到旁白目标响度 + volume_db，
+    旁白出现时按闪避包络压低 duck_db；首尾做淡入淡出。
+    包络按整章旁白计算一次（每块一个值），混音时按片段逐段进行，不需要整章浮点 PCM 常驻内存
+    """
+
+    def __init__(self, path: str, volume_db: float = -18.0, duck_db: float = -12.0,
+                 attack: float = 0.2, release: float = 0.6, fade: float = 2.0,
+                 threshold_dbfs: float = DUCK_THRESHOLD_DBFS):
+        self.path = path
+        self.volume_db = volume_db
+        self.duck_db = min(0.0, duck_db)
+        self.attack = attack
+        self.release = release
+        self.fade = max(0.0, fade or 0.0)
+        self.threshold_dbfs = threshold_dbfs
+        self._pcm: Optional[np.ndarray] = None
+        # 逐块增益与块长（采样数）
+        self._envelope: Optional[np.ndarray] = None
+        self._block_starts: Optional[np.ndarray] = None
+        self._block = 1
+        self._sample_rate = 44100
+        self._total_samples = 0
+
+    def load(self, sample_rate: int, channels: int, target_dbfs: float,
+             metrics: Optional[StageMetrics] = None) -> None:
+        pcm = decode_audio(self.path, sample_rate, channels, metrics)
+        self._pcm = pcm * normalization_gain(pcm, sample_rate, target_dbfs + self.volume_db)
+
+    def prepare(self, narration: Iterable[np.ndarray], sample_rate: int) -> None:
+        """根据整章旁白（按顺序的各片段 int16 PCM）计算闪避包络"""
+        self._sample_rate = sample_rate
+        self._block = max(1, int(sample_rate * DUCK_BLOCK_SECONDS))
+        # 片段长度一般不是块长的整数倍，按片段分块后拼接会累积错位，这里把各片段的块放到整章时间轴上
+        powers, starts = [], []
+        offset = 0
+        for pcm in narration:
+            power = block_power_dbfs(pcm, self._block)
+            powers.append(power)
+            starts.append(offset + np.arange(len(power)) * self._block)
+            offset += len(pcm)
+        self._total_samples = offset
+        if not powers:
+            return
+        self._block_starts = np.concatenate(starts)
+        self._envelope = ducking_envelope(np.concatenate(powers), self._block / sample_rate, self.duck_db,
+                                          self.threshold_dbfs, self.attack, self.release)
+
+    def mix(self, narration: np.ndarray, offset: int) -> np.ndarray:
+        """把从整章第 offset 个采样开始的一段旁白（int16）与背景音乐混合，返回 int16"""
+        count = len(narration)
+        if count == 0 or self._pcm is None or not len(self._pcm) or self._envelope is None:
+            return narration
+        positions = np.arange(offset, offset + count)
+        music = self._pcm[positions % len(self._pcm)]
+        # 块中心处的增益插值到逐采样
+        centers = self._block_starts + self._block / 2
+        gain = np.interp(positions, centers, self._envelope).astype(np.float32)
+        if self.fade:
+            fade_samples = self.fade * self._sample_rate
+            gain *= np.clip(np.minimum(positions + 1, self._total_samples - positions) / fade_samples, 0.0, 1.0)
+        mixed = narration.astype(np.float32) * (1.0 / 32768) + music * gain[:, np.newaxis]
+        return (np.clip(mixed, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class ChapterSoundtrack:
+    """
+    章节音轨
+    所有片段的音频只解码一次（并行），按片段做响度归一化、追加片段间静音，
+    拼成一条 PCM 后只做一次 AAC 编码，最后与视频流混流；
+    片段时长（音频时长 + 静音）同时作为视频片段的时长。
+    给出背景音乐时在编码前按整章混入（带闪避），不影响片段视频的渲染与缓存
+    """
+
+    def __init__(self, audio_paths: Dict[str, str], fps: float, gap: float = 0.0,
+                 normalize: bool = True, target_dbfs: float = -20.0,
+                 sample_rate: int = 44100, channels: int = 2, durations: Optional[Dict[str, float]] = None,
+                 music: Optional[BackgroundMusic] = None):
+        self.audio_paths = audio_paths
+        self.fps = fps
+        self.gap = max(0.0, gap or 0.0)
+        self.normalize = normalize
+        self.target_dbfs = target_dbfs
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # 片段 -> 已应用增益的 int16 PCM，按片段顺序保存
+        self._pcm: Dict[str, np.ndarray] = {}
+        # 片段时长（含片段后静音）；可由媒体索引预先给出，此时视频渲染无需等待解码
+        self.durations: Dict[str, float] = dict(durations or {})
+        self.music = music
+        # 解码与编码的耗时、CPU 与内存（audio 阶段）
+        self.metrics = StageMetrics()
+
+    def _decode_segment(self, subdir: str) -> np.ndarray:
+        with self.metrics.measure('audio'):
+            pcm = decode_audio(self.audio_paths[subdir], self.sample_rate, self.channels, self.metrics)
+            if self.normalize:
+                pcm = pcm * normalization_gain(pcm, self.sample_rate, self.target_dbfs)
+            return (np.clip(pcm, -1.0, 1.0) * 32767).astype(np.int16)
+
+    def decode(self, workers: Optional[int] = None) -> Dict[str, float]:
+        """并行解码全部片段音频，返回各片段时长（含片段后静音）"""
+        subdirs = list(self.audio_paths)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(subdirs)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            music_task = executor.submit(self._load_music) if self.music is not None else None
+            for subdir, pcm in zip(subdirs, executor.map(self._decode_segment, subdirs)):
+                self._pcm[subdir] = pcm
+                self.durations.setdefault(subdir, len(pcm) / self.sample_rate + self.gap)
+            if music_task is not None:
+                music_task.result()
+        return dict(self.durations)
+
+    def _load_music(self) -> None:
+        with self.metrics.measure('audio'):
+            self.music.load(self.sample_rate, self.channels, self.target_dbfs, self.metrics)
+
+    def frame_count(self, subdir: str) -> int:
+        """片段视频帧数，与视频渲染函数的计算方式一致"""
+        return int(self.durations[subdir] * self.fps)
+
+    def _segment_samples(self, subdir: str) -> np.ndarray:
+        """补静音或截断到片段视频时长"""
+        pcm = self._pcm[subdir]
+        samples = int(round(self.frame_count(subdir) / self.fps * self.sample_rate))
+        if len(pcm) >= samples:
+            return pcm[:samples]
+        padding = np.zeros((samples - len(pcm), self.channels), dtype=np.int16)
+        return np.concatenate([pcm, padding])
+
+    def encode(self, output_path: str, bitrate: str = '192k') -> str:
+        """把整条音轨一次编码为 AAC"""
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 's16le', '-ar', str(self.sample_rate), '-ac', str(self.channels), '-i', '-',
+            '-c:a', 'aac', '-b:a', bitrate, output_path,
+        ]
+        with self.metrics.measure('audio'), tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+            try:
+                if self.music is not None:
+                    self.music.prepare((self._segment_samples(subdir) for subdir in self.audio_paths),
+                                       self.sample_rate)
+                offset = 0
+                for subdir in self.audio_paths:
+                    samples = self._segment_samples(subdir)
+                    if self.music is not None:
+                        samples = self.music.mix(samples, offset)
+                    offset += len(samples)
+                    proc.stdin.write(samples.tobytes())
+                proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            self.metrics.add_process('audio', wait_process(proc))
+            if proc.returncode != 0:
+                stderr_file.seek(0)
+                raise RuntimeError(f"音轨编码失败: {stderr_file.read().decode('utf-8', errors='replace')}")
+        return output_path
+
+    def build(self, output_path: str, workers: Optional[int] = None) -> str:
+        """解码并编码整条音轨"""
+        self.decode(workers)
+        return self.encode(output_path)
+
+    def total_duration(self) -> float:
+        return sum(self.frame_count(subdir) for subdir in self.audio_paths) / self.fps
+
+    @classmethod
+    def for_chapter(cls, chapter_path: str, subdirs: List[str], settings: Dict) -> 'ChapterSoundtrack':
+        """
+        按视频设置创建章节音轨，settings 中已有 segment_durations 时沿用；
+        background_music 为相对路径时相对于章节目录
+        """
+        music = None
+        music_path = settings.get('background_music')
+        if music_path:
+            if not os.path.isabs(music_path):
+                music_path = os.path.join(chapter_path, music_path)
+            if os.path.exists(music_path):
+                music = BackgroundMusic(
+                    music_path,
+                    volume_db=settings.get('music_volume_db', -18.0),
+                    duck_db=settings.get('music_duck_db', -12.0),
+                    attack=settings.get('music_duck_attack', 0.2),
+                    release=settings.get('music_duck_release', 0.6),
+                    fade=settings.get('music_fade', 2.0),
+                )
+            else:
+                logger.warning("背景音乐文件不存在，跳过混音: %s", music_path)
+        return cls(
+            {subdir: os.path.join(chapter_path, subdir, "audio.mp3") for subdir in subdirs},
+            fps=settings['fps'],
+            gap=settings.get('segment_gap', 0.0),
+            normalize=settings.get('audio_normalize', True),
+            target_dbfs=settings.get('audio_target_dbfs', -20.0),
+            durations=settings.get('segment_durations'),
+            music=music,
+        )
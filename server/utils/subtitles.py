@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 片段文本与 TTS 逐词时间（由 AudioService 在生成音频时写入）
+SPAN_FILE = 'span.txt'
+WORD_TIMINGS_FILE = 'word_timings.json'
+
+# 单条字幕的最大字数（中文按字、英文按字母计）
+DEFAULT_MAX_CUE_CHARS = 18
+# 逐词时间中相邻词的停顿超过该值时另起一条字幕
+CUE_PAUSE_SECONDS = 0.35
+
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;…\n])')
+_CLAUSE_END = re.compile(r'(?<=[，,、：:])')
+
+
+def _visible_length(text: str) -> int:
+    return len(re.sub(r'\s', '', text))
+
+
+def split_text(text: str, max_chars: int = DEFAULT_MAX_CUE_CHARS) -> List[str]:
+    """按句子、分句切分文本，超长的部分再按字数硬切；返回的每段不超过 max_chars 个可见字符"""
+    pieces = []
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if _visible_length(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        current = ''
+        for clause in _CLAUSE_END.split(sentence):
+            if current and _visible_length(current + clause) > max_chars:
+                pieces.append(current.strip())
+                current = ''
+            current += clause
+            while _visible_length(current) > max_chars:
+                pieces.append(current[:max_chars].strip())
+                current = current[max_chars:]
+        if current.strip():
+            pieces.append(current.strip())
+    return pieces
+
+
+def _join_words(words: List[str]) -> str:
+    """拼接逐词文本：中文直接相连，英文/数字之间加空格"""
+    text = ''
+    for word in words:
+        if text and text[-1].isascii() and text[-1].isalnum() and word[:1].isascii() and word[:1].isalnum():
+            text += ' '
+        text += word
+    return text
+
+
+def load_word_timings(segment_path: str) -> Optional[List[Dict]]:
+    """读取片段的逐词时间 [{'text', 'start', 'end'}]（秒），不存在或无效时返回 None"""
+    path = os.path.join(segment_path, WORD_TIMINGS_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            words = json.load(f)
+        return [word for word in words if word.get('text')] or None
+    except (OSError, ValueError) as e:
+        logger.warning("逐词时间读取失败: %s. Error: %s", path, e)
+        return None
+
+
+def cues_from_words(words: List[Dict], max_chars: int = DEFAULT_MAX_CUE_CHARS) -> List[Tuple[float, float, str]]:
+    """按逐词时间分组：字数达到上限或出现明显停顿时另起一条"""
+    cues = []
+    group: List[Dict] = []
+
+    def flush():
+        if group:
+            cues.append((group[0]['start'], group[-1]['end'], _join_words([w['text'] for w in group])))
+            group.clear()
+
+    for word in words:
+        if group and (
+            _visible_length(_join_words([w['text'] for w in group] + [word['text']])) > max_chars
+            or word['start'] - group[-1]['end'] > CUE_PAUSE_SECONDS
+        ):
+            flush()
+        group.append(word)
+    flush()
+    return cues
+
+
+def cues_from_text(text: str, duration: float, max_chars: int = DEFAULT_MAX_CUE_CHARS) -> List[Tuple[float, float, str]]:
+    """没有逐词时间时，按字数比例把片段时长分配给各段文本"""
+    pieces = split_text(text, max_chars)
+    total = sum(_visible_length(piece) for piece in pieces)
+    if not total:
+        return []
+    cues = []
+    start = 0.0
+    for piece in pieces:
+        end = start + duration * _visible_length(piece) / total
+        cues.append((start, end, piece))
+        start = end
+    return cues
+
+
+def format_srt_time(seconds: float) -> str:
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def format_ass_time(seconds: float) -> str:
+    centis = int(round(max(0.0, seconds) * 100))
+    hours, centis = divmod(centis, 3600 * 100)
+    minutes, centis = divmod(centis, 60 * 100)
+    secs, centis = divmod(centis, 100)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+
+class SubtitleTrack:
+    """
+    章节字幕
+    每个片段的 span.txt 按片段在成片中的起始时间对齐（与章节音轨相同的帧对齐时长），
+    有 TTS 逐词时间时按词分组，否则按字数比例分配片段音频时长；
+    可输出 SRT（软字幕混流）和 ASS（烧录，带样式）
+    """
+
+    def __init__(self, cues: List[Tuple[float, float, str]]):
+        self.cues = cues
+
+    @classmethod
+    def for_chapter(cls, chapter_path: str, subdirs: List[str], settings: Dict,
+                    audio_durations: Dict[str, float]) -> 'SubtitleTrack':
+        """
+        settings 需包含 fps 与 segment_durations（含片段间静音）；
+        audio_durations 为各片段的音频时长，字幕不覆盖片段后的静音
+        """
+        fps = settings['fps']
+        max_chars = settings.get('subtitle_max_chars') or DEFAULT_MAX_CUE_CHARS
+        word_level = settings.get('subtitle_word_timing', True)
+        cues = []
+        offset = 0.0
+        for subdir in subdirs:
+            segment_path = os.path.join(chapter_path, subdir)
+            # 与视频/音轨一致：片段时长按帧数取整
+            segment_length = int(settings['segment_durations'][subdir] * fps) / fps
+            audio_length = min(audio_durations.get(subdir, segment_length), segment_length)
+            span_path = os.path.join(segment_path, SPAN_FILE)
+            if os.path.exists(span_path):
+                with open(span_path, 'r', encoding='utf-8') as f:
+                    text = f.read().strip()
+                words = load_word_timings(segment_path) if word_level else None
+                segment_cues = cues_from_words(words, max_chars) if words else cues_from_text(text, audio_length, max_chars)
+                for start, end, cue_text in segment_cues:
+                    start, end = min(start, audio_length), min(end, audio_length)
+                    if end > start and cue_text:
+                        cues.append((offset + start, offset + end, cue_text))
+            offset += segment_length
+        return cls(cues)
+
+    def to_srt(self) -> str:
+        blocks = []
+        for i, (start, end, text) in enumerate(self.cues, 1):
+            blocks.append(f"{i}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text}\n")
+        return '\n'.join(blocks)
+
+    def to_ass(self, resolution: Tuple[int, int], font: str = 'Microsoft YaHei', font_scale: float = 0.055) -> str:
+        """ASS 字幕：白字黑边、底部居中，字号与边距按画面高度缩放"""
+        width, height = resolution
+        font_size = max(12, int(height * font_scale))
+        margin_v = max(10, int(height * 0.06))
+        outline = max(1, round(font_size / 16, 1))
+        lines = [
+            '[Script Info]',
+            'ScriptType: v4.00+',
+            f'PlayResX: {width}',
+            f'PlayResY: {height}',
+            'WrapStyle: 0',
+            'ScaledBorderAndShadow: yes',
+            '',
+            '[V4+ Styles]',
+            'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, '
+            'Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, '
+            'Alignment, MarginL, MarginR, MarginV, Encoding',
+            f'Style: Default,{font},{font_size},&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,'
+            f'1,{outline},0,2,{margin_v},{margin_v},{margin_v},1',
+            '',
+            '[Events]',
+            'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text',
+        ]
+        for start, end, text in self.cues:
+            text = text.replace('\\', '\\\\').replace('{', '\\{').replace('}', '\\}').replace('\n', '\\N')
+            lines.append(f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{text}")
+        return '\n'.join(lines) + '\n'
+
+    def write_srt(self, path: str) -> str:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_srt())
+        return path
+
+    def write_ass(self, path: str, resolution: Tuple[int, int], font: str = 'Microsoft YaHei') -> str:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_ass(resolution, font))
+        return path
+
+
+def filter_path(path: str) -> str:
+    """转义为 ffmpeg 滤镜参数中的文件路径（Windows 盘符冒号、反斜杠与单引号）"""
+    path = os.path.abspath(path).replace('\\', '/')
+    return "'" + path.replace(':', '\\:').replace("'", "\\'") + "'"